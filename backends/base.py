@@ -1,4 +1,84 @@
 from abc import ABC, abstractmethod
+import threading
+
+
+class BackendConnectionError(ConnectionError):
+    """Raised by connect() when the server can't be reached"""
+
+
+class per_thread():
+    """attribute with its own value for every instance and thread. for the client/socket of the threaded backends
+    so the worker a dispatcher starts in place of a stuck one gets a fresh client instead of sharing the stuck one's.
+    new() makes the value the first time a thread reads it"""
+    def __init__(self, new: callable = lambda: None):
+        self.new = new
+
+    def __set_name__(self, owner, name: str) -> None:
+        self.name = name
+
+    def _local(self, obj) -> threading.local:
+        return obj.__dict__.setdefault("_per_thread", threading.local())  # NOTE setdefault is atomic
+
+    def __get__(self, obj, objtype=None):
+        if obj is None:
+            return self
+        local = self._local(obj)
+        if not hasattr(local, self.name):
+            setattr(local, self.name, self.new())
+        return getattr(local, self.name)
+
+    def __set__(self, obj, value) -> None:
+        setattr(self._local(obj), self.name, value)
+
+
+def blank_status() -> dict:
+    """status dict with nothing playing. what sync() returns before the server answers"""
+    return {'State': '',
+            'File': '',
+            'Title': '',
+            'Artist': '',
+            'SongTitle': '',
+            'Album': '',
+            'TotalTime': '0',
+            'TimeLeft': '0',
+            'TotalSec': '1',  # avoid ZeroDivisionError
+            'CurrentTime': '0',
+            'CurrentSec': '0',
+            'Bitrate': '0',
+            'AvgBitrate': '0',
+            'Rate': '0',
+            'Volume': '0',
+            'QueueVersion': '',  # changes whenever the queue does. backends that can't tell leave it empty
+            'QueueLength': '0',
+            'QueuePos': '-1',  # position of the current song in the queue
+            'Path': ''  # absolute path of File on this machine. empty if it isn't a local file or can't be worked out
+            }
+
+
+class queue_mirror():
+    """client side copy of the server's queue. backends with sync_queue() update it with just what changed
+    since the last version they saw, and only fetch tags for the rows that are on screen"""
+    def __init__(self):
+        self.version: str = None  # queue version the mirror matches
+        self.ids: list = []  # song id at every position. replaced, never changed in place, so drawing can read it any time
+        self.info: dict = {}  # song id: tags. only for songs that have been on screen
+
+    def apply(self, version: str, length: int, changes: list) -> None:
+        """changes are (position, id) pairs of every position that changed since the last version"""
+        ids = self.ids[:length] + [None] * (length - len(self.ids))
+        for pos, song_id in changes:
+            if pos < length:  # NOTE queue may have changed again since length was read. next version fixes it
+                ids[pos] = song_id
+        self.ids = ids
+        self.version = version
+        if len(self.info) > 2 * length + 1000:  # forget songs that left the queue
+            current = set(ids)
+            self.info = {k: v for k, v in self.info.items() if k in current}
+
+    def missing(self, start: int, end: int) -> list:
+        """positions between start and end that don't have tags yet"""
+        ids = self.ids
+        return [pos for pos in range(max(start, 0), min(end, len(ids))) if ids[pos] not in self.info]
 
 
 class backend_abc(ABC):
@@ -6,7 +86,7 @@ class backend_abc(ABC):
     @classmethod
     @abstractmethod
     def connect(cls) -> None:
-        """Connect to server"""
+        """Connect to server. raise BackendConnectionError if it can't be reached"""
 
     @classmethod
     @abstractmethod
@@ -38,6 +118,11 @@ class backend_abc(ABC):
     def enqueue(cls, song: str) -> None:
         """add song to queue"""
 
+    def enqueue_many(cls, songs: list) -> None:
+        """add several songs to the queue. backends override this if they can batch it"""
+        for song in songs:
+            cls.enqueue(song)
+
     @classmethod
     @abstractmethod
     def clear_queue(cls) -> None:
@@ -67,3 +152,90 @@ class backend_abc(ABC):
     @abstractmethod
     def sync(cls) -> dict:
         """sync status with the server"""
+
+    @classmethod
+    def supports(cls, cmd: str) -> bool:
+        """whether the backend has cmd, one of the optional commands like enqueue_folder, sync_queue or delete_range"""
+        return hasattr(cls, cmd)
+
+
+class async_backend_abc(ABC):
+    """asyncio version of backend_abc.
+    keeps one persistent connection open on the event loop instead of connecting for every command"""
+    settings: dict = {}
+    connected: bool = False
+
+    @classmethod
+    @abstractmethod
+    async def connect(cls) -> None:
+        """Connect to server. raise BackendConnectionError if it can't be reached"""
+
+    @classmethod
+    @abstractmethod
+    async def disconnect(cls) -> None:
+        """Disconnect from server"""
+
+    @classmethod
+    @abstractmethod
+    async def play_pause(cls) -> None:
+        """Toggle play pause"""
+
+    @classmethod
+    @abstractmethod
+    async def stop(cls) -> None:
+        """Stop song"""
+
+    @classmethod
+    @abstractmethod
+    async def next(cls) -> None:
+        """skip to next song in queue"""
+
+    @classmethod
+    @abstractmethod
+    async def prev(cls) -> None:
+        """skip to previous song in queue"""
+
+    @classmethod
+    @abstractmethod
+    async def enqueue(cls, song: str) -> None:
+        """add song to queue"""
+
+    async def enqueue_many(cls, songs: list) -> None:
+        """add several songs to the queue. backends override this if they can batch it"""
+        for song in songs:
+            await cls.enqueue(song)
+
+    @classmethod
+    @abstractmethod
+    async def clear_queue(cls) -> None:
+        """Clear queue"""
+
+    @classmethod
+    @abstractmethod
+    async def set_vol(cls, value: int) -> None:
+        """Set relative volume"""
+
+    @classmethod
+    @abstractmethod
+    async def get_vol(cls) -> int:
+        """Get volume"""
+
+    @classmethod
+    @abstractmethod
+    async def seek(cls, stime: int) -> None:
+        """seek song to time"""
+
+    @classmethod
+    @abstractmethod
+    async def start_queue(cls) -> None:
+        """Start playing the first song in the queue"""
+
+    @classmethod
+    @abstractmethod
+    async def sync(cls) -> dict:
+        """sync status with the server"""
+
+    @classmethod
+    def supports(cls, cmd: str) -> bool:
+        """see backend_abc.supports"""
+        return hasattr(cls, cmd)
@@ -0,0 +1,253 @@
+# thin client backend for talking to a "synthia --daemon" instead of the server itself
+# the daemon keeps the only connection to the server(s) and pushes status changes to every attached synthia
+# protocol: one json object per line over a unix socket
+#   daemon -> client: {"hello": {"zones": [names], "status": [status dicts], "commands": [[commands each zone's backend has]]}}
+#   once, then {"zone": i, "delta": {changed keys}}
+#   client -> daemon: {"id": n, "zone": i, "cmd": "set_vol", "args": [5]}
+#   daemon -> client: {"id": n, "result": ...} or {"id": n, "error": "..."}
+#   status deltas a command causes are pushed before its result so sync() is up to date once a command returns
+from concurrent.futures import Future
+import itertools
+import json
+import socket
+import sys
+import threading
+
+from .base import backend_abc, blank_status, BackendConnectionError, queue_mirror
+
+sys.path.append("..")
+from utils import WARNING, log, tryit
+
+
+# backend methods a client may call on the daemon
+commands: list = ["play_pause", "stop", "next", "prev", "enqueue", "enqueue_many", "enqueue_folder", "clear_queue",
+                  "set_vol", "get_vol", "seek", "start_queue", "update", "sync_queue", "play_at", "delete_range"]
+command_timeout: float = 60  # how long the daemon lets a command run on the server
+
+
+def encode(msg: dict) -> bytes:
+    return json.dumps(msg, separators=(",", ":")).encode() + b"\n"
+
+
+class daemon_connection():
+    """the one socket to the daemon. shared by every zone's daemon_backend.
+    a reader thread applies the pushed deltas to status so sync() never has to ask"""
+    def __init__(self, path: str, timeout: float = 5):
+        self.path = path
+        self.timeout = timeout
+        self.zone_names: list = []
+        self.status: list = []  # one status dict per zone
+        self.commands: list = []  # commands each zone's backend on the daemon has. see daemon_backend.supports
+        self.pending: dict = {}  # id: Future
+        self.ids = itertools.count()
+        self.send_lock = threading.Lock()
+        self.open_lock = threading.Lock()  # every zone's dispatcher thread may try to reconnect at once
+        self.on_change = None  # called from the reader thread when a status changes
+        self.sock = None
+        self.closed = True
+
+    def open(self) -> None:
+        """connect and read the hello. raises BackendConnectionError if no daemon is listening"""
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.path)
+            reader = sock.makefile("rb")
+            hello = json.loads(reader.readline())["hello"]
+        except (OSError, ValueError, KeyError) as e:
+            sock.close()
+            raise BackendConnectionError(f"{e}. Is synthia --daemon running?") from e
+        sock.settimeout(None)
+        self.sock = sock
+        self.zone_names = hello["zones"]
+        self.status = hello["status"]
+        self.commands = hello["commands"]
+        self.closed = False
+        threading.Thread(target=self._read, args=(reader,), name="synthia-daemon-reader", daemon=True).start()
+
+    def ensure_open(self) -> None:
+        with self.open_lock:
+            if self.closed:
+                self.open()
+
+    def _read(self, reader) -> None:
+        try:
+            for line in reader:
+                msg = json.loads(line)
+                if "delta" in msg:
+                    self.status[msg["zone"]].update(msg["delta"])
+                    if self.on_change:
+                        self.on_change()
+                elif msg.get("id") in self.pending:
+                    future = self.pending.pop(msg["id"])
+                    if "error" in msg:
+                        future.set_exception(RuntimeError(msg["error"]))
+                    else:
+                        future.set_result(msg.get("result"))
+        except (OSError, ValueError) as e:
+            log(f"daemon connection error: {e}", WARNING)
+        self.close()
+
+    def close(self) -> None:
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            self.sock.close()
+        except OSError:
+            pass
+        self.status = [blank_status() for _ in self.status]
+        for future in list(self.pending.values()):
+            future.set_exception(BackendConnectionError("daemon went away"))
+        self.pending = {}
+        if self.on_change:
+            self.on_change()
+
+    def call(self, zone: int, cmd: str, *args):
+        """run a backend command on the daemon and wait for its result. as long as the daemon waits on the server
+        plus the trip there and back"""
+        self.ensure_open()
+        future: Future = Future()
+        n = next(self.ids)
+        self.pending[n] = future
+        try:
+            with self.send_lock:
+                self.sock.sendall(encode({"id": n, "zone": zone, "cmd": cmd, "args": list(args)}))
+        except OSError as e:
+            self.pending.pop(n, None)
+            self.close()
+            raise BackendConnectionError(f"{e}. Is synthia --daemon running?") from e
+        try:
+            return future.result(command_timeout + self.timeout)
+        except TimeoutError:
+            self.pending.pop(n, None)
+            raise
+
+
+def attach(path: str):
+    """daemon_connection if a daemon is listening on path, None if not"""
+    conn = daemon_connection(path)
+    try:
+        conn.open()
+    except BackendConnectionError:
+        return None
+    return conn
+
+
+class daemon_backend(backend_abc):
+    """one zone of a daemon. everything is sent to the daemon except sync(), which answers from the pushed status"""
+    settings: dict = {}
+
+    def __init__(self, conn: daemon_connection, zone: int):
+        self.conn = conn
+        self.zone = zone
+
+    def connect(cls) -> None:
+        """reconnect if the daemon was restarted"""
+        cls.conn.ensure_open()
+
+    def disconnect(cls) -> None:
+        pass  # NOTE the connection is shared by every zone and stays open
+
+    @tryit
+    def play_pause(cls) -> None:
+        cls.conn.call(cls.zone, "play_pause")
+
+    @tryit
+    def stop(cls) -> None:
+        cls.conn.call(cls.zone, "stop")
+
+    @tryit
+    def next(cls) -> None:
+        cls.conn.call(cls.zone, "next")
+
+    @tryit
+    def prev(cls) -> None:
+        cls.conn.call(cls.zone, "prev")
+
+    @tryit
+    def enqueue(cls, song: str) -> None:
+        cls.conn.call(cls.zone, "enqueue", song)
+
+    @tryit
+    def enqueue_many(cls, songs: list) -> None:
+        cls.conn.call(cls.zone, "enqueue_many", songs)
+
+    @tryit
+    def enqueue_folder(cls, folder: str) -> bool:
+        return cls.conn.call(cls.zone, "enqueue_folder", folder)
+
+    @tryit
+    def clear_queue(cls) -> None:
+        cls.conn.call(cls.zone, "clear_queue")
+
+    @tryit
+    def set_vol(cls, value: int) -> None:
+        cls.conn.call(cls.zone, "set_vol", value)
+
+    @tryit
+    def get_vol(cls) -> int:
+        return cls.conn.call(cls.zone, "get_vol")
+
+    @tryit
+    def seek(cls, stime: int) -> None:
+        cls.conn.call(cls.zone, "seek", stime)
+
+    @tryit
+    def start_queue(cls) -> None:
+        cls.conn.call(cls.zone, "start_queue")
+
+    @tryit
+    def update(cls) -> None:
+        cls.conn.call(cls.zone, "update")
+
+    @tryit
+    def sync_queue(cls, mirror: queue_mirror, version: str, start: int, end: int) -> bool:
+        """same as mpd_backend.sync_queue. a mirror can't go over json so the daemon keeps a copy of it
+        for this connection and sends back what changed (see queue_delta())"""
+        if version == mirror.version and not mirror.missing(start, end):
+            return False
+        try:
+            delta = cls.conn.call(cls.zone, "sync_queue", mirror.version, version, start, end)
+        except TimeoutError:
+            mirror.version = None  # NOTE the daemon's copy may have moved on. the next call gets all of it
+            raise
+        if not delta:
+            return False
+        mirror.apply(delta["version"], delta["length"], delta["changes"])
+        for song in delta["rows"]:
+            mirror.info[song["id"]] = song
+        return True
+
+    @tryit
+    def delete_range(cls, start: int, end: int) -> None:
+        cls.conn.call(cls.zone, "delete_range", start, end)
+
+    @tryit
+    def play_at(cls, pos: int) -> None:
+        cls.conn.call(cls.zone, "play_at", pos)
+
+    def supports(cls, cmd: str) -> bool:
+        """the methods here are always there but the backend behind the daemon (mocp, xmms2) may not have them.
+        the daemon says which ones it does in the hello"""
+        return cmd in cls.conn.commands[cls.zone]
+
+    def sync(cls) -> dict:
+        """latest status the daemon pushed. no round trip"""
+        cls.connect()
+        return dict(cls.conn.status[cls.zone])
+
+
+async def queue_delta(sync_queue, mirror: queue_mirror, known: str, version: str, start: int, end: int):
+    """daemon side of daemon_backend.sync_queue. mirror is the daemon's copy of the client's, brought up to date
+    with the backend's sync_queue. returns what changed for the client to apply to its own, None if nothing did.
+    known is the version the client's copy is at. if it isn't the one here (reconnected, a reply went missing)
+    it starts over and every position is sent"""
+    if known != mirror.version:
+        mirror.version, mirror.ids, mirror.info = None, [], {}
+    ids, rows = mirror.ids, set(mirror.info)
+    if not await sync_queue(mirror, version, start, end):
+        return None
+    changes = [[pos, song_id] for pos, song_id in enumerate(mirror.ids) if pos >= len(ids) or ids[pos] != song_id]
+    return {"version": mirror.version, "length": len(mirror.ids), "changes": changes,
+            "rows": [song for song_id, song in mirror.info.items() if song_id not in rows]}
@@ -0,0 +1,114 @@
+# runs backend commands on a worker thread so a slow or dead server can't freeze the UI
+from concurrent.futures import Future
+import queue
+import sys
+import threading
+import time
+
+sys.path.append("..")
+from utils import WARNING, log
+
+
+class Dispatcher():
+    """single worker thread fed by a bounded queue. submit() returns a Future right away.
+    a command's timeout starts when the worker picks it up and covers its retries. connection errors are
+    retried with exponential backoff. state is "connecting" while the server can't be reached.
+    a command still running when its timeout is up is given up on: its future gets a TimeoutError
+    and a new worker takes over the queue so one stuck call can't hold up everything behind it.
+    NOTE the backends keep their client per thread (see per_thread) so the new worker doesn't share the stuck one's"""
+    def __init__(self, maxsize: int = 64, timeout: float = 5, retries: int = 3, backoff: float = 0.5,
+                 check_every: float = 0.25):
+        self.jobs: queue.Queue = queue.Queue(maxsize)
+        self.timeout = timeout  # default seconds a command is allowed to take including retries. not counting queue wait
+        self.retries = retries
+        self.backoff = backoff  # first retry delay. doubles every retry
+        self.check_every = check_every  # how often the watchdog looks for a stuck command
+        self.state: str = "ok"  # "ok" or "connecting"
+        self.thread = threading.Thread(target=self._run, name="synthia-dispatcher", daemon=True)
+        self.watchdog = threading.Thread(target=self._watch, name="synthia-dispatcher-watchdog", daemon=True)
+        self.running = None  # (future, deadline) of the command the worker is in the middle of
+        self.lock = threading.Lock()  # between the worker finishing a command and the watchdog giving up on it
+        self.stopped = threading.Event()
+
+    def start(self) -> None:
+        self.thread.start()
+        self.watchdog.start()
+
+    def stop(self) -> None:
+        self.stopped.set()
+        try:
+            self.jobs.put_nowait(None)  # wake up the worker
+        except queue.Full:
+            pass
+
+    def submit(self, func: callable, *args, timeout: float = None, retries: int = None, **kwargs) -> Future:
+        """queue func(*args, **kwargs) to be run on the worker thread. never blocks"""
+        future: Future = Future()
+        try:
+            self.jobs.put_nowait((future, self.timeout if timeout is None else timeout,
+                                  self.retries if retries is None else retries, func, args, kwargs))
+        except queue.Full:
+            log(f"dispatcher queue full. dropping {func}", WARNING)
+            future.set_exception(queue.Full())
+        return future
+
+    def _run(self) -> None:
+        me = threading.current_thread()
+        while not self.stopped.is_set() and self.thread is me:
+            job = self.jobs.get()
+            if job is None:
+                break
+            future, timeout, retries, func, args, kwargs = job
+            if not future.set_running_or_notify_cancel():
+                continue
+            deadline = time.monotonic() + timeout
+            self.running = (future, deadline)
+            delay = self.backoff
+            for attempt in range(retries + 1):
+                if self.thread is not me:  # given up on while waiting to retry
+                    break
+                if time.monotonic() > deadline:
+                    self._finish(me, future, exception=TimeoutError(f"{func} timed out"))
+                    break
+                try:
+                    result = func(*args, **kwargs)
+                except ConnectionError as e:  # NOTE backends raise this when the server can't be reached
+                    if self.thread is me:
+                        self.state = "connecting"
+                    if attempt == retries or self.stopped.wait(min(delay, max(deadline - time.monotonic(), 0))):
+                        self._finish(me, future, exception=e)
+                        break
+                    delay *= 2
+                except Exception as e:
+                    self._finish(me, future, exception=e, state="ok")
+                    break
+                else:
+                    self._finish(me, future, result=result, state="ok")
+                    break
+
+    def _finish(self, me: threading.Thread, future: Future, result=None, exception: Exception = None,
+                state: str = None) -> None:
+        """settle future unless the watchdog already gave up on it"""
+        with self.lock:
+            if self.thread is not me:  # NOTE replaced while stuck. a newer worker owns the state now
+                return
+            self.running = None
+            if state:
+                self.state = state
+            if exception is None:
+                future.set_result(result)
+            else:
+                future.set_exception(exception)
+
+    def _watch(self) -> None:
+        while not self.stopped.wait(self.check_every):
+            with self.lock:
+                if self.running is None or time.monotonic() <= self.running[1]:
+                    continue
+                future, _ = self.running
+                self.running = None
+                log("dispatcher command still running past its timeout. starting a new worker", WARNING)
+                future.set_exception(TimeoutError("command timed out"))
+                # NOTE the stuck call is left to finish or fail by itself on its own thread's client
+                self.thread = threading.Thread(target=self._run, name="synthia-dispatcher", daemon=True)
+                self.thread.start()
@@ -1,3 +1,4 @@
+import asyncio
 import os
 import socket
 import struct
@@ -5,10 +6,10 @@ import subprocess
 import sys
 import time
 
-from .base import backend_abc
+from .base import async_backend_abc, backend_abc, blank_status, BackendConnectionError, per_thread
 
 sys.path.append("..")
-from utils import log, tryit
+from utils import DEBUG, count, log, tryit, tryit_async
 
 
 home_dir = os.path.expanduser("~") + "/"
@@ -17,13 +18,19 @@ home_dir = os.path.expanduser("~") + "/"
 class mocp_backend(backend_abc):
     """https://github.com/jonsafari/mocp/blob/master/protocol.h"""
     settings: dict = {}
-    address: str = f"{home_dir}.moc/socket2"  # TODO config option
-    sock = None
+    address: str = f"{home_dir}.moc/socket2"  # or "address" in mocp_settings
+    sock = per_thread()  # one socket per instance (zone) and dispatcher worker
 
     @tryit
     def connect(cls):
+        count("socket_connects")
         cls.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
-        cls.sock.connect(cls.address)
+        cls.sock.settimeout(cls.settings.get("timeout", 5))  # don't hang forever on a stuck server. same as mpd
+        try:
+            cls.sock.connect(cls.settings.get("address", cls.address))
+        except OSError as e:
+            cls.sock.close()
+            raise BackendConnectionError(f"{e}. Is the moc server running?") from e
 
     @tryit
     def disconnect(cls):
@@ -48,14 +55,14 @@ class mocp_backend(backend_abc):
 
     @tryit
     def stop(cls):
-        log("stopping")
+        log("stopping", DEBUG)
         cls.connect()
         cls.sock.send(b'\x04\x00\x00\x00')  # stop song
         # wait for server state to finish updating
         # log(cls.sock.recv(64))
         while cls.sock.recv(1) != b'\x01':
             pass
-        log("post stop loop")
+        log("post stop loop", DEBUG)
         cls.sock.recv(3)
         cls.sock.send(b'\x3e\x00\x00\x00')  # clear queue
         cls.disconnect()
@@ -74,7 +81,7 @@ class mocp_backend(backend_abc):
 
     @tryit
     def enqueue(cls, song):
-        log("queueing")
+        log("queueing", DEBUG)
         time.sleep(0.01)  # NOTE to lazy to wait and ensure socket has been read from/cleared
         song = song.encode()
         cls.connect()
@@ -136,7 +143,7 @@ class mocp_backend(backend_abc):
 
     @tryit
     def start_queue(cls):
-        log("start queue")
+        log("start queue", DEBUG)
         cls.connect()
         cls.sock.send(b'\x06\x00\x00\x00')  # play
         cls.sock.send(b'\x00\x00\x00\x00')  # AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA
@@ -152,25 +159,150 @@ class mocp_backend(backend_abc):
         """sync with moc server via socket https://github.com/jonsafari/mocp/blob/master/protocol.h
         using subprocess mocp -i for now
         """
-        d = {'State': '',
-             'File': '',
-             'Title': '',
-             'Artist': '',
-             'SongTitle': '',
-             'Album': '',
-             'TotalTime': '0',
-             'TimeLeft': '0',
-             'TotalSec': '1',  # avoid ZeroDivisionError
-             'CurrentTime': '0',
-             'CurrentSec': '0',
-             'Bitrate': '0',
-             'AvgBitrate': '0',
-             'Rate': '0',
-             'Volume': '0'
-             }
+        d = blank_status()
         in_list = subprocess.run("mocp -i", shell=True, stderr=subprocess.PIPE, stdout=subprocess.PIPE).stdout.decode().splitlines()
         if in_list:  # NOTE list is empty if server not running
             for i in in_list:
                 d[i.split(": ")[0]] = i.split(": ")[1]
             d["Volume"] = cls.get_vol()
+            d["Path"] = d["File"]  # NOTE mocp gives the full path already
+        return d
+
+
+class mocp_async_backend(async_backend_abc):
+    """asyncio mocp backend. https://github.com/jonsafari/mocp/blob/master/protocol.h
+    NOTE the moc server pushes events at every connected client so a connection that stays open fills up
+    with stuff that has to be skipped. each command still gets its own short connection, it just doesn't block"""
+    settings: dict = {}
+    address: str = f"{home_dir}.moc/socket2"
+
+    async def open(cls) -> tuple:
+        count("socket_connects")
+        try:
+            return await asyncio.open_unix_connection(cls.settings.get("address", cls.address))
+        except OSError as e:
+            raise BackendConnectionError(f"{e}. Is the moc server running?") from e
+
+    async def close(cls, writer) -> None:
+        writer.close()
+        await writer.wait_closed()
+
+    async def send(cls, *data: bytes) -> None:
+        """open a connection, send data and close it again"""
+        reader, writer = await cls.open()
+        writer.write(b"".join(data))
+        await writer.drain()
+        await cls.close(writer)
+
+    async def read_data(cls, reader) -> bytes:
+        """skip events until the server's data reply (EV_DATA) and return the 4 bytes after it"""
+        while await reader.readexactly(1) != b'\x06':
+            pass
+        await reader.readexactly(3)
+        return await reader.readexactly(4)
+
+    @tryit_async
+    async def connect(cls) -> None:
+        """check the server is there. commands open their own connections"""
+        reader, writer = await cls.open()
+        await cls.close(writer)
+        cls.connected = True
+
+    @tryit_async
+    async def disconnect(cls) -> None:
+        cls.connected = False
+
+    @tryit_async
+    async def play_pause(cls) -> None:
+        reader, writer = await cls.open()
+        writer.write(b'\x13\x00\x00\x00')
+        ret = await cls.read_data(reader)
+        if ret == b'\x01\x00\x00\x00':  # playing state
+            writer.write(b'\x05\x00\x00\x00')  # pause song
+        elif ret == b'\x03\x00\x00\x00':  # paused state
+            writer.write(b'\x06\x00\x00\x00')  # play song
+        await writer.drain()
+        await cls.close(writer)
+
+    @tryit_async
+    async def stop(cls) -> None:
+        reader, writer = await cls.open()
+        writer.write(b'\x04\x00\x00\x00')  # stop song
+        await writer.drain()
+        # wait for server state to finish updating
+        while await reader.readexactly(1) != b'\x01':
+            pass
+        await reader.readexactly(3)
+        writer.write(b'\x3e\x00\x00\x00')  # clear queue
+        await writer.drain()
+        await cls.close(writer)
+
+    @tryit_async
+    async def next(cls) -> None:
+        await cls.send(b'\x10\x00\x00\x00')  # next song
+
+    @tryit_async
+    async def prev(cls) -> None:  # BUG doesn't work with queue
+        await cls.send(b'\x20\x00\x00\x00')  # prev song
+
+    @tryit_async
+    async def enqueue(cls, song: str) -> None:
+        await cls.enqueue_many([song])
+
+    @tryit_async
+    async def enqueue_many(cls, songs: list) -> None:
+        """queue songs over one connection instead of one connection each.
+        all the adds go out in one write followed by a disconnect command, and the server closing
+        the connection means it got through all of them. no picking through the replies"""
+        reader, writer = await cls.open()
+        data = b""
+        for song in songs:
+            song = song.encode()
+            data += b'\x3b\x00\x00\x00' + struct.pack('I', len(song)) + song  # send to queue
+        writer.write(data + b'\x15\x00\x00\x00')  # disconnect
+        await writer.drain()
+        while await reader.read(4096):  # throw away the queue events until the server hangs up
+            pass
+        await cls.close(writer)
+
+    @tryit_async
+    async def clear_queue(cls) -> None:
+        await cls.send(b'\x3e\x00\x00\x00')  # clear queue
+
+    @tryit_async
+    async def set_vol(cls, val: int) -> None:
+        """Set relative volume"""
+        vol = min(max(await cls.get_vol() + val, 0), 100)
+        await cls.send(b'\x1b\x00\x00\x00', struct.pack('I', vol))  # set volume
+
+    @tryit_async
+    async def get_vol(cls) -> int:
+        """Get volume"""
+        reader, writer = await cls.open()
+        writer.write(b'\x1a\x00\x00\x00')
+        vol = struct.unpack("I", await cls.read_data(reader))[0]
+        await cls.close(writer)
+        return vol
+
+    @tryit_async
+    async def seek(cls, stime: int) -> None:
+        await cls.send(b'\x12\x00\x00\x00', struct.pack('i', stime))  # seek
+
+    @tryit_async
+    async def start_queue(cls) -> None:
+        # NOTE same 12 bytes as the sync version. see the BUG there
+        await cls.send(b'\x06\x00\x00\x00', b'\x00\x00\x00\x00', b'\x00\x00\x00\x00')
+
+    @tryit_async
+    async def sync(cls) -> dict:
+        """sync status with the server. using mocp -i for now like the sync version"""
+        d = blank_status()
+        proc = await asyncio.create_subprocess_exec("mocp", "-i", stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+        out, _ = await proc.communicate()
+        in_list = out.decode().splitlines()
+        if in_list:  # NOTE list is empty if server not running
+            for i in in_list:
+                d[i.split(": ")[0]] = i.split(": ")[1]
+            d["Volume"] = await cls.get_vol()
+            d["Path"] = d["File"]
         return d
@@ -1,28 +1,61 @@
 # mpd backend
 # https://python-mpd2.readthedocs.io/en/latest/
 # https://github.com/Mic92/python-mpd2/blob/main/mpd/base.py
+import asyncio
 import os
 import sys
 
 import mpd
+import mpd.asyncio
 
-from .base import backend_abc
+from .base import async_backend_abc, backend_abc, blank_status, BackendConnectionError, per_thread, queue_mirror
 
 sys.path.append("..")
-from utils import log, tryit
+from utils import ERROR, WARNING, count, log, tryit, tryit_async
 
 
 home_dir = os.path.expanduser("~") + "/"
 
 
+def status_to_dict(status: dict, cur_song: dict) -> dict:
+    """turn mpd's status and currentsong replies into synthia's status dict"""
+    d = blank_status()
+    try:
+        d['State'] = status["state"].upper()
+        d['QueueVersion'] = status.get("playlist", "")
+        d['QueueLength'] = status.get("playlistlength", "0")
+        d['QueuePos'] = status.get("song", "-1")
+        if d["State"] != "STOP":
+            d['File'] = cur_song["file"]
+            d['Title'] = cur_song["title"] if "title" in cur_song else ""
+            d['Artist'] = cur_song["artist"] if "artist" in cur_song else ""
+            d['SongTitle'] = cur_song["title"] if "title" in cur_song else ""
+            d['Album'] = cur_song["album"] if "album" in cur_song else ""
+            d['TotalTime'] = f"{int((int(cur_song["time"]) / 60) % 60):02d}:{int(int(cur_song["time"]) % 60):02d}"
+            d['TimeLeft'] = f"{int(((int(cur_song["time"]) - int(float(status["elapsed"]))) / 60) % 60):02d}:{int((int(cur_song["time"]) - int(float(status["elapsed"]))) % 60):02d}"
+            d['TotalSec'] = cur_song["time"]
+            d['CurrentTime'] = f"{int((float(status["elapsed"]) / (60)) % 60):02d}:{int(float(status["elapsed"]) % 60):02d}"
+            d['CurrentSec'] = str(int(float(status["elapsed"])))
+            d['Bitrate'] = status["bitrate"]
+            d['AvgBitrate'] = '0'
+            d['Rate'] = status["audio"] if "audio" in status else "0"
+            d['Volume'] = status["volume"]
+    except Exception as e:
+        log(f"mpd sync error: {e}", ERROR)
+    # log(d)
+    return d
+
+
 class mpd_backend(backend_abc):
     """mpd backend."""
     settings: dict = {
         "address": "localhost",
         "port": 6600
     }
-    server = mpd.MPDClient()
+    server = per_thread(mpd.MPDClient)  # one client per instance (zone) and dispatcher worker. MPDClient isn't thread safe
     # server.timeout = 10  # etc
+    music_directory: str = None  # from settings or asked for with the "config" command. "" if unknown
+    batch_size: int = 500  # adds per command list. mpd limits the size of a command list
 
     @tryit
     def connect(cls) -> None:
@@ -30,11 +63,19 @@ class mpd_backend(backend_abc):
         TODO handle tcp vs unix socket
         check if server is running
         """
+        count("socket_connects")
+        cls.server.timeout = cls.settings.get("timeout", 5)  # don't hang forever on a stuck server
         try:
             cls.server.connect(cls.settings["address"], port=cls.settings["port"])
-        except ConnectionRefusedError as e:
-            print(f"{e}\nIs the mpd server running?")
-            sys.exit(1)
+        except mpd.ConnectionError as e:
+            if str(e) != "Already connected":
+                raise BackendConnectionError(f"{e}. Is the mpd server running?") from e
+            # left over from a command that failed half way. start over with a fresh connection
+            cls.server.disconnect()
+            cls.connect()
+        except OSError as e:
+            cls.server.disconnect()  # reset client state so the next attempt starts clean
+            raise BackendConnectionError(f"{e}. Is the mpd server running?") from e
 
     @tryit
     def disconnect(cls) -> None:
@@ -79,6 +120,80 @@ class mpd_backend(backend_abc):
         cls.server.add("file://" + song)
         cls.disconnect()
 
+    def uri(cls, song: str) -> str:
+        """database relative uri if the song is under mpd's music directory, absolute file:// uri if not"""
+        if cls.music_directory and song.startswith(cls.music_directory):
+            return song[len(cls.music_directory):]
+        return "file://" + song
+
+    def local_path(cls, file: str) -> str:
+        """absolute path of a file from mpd's status. the opposite of uri(). empty if it's not a local file"""
+        if file.startswith("file://"):
+            return file[len("file://"):]
+        if cls.music_directory and file and "://" not in file:
+            return cls.music_directory + file
+        return ""
+
+    def find_music_directory(cls) -> None:
+        """NOTE needs a connection. the config command only works over the local unix socket"""
+        if cls.music_directory is None:
+            cls.music_directory = cls.settings.get("music_directory", "")
+            if not cls.music_directory:
+                try:
+                    cls.music_directory = cls.server.config()
+                except mpd.CommandError:
+                    cls.music_directory = ""
+            if cls.music_directory and cls.music_directory[-1] != "/":
+                cls.music_directory += "/"
+
+    def add_batched(cls, uris: list) -> None:
+        for i in range(0, len(uris), cls.batch_size):
+            cls.server.command_list_ok_begin()
+            for u in uris[i:i + cls.batch_size]:
+                cls.server.add(u)
+            cls.server.command_list_end()
+
+    @tryit
+    def enqueue_many(cls, songs: list) -> None:
+        """add songs to queue in command lists over one connection.
+        songs in the database are added by their relative uri, everything else with file://"""
+        cls.connect()
+        cls.find_music_directory()
+        uris = [cls.uri(s) for s in songs]
+        start = int(cls.server.status()["playlistlength"])
+        skipped = 0
+        i = 0
+        while i < len(uris):
+            try:
+                cls.add_batched(uris[i:])
+                break
+            except mpd.CommandError as e:  # everything before the song that failed got added
+                i = int(cls.server.status()["playlistlength"]) - start + skipped
+                if uris[i].startswith("file://"):
+                    log(f"mpd can't add {songs[i]}: {e}", WARNING)
+                    skipped += 1
+                    i += 1
+                else:  # not in the database (yet?)
+                    uris[i] = "file://" + songs[i]
+        cls.disconnect()
+
+    @tryit
+    def enqueue_folder(cls, folder: str) -> bool:
+        """add a whole folder and all its subfolders with one server side command. in mpd's name order.
+        returns False if the folder isn't in the database so the caller can add the files itself"""
+        cls.connect()
+        cls.find_music_directory()
+        uri = cls.uri(folder.rstrip("/"))
+        queued = False
+        if not uri.startswith("file://"):
+            try:
+                cls.server.add(uri)
+                queued = True
+            except mpd.CommandError as e:
+                log(f"mpd can't add folder {uri}: {e}", WARNING)
+        cls.disconnect()
+        return queued
+
     @tryit
     def clear_queue(cls) -> None:
         """Clear queue"""
@@ -116,52 +231,50 @@ class mpd_backend(backend_abc):
     @tryit
     def sync(cls) -> dict:
         """sync status with the server"""
-        d = {'State': '',
-             'File': '',
-             'Title': '',
-             'Artist': '',
-             'SongTitle': '',
-             'Album': '',
-             'TotalTime': '0',
-             'TimeLeft': '0',
-             'TotalSec': '1',  # avoid ZeroDivisionError
-             'CurrentTime': '0',
-             'CurrentSec': '0',
-             'Bitrate': '0',
-             'AvgBitrate': '0',
-             'Rate': '0',
-             'Volume': '0'
-             }
         cls.connect()
+        cls.find_music_directory()  # NOTE only asks the server the first time
         status = cls.server.status()
         cur_song = cls.server.currentsong()
         # log("mpd info")
         # log(status)
         # log(cur_song)
         cls.disconnect()
-        try:
-            d['State'] = status["state"].upper()
-            if d["State"] != "STOP":
-                d['File'] = cur_song["file"]
-                d['Title'] = cur_song["title"] if "title" in cur_song else ""
-                d['Artist'] = cur_song["artist"] if "artist" in cur_song else ""
-                d['SongTitle'] = cur_song["title"] if "title" in cur_song else ""
-                d['Album'] = cur_song["album"] if "album" in cur_song else ""
-                d['TotalTime'] = f"{int((int(cur_song["time"]) / 60) % 60):02d}:{int(int(cur_song["time"]) % 60):02d}"
-                d['TimeLeft'] = f"{int(((int(cur_song["time"]) - int(float(status["elapsed"]))) / 60) % 60):02d}:{int((int(cur_song["time"]) - int(float(status["elapsed"]))) % 60):02d}"
-                d['TotalSec'] = cur_song["time"]
-                d['CurrentTime'] = f"{int((float(status["elapsed"]) / (60)) % 60):02d}:{int(float(status["elapsed"]) % 60):02d}"
-                d['CurrentSec'] = str(int(float(status["elapsed"])))
-                d['Bitrate'] = status["bitrate"]
-                d['AvgBitrate'] = '0'
-                d['Rate'] = status["audio"] if "audio" in status else "0"
-                d['Volume'] = status["volume"]
-        except Exception as e:
-            log("mpd sync error")
-            log(e)
-        # log(d)
+        d = status_to_dict(status, cur_song)
+        d['Path'] = cls.local_path(d['File'])
         return d
 
+    @tryit
+    def sync_queue(cls, mirror: queue_mirror, version: str, start: int, end: int) -> bool:
+        """bring mirror up to the queue version sync() saw and get tags for positions start to end.
+        sends nothing if the version hasn't changed and those rows are already known. returns whether anything changed"""
+        if version == mirror.version and not mirror.missing(start, end):
+            return False
+        cls.connect()
+        if version != mirror.version:
+            status = cls.server.status()  # NOTE read again. version and length have to go together
+            changes = cls.server.plchangesposid(int(mirror.version or 0))
+            mirror.apply(status["playlist"], int(status["playlistlength"]), [(int(c["cpos"]), c["id"]) for c in changes])
+        missing = mirror.missing(start, end)
+        if missing:
+            for song in cls.server.playlistinfo(f"{missing[0]}:{missing[-1] + 1}"):
+                mirror.info[song["id"]] = song
+        cls.disconnect()
+        return True
+
+    @tryit
+    def delete_range(cls, start: int, end: int) -> None:
+        """remove the songs at positions start to end (not included) from the queue"""
+        cls.connect()
+        cls.server.delete((start, end))
+        cls.disconnect()
+
+    @tryit
+    def play_at(cls, pos: int) -> None:
+        """play the song at pos in the queue"""
+        cls.connect()
+        cls.server.play(pos)
+        cls.disconnect()
+
     @tryit
     def update(cls) -> None:
         """Updates the music directory with new files
@@ -170,3 +283,193 @@ class mpd_backend(backend_abc):
         cls.connect()
         cls.server.update()
         cls.disconnect()
+
+
+class mpd_async_backend(async_backend_abc):
+    """asyncio mpd backend. one connection kept open on the event loop"""
+    settings: dict = {
+        "address": "localhost",
+        "port": 6600
+    }
+    server = mpd.asyncio.MPDClient()
+    music_directory: str = None  # same as mpd_backend
+    batch_size: int = 100  # adds in flight at once. the client refuses more than 128 queued commands
+    uri = mpd_backend.uri
+    local_path = mpd_backend.local_path
+
+    def __init__(self):
+        self.server = mpd.asyncio.MPDClient()
+
+    async def call(cls, command: str, *args):
+        """run an mpd command. a dropped connection is raised as BackendConnectionError so it can be retried"""
+        try:
+            return await getattr(cls.server, command)(*args)
+        except (OSError, mpd.ConnectionError) as e:
+            await cls.disconnect()
+            raise BackendConnectionError(f"{e}. Is the mpd server running?") from e
+
+    @tryit_async
+    async def connect(cls) -> None:
+        """Connect to server"""
+        count("socket_connects")
+        try:
+            await cls.server.connect(cls.settings["address"], port=cls.settings["port"])
+        except (OSError, mpd.ConnectionError) as e:
+            cls.server.disconnect()  # reset client state so the next attempt starts clean
+            raise BackendConnectionError(f"{e}. Is the mpd server running?") from e
+        cls.connected = True
+
+    @tryit_async
+    async def disconnect(cls) -> None:
+        """Disconnect from server"""
+        cls.connected = False
+        cls.server.disconnect()
+
+    @tryit_async
+    async def play_pause(cls) -> None:
+        """Toggle play pause"""
+        await cls.call("pause")
+
+    @tryit_async
+    async def stop(cls) -> None:
+        """Stop song and clear queue"""
+        await cls.call("stop")
+        await cls.call("clear")
+
+    @tryit_async
+    async def next(cls) -> None:
+        """skip to next song in queue"""
+        await cls.call("next")
+
+    @tryit_async
+    async def prev(cls) -> None:
+        """skip to previous song in queue"""
+        await cls.call("previous")
+
+    @tryit_async
+    async def enqueue(cls, song: str) -> None:
+        """add song to queue"""
+        await cls.call("add", "file://" + song)
+
+    async def find_music_directory(cls) -> None:
+        if cls.music_directory is None:
+            cls.music_directory = cls.settings.get("music_directory", "")
+            if not cls.music_directory:
+                try:
+                    cls.music_directory = await cls.call("config")
+                except mpd.CommandError:
+                    cls.music_directory = ""
+            if cls.music_directory and cls.music_directory[-1] != "/":
+                cls.music_directory += "/"
+
+    @tryit_async
+    async def enqueue_many(cls, songs: list) -> None:
+        """add songs to queue a batch at a time. songs in the database are added by their relative uri, everything else with file://
+        NOTE mpd.asyncio has no command lists but writes every command straight away so a batch is one round trip"""
+        await cls.find_music_directory()
+        added = int((await cls.call("status"))["playlistlength"])  # where the next song of ours goes
+        for i in range(0, len(songs), cls.batch_size):
+            batch = songs[i:i + cls.batch_size]
+            results = await asyncio.gather(*[cls.call("add", cls.uri(s)) for s in batch], return_exceptions=True)
+            for song, r in zip(batch, results):
+                if isinstance(r, ConnectionError):
+                    raise r
+                if not isinstance(r, mpd.CommandError):
+                    added += 1
+                elif cls.uri(song).startswith("file://"):
+                    log(f"mpd can't add {song}: {r}", WARNING)
+                else:  # not in the database (yet?). put it where it belongs
+                    try:
+                        await cls.call("addid", "file://" + song, added)
+                        added += 1
+                    except mpd.CommandError as e:
+                        log(f"mpd can't add {song}: {e}", WARNING)
+
+    @tryit_async
+    async def enqueue_folder(cls, folder: str) -> bool:
+        """add a whole folder and all its subfolders with one server side command. see mpd_backend.enqueue_folder"""
+        await cls.find_music_directory()
+        uri = cls.uri(folder.rstrip("/"))
+        if uri.startswith("file://"):
+            return False
+        try:
+            await cls.call("add", uri)
+        except mpd.CommandError as e:
+            log(f"mpd can't add folder {uri}: {e}", WARNING)
+            return False
+        return True
+
+    @tryit_async
+    async def clear_queue(cls) -> None:
+        """Clear queue"""
+        await cls.call("clear")
+
+    @tryit_async
+    async def set_vol(cls, value: int) -> None:
+        """Set relative volume"""
+        await cls.call("volume", value)
+
+    @tryit_async
+    async def get_vol(cls) -> None:
+        """Placeholder method since mpd gets its volume from the main sync method"""
+        pass
+
+    @tryit_async
+    async def seek(cls, stime: int) -> None:
+        """seek song to time"""
+        # NOTE force '+' in front of positive int for relative seek
+        await cls.call("seekcur", str(stime) if stime < 0 else f"+{stime}")
+
+    @tryit_async
+    async def start_queue(cls) -> None:
+        """Start playing the first song in the queue"""
+        await cls.call("play")
+
+    @tryit_async
+    async def sync(cls) -> dict:
+        """sync status with the server"""
+        await cls.find_music_directory()
+        status, cur_song = await asyncio.gather(cls.call("status"), cls.call("currentsong"))
+        d = status_to_dict(status, cur_song)
+        d['Path'] = cls.local_path(d['File'])
+        return d
+
+    @tryit_async
+    async def update(cls) -> None:
+        """Updates the music directory with new files"""
+        await cls.call("update")
+
+    @tryit_async
+    async def sync_queue(cls, mirror: queue_mirror, version: str, start: int, end: int) -> bool:
+        """same as mpd_backend.sync_queue"""
+        if version == mirror.version and not mirror.missing(start, end):
+            return False
+        if version != mirror.version:
+            status = await cls.call("status")
+            changes = await cls.call("plchangesposid", int(mirror.version or 0))
+            mirror.apply(status["playlist"], int(status["playlistlength"]), [(int(c["cpos"]), c["id"]) for c in changes])
+        missing = mirror.missing(start, end)
+        if missing:
+            for song in await cls.call("playlistinfo", f"{missing[0]}:{missing[-1] + 1}"):
+                mirror.info[song["id"]] = song
+        return True
+
+    @tryit_async
+    async def delete_range(cls, start: int, end: int) -> None:
+        """remove the songs at positions start to end (not included) from the queue"""
+        await cls.call("delete", (start, end))
+
+    @tryit_async
+    async def play_at(cls, pos: int) -> None:
+        """play the song at pos in the queue"""
+        await cls.call("play", pos)
+
+    async def changes(cls):
+        """yields the changed subsystems whenever something changes on the server (mpd's idle command)
+        so synthia --daemon only has to poll while a song is playing"""
+        try:
+            async for changed in cls.server.idle(["player", "mixer", "playlist", "options"]):
+                yield changed
+        except (OSError, mpd.ConnectionError) as e:
+            await cls.disconnect()
+            raise BackendConnectionError(f"{e}. Is the mpd server running?") from e
@@ -1,16 +1,18 @@
 # xmms2 backend
 # source code:  https://github.com/xmms2/xmms2-stable/blob/master/src/clients/lib/python/xmmsapi.pyx
 # tutorial: https://github.com/xmms2/xmms2-tutorial/tree/master/python
+import asyncio
 import getpass
 import os
 import sys
+import urllib.parse
 
 import xmmsclient
 
-from .base import backend_abc
+from .base import async_backend_abc, backend_abc, blank_status, BackendConnectionError, per_thread
 
 sys.path.append("..")
-from utils import log, tryit
+from utils import DEBUG, ERROR, count, log, tryit, tryit_async
 
 
 home_dir = os.path.expanduser("~") + "/"
@@ -18,17 +20,44 @@ home_dir = os.path.expanduser("~") + "/"
 status_dict: dict = {0: "STOP", 1: "PLAY", 2: "PAUSE"}
 
 
+def info_to_dict(status: int, p_time: int, info: dict, volume: int) -> dict:
+    """turn xmms2's playback status, playtime and medialib info into synthia's status dict"""
+    d = blank_status()
+    # TODO handle tags only existing on some songs
+    d['State'] = status_dict[status]
+    if d["State"] != "STOP":
+        d['File'] = info[('server', 'url')]
+        if d['File'].startswith("file://"):  # NOTE xmms2 urls are escaped like form data
+            d['Path'] = urllib.parse.unquote_plus(d['File'][len("file://"):])
+        d['Title'] = info[('plugin/id3v2', 'title')] if ('plugin/id3v2', 'title') in info else ""
+        d['Artist'] = info[('plugin/id3v2', 'artist')] if ('plugin/id3v2', 'artist') in info else ""
+        d['SongTitle'] = info[('plugin/id3v2', 'title')] if ('plugin/id3v2', 'title') in info else ""
+        d['Album'] = info[('plugin/id3v2', 'album')] if ('plugin/id3v2', 'album') in info else ""
+        # BUG with :02d causing the status bar to overshoot the line and scroll the page
+        d['TotalTime'] = f"{int((info[('plugin/mad', 'duration')] / (1000 * 60)) % 60):02d}:{int((info[('plugin/mad', 'duration')] / 1000) % 60):02d}"
+        d['TimeLeft'] = f"{int(((info[('plugin/mad', 'duration')] - p_time) / (1000 * 60)) % 60):02d}:{int(((info[('plugin/mad', 'duration')] - p_time) / 1000) % 60):02d}"
+        d['TotalSec'] = str(int(info[('plugin/mad', 'duration')] / 1000))
+        d['CurrentTime'] = f"{int((p_time / (1000 * 60)) % 60):02d}:{int((p_time / 1000) % 60):02d}"
+        d['CurrentSec'] = str(int(p_time / 1000))
+        d['Bitrate'] = str(info[('plugin/mad', 'bitrate')])
+        d['AvgBitrate'] = '0'
+        d['Rate'] = str(info[('plugin/mad', 'samplerate')])
+        d['Volume'] = str(volume)  # BUG when changing song causes invalid result?
+    # log(d)
+    return d
+
+
 class xmms2_backend(backend_abc):
     """xmms2 backend"""
     settings: dict = {"address": ""}
-    server = xmmsclient.XMMS("synthia")
+    server = per_thread(lambda: xmmsclient.XMMS("synthia"))  # one client per instance (zone) and dispatcher worker
 
     def get_results(cls, func: callable):
         # TODO all the result.wait stuff is tedious. condense into one function?
         r = func()
         r.wait()
         if r.is_error():
-            log(f"xmms2 {func} error: {r.get_error()}")
+            log(f"xmms2 {func} error: {r.get_error()}", ERROR)
         return r.value()
 
     @tryit
@@ -37,12 +66,12 @@ class xmms2_backend(backend_abc):
         TODO handle XMMS_PATH env var and get username for /tmp
         check if server is running
         """
+        count("socket_connects")
         try:
             cls.server.connect(f"/tmp/xmms-ipc-{getpass.getuser()}" if not cls.settings["address"] else cls.settings["address"])
         except IOError as e:
             # NOTE full traceback info: https://stackoverflow.com/questions/3702675/catch-and-print-full-python-exception-traceback-without-halting-exiting-the-prog
-            print(f"{e}\nIs the xmms2 server running?")
-            sys.exit(1)
+            raise BackendConnectionError(f"{e}. Is the xmms2 server running?") from e
 
     @tryit
     def disconnect(cls) -> None:
@@ -56,7 +85,7 @@ class xmms2_backend(backend_abc):
         result = cls.server.playback_status()
         result.wait()
         if result.iserror():
-            log(f"play/pause error: {result.get_error()}")
+            log(f"play/pause error: {result.get_error()}", ERROR)
         # log(f"playback status: {result.value()}")
         if result.value() == 1:  # playing
             r = cls.server.playback_pause()
@@ -104,7 +133,7 @@ class xmms2_backend(backend_abc):
         result = cls.server.playlist_add_url("file://" + song)
         result.wait()
         if result.iserror():
-            log(f"enqueue error: {result.get_error()}")
+            log(f"enqueue error: {result.get_error()}", ERROR)
         cls.disconnect()
 
     @tryit
@@ -165,43 +194,24 @@ class xmms2_backend(backend_abc):
     @tryit
     def sync(cls) -> dict:
         """sync status with the server"""
-        d = {'State': '',
-             'File': '',
-             'Title': '',
-             'Artist': '',
-             'SongTitle': '',
-             'Album': '',
-             'TotalTime': '0',
-             'TimeLeft': '0',
-             'TotalSec': '1',  # avoid ZeroDivisionError
-             'CurrentTime': '0',
-             'CurrentSec': '0',
-             'Bitrate': '0',
-             'AvgBitrate': '0',
-             'Rate': '0',
-             'Volume': '0'
-             }
         cls.connect()
         r = cls.server.playback_current_id()
         r.wait()  # TODO handle potential connection errors
         # TODO clean this mess up
         if r.is_error():
-            log(1)
-            log(r.get_error())
+            log(f"xmms2 playback_current_id error: {r.get_error()}", ERROR)
             return
         cur_song = r.value()
         r = cls.server.playback_playtime()
         r.wait()
         if r.is_error():
-            log(2)
-            log(r.get_error())
+            log(f"xmms2 playback_playtime error: {r.get_error()}", ERROR)
             return
         p_time = r.value()
         r = cls.server.playback_status()
         r.wait()
         if r.is_error():
-            log(3)
-            log(r.get_error())
+            log(f"xmms2 playback_status error: {r.get_error()}", ERROR)
             return
         status = r.value()
         r = cls.server.medialib_get_info(cur_song)
@@ -210,29 +220,137 @@ class xmms2_backend(backend_abc):
             # this one doesnt have get_error
             pass
         info = r.value()
-        log("xmms info")
-        log(cur_song)
-        log(p_time)
-        log(status)
-        log(info)
+        log("xmms info", DEBUG)  # NOTE 4 times a second. free unless "log_level" is "debug"
+        log(cur_song, DEBUG)
+        log(p_time, DEBUG)
+        log(status, DEBUG)
+        log(info, DEBUG)
         cls.disconnect()
-        # TODO handle tags only existing on some songs
-        d['State'] = status_dict[status]
-        if d["State"] != "STOP":
-            d['File'] = info[('server', 'url')]
-            d['Title'] = info[('plugin/id3v2', 'title')] if ('plugin/id3v2', 'title') in info else ""
-            d['Artist'] = info[('plugin/id3v2', 'artist')] if ('plugin/id3v2', 'artist') in info else ""
-            d['SongTitle'] = info[('plugin/id3v2', 'title')] if ('plugin/id3v2', 'title') in info else ""
-            d['Album'] = info[('plugin/id3v2', 'album')] if ('plugin/id3v2', 'album') in info else ""
-            # BUG with :02d causing the status bar to overshoot the line and scroll the page
-            d['TotalTime'] = f"{int((info[('plugin/mad', 'duration')] / (1000 * 60)) % 60):02d}:{int((info[('plugin/mad', 'duration')] / 1000) % 60):02d}"
-            d['TimeLeft'] = f"{int(((info[('plugin/mad', 'duration')] - p_time) / (1000 * 60)) % 60):02d}:{int(((info[('plugin/mad', 'duration')] - p_time) / 1000) % 60):02d}"
-            d['TotalSec'] = str(int(info[('plugin/mad', 'duration')] / 1000))
-            d['CurrentTime'] = f"{int((p_time / (1000 * 60)) % 60):02d}:{int((p_time / 1000) % 60):02d}"
-            d['CurrentSec'] = str(int(p_time / 1000))
-            d['Bitrate'] = str(info[('plugin/mad', 'bitrate')])
-            d['AvgBitrate'] = '0'
-            d['Rate'] = str(info[('plugin/mad', 'samplerate')])
-            d['Volume'] = str(cls.get_vol())  # BUG when changing song causes invalid result?
-        # log(d)
-        return d
+        return info_to_dict(status, p_time, info, cls.get_vol() if status_dict[status] != "STOP" else 0)
+
+
+class xmms2_async_backend(async_backend_abc):
+    """asyncio xmms2 backend. the client's socket is watched by the event loop and
+    results come back through callbacks instead of blocking on .wait()"""
+    settings: dict = {"address": ""}
+    server = xmmsclient.XMMS("synthia")
+
+    def __init__(self):
+        self.server = xmmsclient.XMMS("synthia")
+
+    async def call(cls, command: str, *args):
+        """run an xmms2 command and wait for its result without blocking the loop"""
+        if not cls.connected:
+            raise BackendConnectionError("not connected to xmms2")
+        future = asyncio.get_running_loop().create_future()
+        getattr(cls.server, command)(*args, cb=lambda r: future.done() or future.set_result(r))
+        cls._want_write()
+        r = await future
+        if r.is_error():
+            log(f"xmms2 {command} error: {r.get_error()}", ERROR)
+        return r.value()
+
+    def _want_write(cls) -> None:
+        if cls.server.want_ioout():
+            asyncio.get_running_loop().add_writer(cls.server.get_fd(), cls._on_writable)
+
+    def _on_writable(cls) -> None:
+        cls.server.ioout()
+        if not cls.server.want_ioout():
+            asyncio.get_running_loop().remove_writer(cls.server.get_fd())
+
+    def _on_readable(cls) -> None:
+        if not cls.server.ioin():  # server went away
+            asyncio.get_running_loop().create_task(cls.disconnect())
+
+    @tryit_async
+    async def connect(cls) -> None:
+        """Connect to server"""
+        count("socket_connects")
+        try:
+            cls.server.connect(f"/tmp/xmms-ipc-{getpass.getuser()}" if not cls.settings["address"] else cls.settings["address"])
+        except IOError as e:
+            raise BackendConnectionError(f"{e}. Is the xmms2 server running?") from e
+        asyncio.get_running_loop().add_reader(cls.server.get_fd(), cls._on_readable)
+        cls.connected = True
+
+    @tryit_async
+    async def disconnect(cls) -> None:
+        """Disconnect from server"""
+        if cls.connected:
+            loop = asyncio.get_running_loop()
+            loop.remove_reader(cls.server.get_fd())
+            loop.remove_writer(cls.server.get_fd())
+            cls.connected = False
+        cls.server.disconnect()
+
+    @tryit_async
+    async def play_pause(cls) -> None:
+        """Toggle play pause"""
+        status = await cls.call("playback_status")
+        if status == 1:  # playing
+            await cls.call("playback_pause")
+        elif status == 2:  # paused
+            await cls.call("playback_start")
+
+    @tryit_async
+    async def stop(cls) -> None:
+        """Stop song and clear queue"""
+        await cls.call("playback_stop")
+        await cls.call("playlist_clear")
+
+    @tryit_async
+    async def next(cls) -> None:
+        """skip to next song in queue"""
+        await cls.call("playlist_set_next_rel", 1)
+        await cls.call("playback_tickle")
+
+    @tryit_async
+    async def prev(cls) -> None:
+        """skip to previous song in queue"""
+        await cls.call("playlist_set_next_rel", -1)
+        await cls.call("playback_tickle")
+
+    @tryit_async
+    async def enqueue(cls, song: str) -> None:
+        """add song to queue"""
+        await cls.call("playlist_add_url", "file://" + song)
+
+    @tryit_async
+    async def enqueue_many(cls, songs: list) -> None:
+        """add songs to queue. all the adds are written before waiting on any result"""
+        await asyncio.gather(*[cls.call("playlist_add_url", "file://" + s) for s in songs])
+
+    @tryit_async
+    async def clear_queue(cls) -> None:
+        """Clear queue"""
+        await cls.call("playlist_clear")
+
+    @tryit_async
+    async def set_vol(cls, value: int) -> None:
+        """Set relative volume"""
+        vol = min(max(await cls.get_vol() + value, 0), 100)
+        await cls.call("playback_volume_set", "master", vol)
+
+    @tryit_async
+    async def get_vol(cls) -> int:
+        return (await cls.call("playback_volume_get"))["master"]
+
+    @tryit_async
+    async def seek(cls, stime: int) -> None:
+        """seek song to time"""
+        p_time = await cls.call("playback_playtime")  # no relative seek? get current time and do math instead
+        await cls.call("playback_seek_ms", p_time + stime * 1000)
+
+    @tryit_async
+    async def start_queue(cls) -> None:
+        """Start playing the first song in the queue"""
+        await cls.call("playback_start")
+
+    @tryit_async
+    async def sync(cls) -> dict:
+        """sync status with the server"""
+        cur_song, p_time, status = await asyncio.gather(cls.call("playback_current_id"), cls.call("playback_playtime"),
+                                                        cls.call("playback_status"))
+        info = await cls.call("medialib_get_info", cur_song)
+        return info_to_dict(status, p_time, info, await cls.get_vol() if status_dict[status] != "STOP" else 0)
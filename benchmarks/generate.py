@@ -0,0 +1,66 @@
+# synthetic music libraries for the benchmarks. files are empty (sparse) so even big trees are cheap to make
+import itertools
+import os
+
+
+words = ["Blue", "Night", "Drive", "Echo", "Signal", "Glass", "River", "Static", "Neon", "Ghost"]
+cjk_words = ["東京", "事変", "群青", "日和", "夜明け", "音楽", "서울", "노래", "月光", "電車"]
+extensions = [".mp3", ".flac", ".ogg", ".m4a"]
+
+
+def name(i: int, cjk: bool = False) -> str:
+    """deterministic track name. every third one has cjk characters when cjk is on"""
+    pool = cjk_words if cjk and i % 3 == 0 else words
+    ext = extensions[i % len(extensions)]
+    return f"{i:06d} {pool[i % len(pool)]} {pool[(i // len(pool)) % len(pool)]}{ext}"
+
+
+def touch(path: str, i: int) -> None:
+    with open(path, "wb") as f:
+        f.truncate(1000 + (i * 7919) % 100000)  # varied sizes for --sort=size
+    os.utime(path, (1600000000 + i * 60, 1600000000 + ((i * 104729) % 1000000)))  # and times for --sort=time
+
+
+def flat(root: str, count: int, cjk: bool = False) -> str:
+    """count tracks in one folder plus a few subfolders and junk files folder_sort has to skip"""
+    folder = os.path.join(root, f"flat_{count}{'_cjk' * cjk}") + "/"
+    if os.path.isdir(folder):
+        return folder
+    os.makedirs(folder)
+    for i in range(count):
+        touch(folder + name(i, cjk), i)
+    for i in range(5):
+        os.makedirs(folder + f"sub {i}", exist_ok=True)
+        with open(folder + f"cover {i}.jpg", "wb"):
+            pass
+    return folder
+
+
+def deep(root: str, count: int, tracks_per_album: int = 12, albums_per_artist: int = 5, cjk: bool = False) -> str:
+    """artist/album/track tree with count tracks in total"""
+    folder = os.path.join(root, f"deep_{count}{'_cjk' * cjk}") + "/"
+    if os.path.isdir(folder):
+        return folder
+    counter = itertools.count()
+    for artist in itertools.count():
+        for album in range(albums_per_artist):
+            album_dir = f"{folder}artist {artist:04d} {(cjk_words if cjk else words)[artist % 10]}/album {album:02d}/"
+            os.makedirs(album_dir)
+            for t in range(tracks_per_album):
+                i = next(counter)
+                if i >= count:
+                    return folder
+                touch(album_dir + name(i, cjk), i)
+
+
+def playlist(root: str, tracks_folder: str, count: int) -> str:
+    """m3u8 file with count absolute paths (cycling through tracks_folder) and some #EXT lines"""
+    path = os.path.join(root, f"playlist_{count}.m3u8")
+    if os.path.isfile(path):
+        return path
+    tracks = sorted(f for f in os.listdir(tracks_folder) if os.path.isfile(tracks_folder + f) and not f.endswith(".jpg"))
+    with open(path, "w") as f:
+        f.write("#EXTM3U\n")
+        for i in range(count):
+            f.write(f"#EXTINF:180,track {i}\n{tracks_folder}{tracks[i % len(tracks)]}\n")
+    return path
@@ -0,0 +1,158 @@
+# plays back keys recorded with synthia --record against the stand-in mpd server, drawing into a virtual terminal
+# so ui slowdowns and drawing bugs can be reproduced without a tty, a real server or anyone at the keyboard
+# synthia --record keys.jsonl
+# python -m benchmarks.replay keys.jsonl --out report.json
+# python -m benchmarks.replay keys.jsonl --expect report.json   exits 1 if the final screen isn't the same
+# recordings can be written by hand too. the header line only needs what's different from the defaults
+import argparse
+from contextlib import redirect_stdout
+import difflib
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+from benchmarks import generate
+from benchmarks.run import load_synthia, meta, progress
+from benchmarks.vterm import VirtualTerminal
+from fake_servers import FakeMPDServer, SimulatedClock
+
+
+def read_recording(path: str) -> tuple:
+    """(header, [[seconds, keys], ...])"""
+    with open(path) as f:
+        lines = [json.loads(line) for line in f if line.strip()]
+    if lines and isinstance(lines[0], dict):
+        return lines[0], lines[1:]
+    return {}, lines
+
+
+def summary(times: list) -> dict:
+    if not times:
+        return {}
+    times = sorted(times)
+    return {"median": statistics.median(times), "p95": times[min(int(len(times) * 0.95), len(times) - 1)],
+            "max": times[-1], "mean": statistics.fmean(times)}
+
+
+def settle(synthia, timeout: float = 10) -> None:
+    """wait for every backend command sent so far and the redraws their replies cause.
+    NOTE each zone has one dispatcher thread so once a no-op has run everything queued before it has too"""
+    while True:
+        for zone in synthia.zones:
+            zone.dispatcher.submit(lambda: None, timeout=timeout).result(timeout)
+        if all(zone.dispatcher.jobs.empty() for zone in synthia.zones):  # replies can queue more (top ups)
+            return
+
+
+def replay(args) -> dict:
+    header, batches = read_recording(args.keys)
+    columns, lines = header.get("size", [80, 24])
+    os.environ["COLUMNS"], os.environ["LINES"] = str(columns), str(lines)
+    vt = VirtualTerminal(columns, lines)
+    # NOTE generated libraries go in a fixed place so the folder shown at the top is the same on every run
+    library = os.path.join(tempfile.gettempdir(), "synthia-replay") + "/"
+    with tempfile.TemporaryDirectory(prefix="synthia-replay-") as tmp, redirect_stdout(vt):
+        if args.library:
+            music = start = args.library
+        elif os.path.isdir(header.get("folder", "")):  # recorded on this machine
+            music = start = header["folder"]
+        else:
+            music, start = library, generate.deep(library, args.size)  # NOTE only made the first time
+        progress(f"replaying against {start}")
+        clock = SimulatedClock()  # songs only play on by the time between recorded key presses
+        with FakeMPDServer(f"{tmp}/mpd.sock", music_directory=music, latency=args.latency, clock=clock) as server:
+            server.call(server.mpd.update_db)
+            settings = {"sort_mode": header.get("sort_mode", "name"), "sort_reversed": header.get("sort_reversed", False),
+                        **header.get("settings", {}), "starting_folder": start, "main_loop": "threads",
+                        "use_daemon": False, "restore_session": False, "instrument": True}
+            synthia = load_synthia(f"{tmp}/home", music, server, **settings)
+            UI = synthia.UI
+            if synthia.config["tag_columns"]:
+                synthia.tag_reader.start()
+            UI.selected_song = min(header.get("selected_song", 0), max(len(UI.song_list) - 1, 0))
+            UI.list_slice = [header.get("top", 0), header.get("top", 0) + UI.scrn_size[1] - 6 - UI.zone_rows]
+            UI.scroll(0)
+            for zone in synthia.zones:
+                zone.dispatcher.start()
+            UI.draw_list()
+            UI.draw_status_bar()
+            UI.request_sync()
+            settle(synthia)
+
+            progress(f"replaying {sum(len(keys) for _, keys in batches)} keys in {len(batches)} batches")
+            results = []
+            last = 0.0
+            for t, keys in batches:
+                clock.advance(max(t - last, 0))
+                if args.speed:
+                    time.sleep(max(t - last, 0) / args.speed)
+                last = t
+                bytes_before, frames_before = vt.bytes, vt.flushes
+                start_time = time.perf_counter()
+                running = synthia.handle_keys(keys)
+                latency = time.perf_counter() - start_time  # until the frame for the keys is drawn
+                settle(synthia)
+                response = time.perf_counter() - start_time  # until the server's answer is drawn too
+                results.append({"time": t, "keys": keys, "latency": latency, "response": response,
+                                "bytes": vt.bytes - bytes_before, "frames": vt.flushes - frames_before})
+                if not running:
+                    break
+
+            for zone in synthia.zones:
+                zone.dispatcher.stop()
+            synthia.tag_reader.stop()
+    return {"meta": meta(), "args": vars(args), "header": header,
+            "keys": sum(len(r["keys"]) for r in results), "batches": len(results),
+            "latency": summary([r["latency"] for r in results]), "response": summary([r["response"] for r in results]),
+            "frames": vt.flushes, "bytes": vt.bytes, "writes": vt.writes,
+            "stats": synthia.utils.stats_snapshot(), "per_batch": results, "screen": vt.screen()}
+
+
+def print_report(report: dict) -> None:
+    width = len(report["screen"][0]) if report["screen"] else 0
+    print("\n".join(report["screen"]))
+    print(f"\n{report['keys']} keys in {report['batches']} batches. {report['frames']} frames, {report['bytes']} bytes")
+    for name in ["latency", "response"]:
+        s = report[name]
+        if s:
+            print(f"{name:<10} median {s['median'] * 1000:.2f}ms  p95 {s['p95'] * 1000:.2f}ms  max {s['max'] * 1000:.2f}ms")
+    slowest = sorted(report["per_batch"], key=lambda r: r["latency"], reverse=True)[:5]
+    for r in slowest:
+        print(f"    {r['latency'] * 1000:>8.2f}ms  at {r['time']:>8.3f}s  {json.dumps(r['keys'], ensure_ascii=False)[:max(width - 30, 20)]}")
+
+
+def expect(report: dict, path: str) -> bool:
+    """whether the final screen matches the one in an earlier report. prints the difference if not"""
+    with open(path) as f:
+        expected = json.load(f)["screen"]
+    if expected == report["screen"]:
+        return True
+    sys.stdout.writelines(difflib.unified_diff([line + "\n" for line in expected], [line + "\n" for line in report["screen"]],
+                                               "expected", "replayed"))
+    return False
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="replay keys recorded with synthia --record")
+    parser.add_argument("keys", help="file written by synthia --record")
+    parser.add_argument("--library", help="music folder to play against. default: the recorded folder if it exists "
+                                          "otherwise a generated one")
+    parser.add_argument("--size", type=int, default=1000, help="tracks in the generated library")
+    parser.add_argument("--speed", type=float, default=0.0, help="1 waits between keys like when recording. 0 doesn't wait")
+    parser.add_argument("--latency", type=float, default=0.0, help="stand-in server reply latency in seconds")
+    parser.add_argument("--out", help="write the report to this json file")
+    parser.add_argument("--expect", metavar="REPORT", help="fail if the final screen differs from the one in REPORT")
+    parser.add_argument("--quiet", action="store_true", help="don't print the final screen and timings")
+    a = parser.parse_args()
+
+    res = replay(a)
+    if a.out:
+        with open(a.out, "w") as f:
+            json.dump(res, f, indent=2)
+    if not a.quiet:
+        print_report(res)
+    if a.expect and not expect(res, a.expect):
+        sys.exit(1)
@@ -0,0 +1,193 @@
+# benchmarks for the hot paths. runs offline against generated libraries and the stand-in servers
+# python -m benchmarks.run --out before.json
+# python -m benchmarks.run --sizes 1000 10000 200000 --out after.json
+# python -m benchmarks.run --compare before.json after.json
+import argparse
+from contextlib import redirect_stdout
+import datetime
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks import generate
+from fake_servers import FakeMPDServer
+
+
+class CountingWriter():
+    """stands in for stdout. counts what would have been written to the terminal"""
+    def __init__(self):
+        self.bytes = 0
+        self.writes = 0
+
+    def write(self, s: str) -> int:
+        self.bytes += len(s.encode())
+        self.writes += 1
+        return len(s)
+
+    def flush(self) -> None:
+        pass
+
+
+def measure(func: callable, runs: int, setup: callable = None) -> dict:
+    """time func runs times. setup (untimed) runs before every call"""
+    times = []
+    out = CountingWriter()
+    with redirect_stdout(out):
+        for _ in range(runs):
+            if setup:
+                setup()
+            start = time.perf_counter()
+            func()
+            times.append(time.perf_counter() - start)
+    times.sort()
+    return {"median": statistics.median(times), "min": times[0], "p95": times[min(int(len(times) * 0.95), len(times) - 1)],
+            "runs": runs, "bytes": out.bytes // runs, "writes": out.writes // runs}
+
+
+def progress(msg: str) -> None:
+    print(msg, file=sys.stderr, flush=True)
+
+
+def load_synthia(home: str, music: str, server: FakeMPDServer, **settings):
+    """import synthia with a config pointing at the generated library and the stand-in server.
+    settings are added to the config (and can replace those)"""
+    os.makedirs(f"{home}/synthia", exist_ok=True)
+    with open(f"{home}/synthia/synthia_settings.json", "w") as f:
+        json.dump({"backend": "mpd", "starting_folder": music,
+                   "mpd_settings": {"address": server.address, "port": server.port, "music_directory": music},
+                   **settings}, f)
+    os.environ["HOME"] = home  # NOTE utils.home_dir is read when utils is imported
+    os.environ.setdefault("COLUMNS", "120")
+    os.environ.setdefault("LINES", "40")
+    import synthia
+    synthia.load_in_background()  # wcwidth and the first listing. normally done on a thread after the first frame
+    return synthia
+
+
+def run(args) -> dict:
+    results: dict = {}
+    with tempfile.TemporaryDirectory(prefix="synthia-bench-") as tmp, redirect_stdout(CountingWriter()):
+        music = args.library or f"{tmp}/music/"
+        os.makedirs(music, exist_ok=True)
+        with FakeMPDServer(f"{tmp}/mpd.sock", music_directory=music, latency=args.latency) as server:
+            progress("generating libraries")
+            folders = {}
+            for n in args.sizes:
+                folders[f"flat_{n}"] = generate.flat(music, n)
+                folders[f"flat_{n}_cjk"] = generate.flat(music, n, cjk=True)
+                folders[f"deep_{n}"] = generate.deep(music, n)
+            playlists = {n: generate.playlist(music, folders[f"flat_{min(args.sizes)}"], n) for n in args.sizes}
+            server.call(server.mpd.update_db)
+
+            synthia = load_synthia(f"{tmp}/home", music, server)
+            UI = synthia.UI
+
+            for key, folder in folders.items():
+                for mode in ["name", "size", "time"]:
+                    progress(f"folder_sort {key} {mode}")
+                    results[f"folder_sort/{key}/{mode}"] = measure(lambda: synthia.folder_sort(folder, mode), args.runs)
+            for n, pl in playlists.items():
+                progress(f"open_m3u8 {n}")
+                results[f"open_m3u8/{n}"] = measure(lambda: synthia.open_m3u8(pl), args.runs)
+
+            for key in [f"flat_{n}" for n in args.sizes] + [f"flat_{n}_cjk" for n in args.sizes]:
+                progress(f"draw {key}")
+                UI.current_folder = folders[key]
+                UI.song_list = synthia.folder_sort(folders[key], "name")
+                UI.selected_song = len(UI.song_list) // 2
+                UI.list_slice = [0, UI.scrn_size[1] - 6]
+                UI.scroll(0)
+                results[f"draw_list/{key}"] = measure(UI.draw_list, args.runs * 10)
+            UI.current_song_info = synthia.backend.sync()
+            results["draw_status_bar"] = measure(UI.draw_status_bar, args.runs * 10)
+
+            progress("sync")
+            synthia.backend.enqueue_many([folders[f"flat_{min(args.sizes)}"] + s for s in
+                                          synthia.folder_sort(folders[f"flat_{min(args.sizes)}"], "name")[1:20] if s[-1] != "/"])
+            synthia.backend.start_queue()
+            results["backend.sync"] = measure(synthia.backend.sync, args.runs * 10)
+
+            # time to first audio. the last thing add_songs_to_queue_and_play does is start the queue
+            # so the server is playing once it returns
+            for n in args.sizes:
+                if n > args.max_enqueue:
+                    continue
+                for layout in ["flat", "deep"]:
+                    folder = folders[f"{layout}_{n}"]
+                    songs = synthia.folder_sort(folder, "name")
+                    if layout == "deep":  # every track in the tree like an m3u8 playlist
+                        songs = ["../"] + [os.path.join(r, f)[len(folder):] for r, _, fs in sorted(os.walk(folder)) for f in sorted(fs)]
+                    for sort_mode in ["name", "time"]:  # name order lets mpd add the whole folder itself
+                        progress(f"add_songs_to_queue_and_play {layout} {n} {sort_mode}")
+                        UI.sort_mode = sort_mode
+                        UI.current_song_info = synthia.blank_status()
+                        results[f"add_songs_to_queue_and_play/{layout}_{n}/{sort_mode}"] = measure(
+                            lambda: synthia.run_steps(synthia.add_songs_to_queue_and_play, UI.zone(), synthia.backend,
+                                                      songs, 1, folder), args.runs)
+                        assert server.mpd.state == "play" and server.mpd.queue, "nothing playing after enqueue"
+            results["server_stats"] = dict(server.mpd.stats)
+    return results
+
+
+def meta() -> dict:
+    try:
+        rev = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                             cwd=os.path.dirname(__file__)).stdout.strip()
+    except OSError:
+        rev = ""
+    return {"date": datetime.datetime.now().isoformat(timespec="seconds"), "git": rev,
+            "python": platform.python_version(), "machine": platform.machine()}
+
+
+def compare(old_file: str, new_file: str, threshold: float) -> int:
+    """print old vs new medians. returns the number of regressions over threshold"""
+    with open(old_file) as f:
+        old = json.load(f)
+    with open(new_file) as f:
+        new = json.load(f)
+    print(f"old: {old['meta']}\nnew: {new['meta']}\n")
+    print(f"{'benchmark':<60} {'old':>10} {'new':>10} {'change':>8}")
+    regressions = 0
+    for name in sorted(set(old["results"]) | set(new["results"])):
+        o, n = old["results"].get(name), new["results"].get(name)
+        if not (isinstance(o, dict) and "median" in o and isinstance(n, dict) and "median" in n):
+            print(f"{name:<60} {'-' if o is None else 'ok':>10} {'-' if n is None else 'ok':>10}")
+            continue
+        change = n["median"] / o["median"] - 1 if o["median"] else 0.0
+        flag = ""
+        if change > threshold:
+            flag = "  REGRESSION"
+            regressions += 1
+        elif change < -threshold:
+            flag = "  faster"
+        bytes_note = f"  bytes {o['bytes']} -> {n['bytes']}" if o.get("bytes") != n.get("bytes") else ""
+        print(f"{name:<60} {o['median'] * 1000:>8.2f}ms {n['median'] * 1000:>8.2f}ms {change:>+7.0%}{flag}{bytes_note}")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="synthia benchmarks")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000], help="tracks per generated library")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0.0, help="stand-in server reply latency in seconds")
+    parser.add_argument("--max-enqueue", type=int, default=10000, help="skip enqueue benchmarks for bigger libraries")
+    parser.add_argument("--library", help="reuse generated libraries from this folder instead of a temp dir")
+    parser.add_argument("--out", help="write results to this json file")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="compare two result files")
+    parser.add_argument("--threshold", type=float, default=0.10, help="slowdown counted as a regression")
+    a = parser.parse_args()
+
+    if a.compare:
+        sys.exit(1 if compare(*a.compare, a.threshold) else 0)
+    res = {"meta": meta(), "args": vars(a), "results": run(a)}
+    text = json.dumps(res, indent=2)
+    if a.out:
+        with open(a.out, "w") as f:
+            f.write(text)
+    else:
+        print(text)
@@ -0,0 +1,125 @@
+# in-memory terminal for running the ui headless. stands in for stdout and keeps a grid of what would be on screen
+# only knows what synthia draws with: cursor moves, erase, auto wrap and scrolling. colours are parsed and dropped
+import threading
+
+from wcwidth import wcwidth
+
+
+class VirtualTerminal():
+    """write() bytes in like a tty, screen() the text back out. counts bytes, writes and flushes (frames)"""
+    def __init__(self, columns: int = 80, lines: int = 24):
+        self.columns = columns
+        self.lines = lines
+        self.grid: list = [[" "] * columns for _ in range(lines)]  # wide characters take 2 cells, the second is ""
+        self.row = 0
+        self.col = 0
+        self.wrap_pending = False  # last column was written. the next character goes on the next line
+        self.escape = ""  # escape sequence read so far
+        self.bytes = 0
+        self.writes = 0
+        self.flushes = 0
+        self.lock = threading.Lock()  # NOTE the ui draws from the dispatcher and tag threads too
+
+    def write(self, s: str) -> int:
+        with self.lock:
+            self.bytes += len(s.encode())
+            self.writes += 1
+            for c in s:
+                self._put(c)
+        return len(s)
+
+    def flush(self) -> None:
+        self.flushes += 1
+
+    def screen(self) -> list:
+        """one string per line with trailing spaces removed"""
+        with self.lock:
+            return ["".join(line).rstrip() for line in self.grid]
+
+    def _put(self, c: str) -> None:
+        if self.escape:
+            self.escape += c
+            if self.escape[1] != "[":  # two character escape. nothing synthia draws with
+                self.escape = ""
+            elif len(self.escape) > 2 and "@" <= c <= "~":  # final byte of a CSI sequence
+                self._csi(self.escape[2:-1], c)
+                self.escape = ""
+            return
+        if c == "\x1b":
+            self.escape = c
+        elif c == "\n":  # NOTE the tty turns \n into \r\n
+            self.col = 0
+            self._line_feed()
+        elif c == "\r":
+            self.col, self.wrap_pending = 0, False
+        elif c == "\b":
+            self.col, self.wrap_pending = max(self.col - 1, 0), False
+        elif c >= " ":
+            self._print(c)
+
+    def _print(self, c: str) -> None:
+        width = wcwidth(c)
+        if width == 0:  # combining character. goes with the one before it
+            last = self.col if self.wrap_pending else self.col - 1
+            if last >= 0:
+                self.grid[self.row][last] += c
+            return
+        width = 2 if width == 2 else 1
+        if self.wrap_pending or self.col + width > self.columns:
+            self.col = 0
+            self._line_feed()
+        self.grid[self.row][self.col] = c
+        if width == 2:
+            self.grid[self.row][self.col + 1] = ""
+        self.col += width
+        if self.col >= self.columns:
+            self.col, self.wrap_pending = self.columns - 1, True
+
+    def _line_feed(self) -> None:
+        self.wrap_pending = False
+        if self.row == self.lines - 1:
+            self.grid.pop(0)
+            self.grid.append([" "] * self.columns)
+        else:
+            self.row += 1
+
+    def _csi(self, params: str, final: str) -> None:
+        if params.startswith("?"):  # cursor visibility etc.
+            return
+        n = [int(p) if p.isdigit() else 0 for p in params.split(";")]
+        if final in "Hf":
+            row, col = n[0], n[1] if len(n) > 1 else 0
+            self.row = min(max(row, 1), self.lines) - 1  # NOTE 0 counts as 1
+            self.col = min(max(col, 1), self.columns) - 1
+            self.wrap_pending = False
+        elif final in "ABCD":
+            amount = max(n[0], 1)
+            if final == "A":
+                self.row = max(self.row - amount, 0)
+            elif final == "B":
+                self.row = min(self.row + amount, self.lines - 1)
+            elif final == "C":
+                self.col = min(self.col + amount, self.columns - 1)
+            else:
+                self.col = max(self.col - amount, 0)
+            self.wrap_pending = False
+        elif final == "G":
+            self.col, self.wrap_pending = min(max(n[0], 1), self.columns) - 1, False
+        elif final == "J":
+            if n[0] in (2, 3):
+                self.grid = [[" "] * self.columns for _ in range(self.lines)]
+            elif n[0] == 0:
+                self._erase(self.row, self.col, self.columns)
+                for row in range(self.row + 1, self.lines):
+                    self._erase(row, 0, self.columns)
+            elif n[0] == 1:
+                for row in range(self.row):
+                    self._erase(row, 0, self.columns)
+                self._erase(self.row, 0, self.col + 1)
+        elif final == "K":
+            start, end = {0: (self.col, self.columns), 1: (0, self.col + 1)}.get(n[0], (0, self.columns))
+            self._erase(self.row, start, end)
+        # anything else (colours, "m") doesn't change the text on screen
+
+    def _erase(self, row: int, start: int, end: int) -> None:
+        self.grid[row][start:end] = [" "] * (end - start)
@@ -0,0 +1,24 @@
+import os
+import tempfile
+
+import pytest
+
+from fake_servers import FakeMPDServer
+
+
+@pytest.fixture
+def music() -> str:
+    """music folder with a few empty songs. the stand-in servers only look at the file names.
+    NOTE not in tmp_path. its path is too long for synthia's title line"""
+    with tempfile.TemporaryDirectory(prefix="synthia-music-") as folder:
+        os.mkdir(f"{folder}/album")
+        for i in range(6):
+            open(f"{folder}/album/{i:02d} song.mp3", "w").close()
+        yield f"{folder}/"
+
+
+@pytest.fixture
+def mpd_server(tmp_path, music):
+    """started FakeMPDServer on a unix socket with music as its database"""
+    with FakeMPDServer(f"{tmp_path}/mpd.sock", music_directory=music) as server:
+        yield server
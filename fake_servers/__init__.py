@@ -0,0 +1,3 @@
+"""Stand-in mpd and moc servers so the backends can be run without audio daemons or hardware"""
+from .mocp import FakeMOC, FakeMOCServer
+from .mpd import FakeMPD, FakeMPDServer, SimulatedClock
@@ -0,0 +1,226 @@
+# stand-in moc server for benchmarks and trying things out without a real daemon or audio hardware
+# implements the parts of https://github.com/jonsafari/mocp/blob/master/protocol.h that mocp_backend sends
+# python -m fake_servers.mocp --socket /tmp/fake_moc.sock
+# NOTE mocp_backend.sync() shells out to "mocp -i" which this can't answer
+import argparse
+import asyncio
+import os
+import struct
+import threading
+import time
+
+
+# commands (client -> server)
+CMD_PLAY = 0x00
+CMD_STOP = 0x04
+CMD_PAUSE = 0x05
+CMD_UNPAUSE = 0x06
+CMD_GET_CTIME = 0x0d
+CMD_NEXT = 0x10
+CMD_QUIT = 0x11
+CMD_SEEK = 0x12
+CMD_GET_STATE = 0x13
+CMD_DISCONNECT = 0x15
+CMD_GET_MIXER = 0x1a
+CMD_SET_MIXER = 0x1b
+CMD_PREV = 0x20
+CMD_QUEUE_ADD = 0x3b
+CMD_QUEUE_CLEAR = 0x3e
+
+# events (server -> client)
+EV_STATE = 0x01
+EV_DATA = 0x06
+EV_MIXER_CHANGE = 0x0d
+EV_QUEUE_ADD = 0x54
+EV_QUEUE_CLEAR = 0x57
+
+# states
+STATE_PLAY = 0x01
+STATE_STOP = 0x02
+STATE_PAUSE = 0x03
+
+
+def pack_int(i: int) -> bytes:
+    return struct.pack("i", i)
+
+
+def pack_str(s: str) -> bytes:
+    b = s.encode()
+    return pack_int(len(b)) + b
+
+
+class FakeMOC():
+    """the server state. shared by every client connection. events go to every connected client like the real server"""
+    def __init__(self, latency: float = 0.0, clock: callable = time.monotonic, song_length: int = 180):
+        self.latency = latency  # seconds to wait before every reply
+        self.clock = clock
+        self.song_length = song_length
+        self.queue: list = []
+        self.current: str = ""
+        self.state = STATE_STOP
+        self.elapsed = 0.0
+        self.started_at = 0.0
+        self.volume = 50
+        self.clients: list = []
+        self.stats: dict = {"connections": 0, "commands": 0}
+
+    def position(self) -> float:
+        if self.state == STATE_PLAY:
+            return min(self.elapsed + self.clock() - self.started_at, self.song_length)
+        return self.elapsed
+
+    def broadcast(self, data: bytes) -> None:
+        for w in self.clients:
+            w.write(data)
+
+    def set_state(self, state: int) -> None:
+        if state == STATE_PAUSE and self.state == STATE_PLAY:
+            self.elapsed = self.position()
+        elif state == STATE_PLAY and self.state != STATE_PLAY:
+            self.started_at = self.clock()
+        self.state = state
+        self.broadcast(pack_int(EV_STATE))
+
+    def play_next_from_queue(self) -> None:
+        if self.queue:
+            self.current = self.queue.pop(0)
+            self.elapsed = 0.0
+            self.state = STATE_STOP  # so set_state restarts the clock
+            self.set_state(STATE_PLAY)
+        else:
+            self.current = ""
+            self.set_state(STATE_STOP)
+
+
+class FakeMOCServer():
+    """runs a FakeMOC on a unix socket in a background thread. use as a context manager:
+        with FakeMOCServer("/tmp/moc.sock") as server:
+            backend.address = server.path
+    """
+    def __init__(self, path: str, **kwargs):
+        self.path = path
+        self.moc = FakeMOC(**kwargs)
+        self.loop = None
+        self.server = None
+        self.thread = None
+        self.ready = threading.Event()
+
+    async def handle(self, reader, writer) -> None:
+        moc = self.moc
+        moc.clients.append(writer)
+        moc.stats["connections"] += 1
+
+        async def read_int() -> int:
+            return struct.unpack("i", await reader.readexactly(4))[0]
+
+        async def read_str() -> str:
+            return (await reader.readexactly(await read_int())).decode()
+
+        try:
+            while True:
+                cmd = await read_int()
+                moc.stats["commands"] += 1
+                if moc.latency:
+                    await asyncio.sleep(moc.latency)
+                if cmd == CMD_PLAY:
+                    file = await read_str()
+                    if file:
+                        moc.queue.insert(0, file)
+                    moc.play_next_from_queue()
+                elif cmd == CMD_STOP:
+                    moc.elapsed = 0.0
+                    moc.set_state(STATE_STOP)
+                elif cmd == CMD_PAUSE:
+                    moc.set_state(STATE_PAUSE)
+                elif cmd == CMD_UNPAUSE:
+                    if moc.state == STATE_PAUSE:
+                        moc.set_state(STATE_PLAY)
+                elif cmd == CMD_NEXT:
+                    moc.play_next_from_queue()
+                elif cmd == CMD_PREV:
+                    moc.elapsed = 0.0
+                    moc.started_at = moc.clock()
+                    moc.broadcast(pack_int(EV_STATE))
+                elif cmd == CMD_SEEK:
+                    moc.elapsed = min(max(moc.position() + await read_int(), 0.0), moc.song_length)
+                    moc.started_at = moc.clock()
+                elif cmd == CMD_GET_STATE:
+                    writer.write(pack_int(EV_DATA) + pack_int(moc.state))
+                elif cmd == CMD_GET_CTIME:
+                    writer.write(pack_int(EV_DATA) + pack_int(int(moc.position())))
+                elif cmd == CMD_GET_MIXER:
+                    writer.write(pack_int(EV_DATA) + pack_int(moc.volume))
+                elif cmd == CMD_SET_MIXER:
+                    moc.volume = min(max(await read_int(), 0), 100)
+                    moc.broadcast(pack_int(EV_MIXER_CHANGE))
+                elif cmd == CMD_QUEUE_ADD:
+                    file = await read_str()
+                    moc.queue.append(file)
+                    # plist item: file, title_tags, tags (title, artist, album, track, time, filled), mtime
+                    moc.broadcast(pack_int(EV_QUEUE_ADD) + pack_str(file) + pack_str("") + pack_str("") + pack_str("")
+                                  + pack_str("") + pack_int(-1) + pack_int(-1) + pack_int(0) + struct.pack("q", 0))
+                elif cmd == CMD_QUEUE_CLEAR:
+                    moc.queue = []
+                    moc.broadcast(pack_int(EV_QUEUE_CLEAR))
+                elif cmd in [CMD_DISCONNECT, CMD_QUIT]:
+                    break
+                # NOTE unknown commands are ignored. their arguments will be read as commands
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            moc.clients.remove(writer)
+            writer.close()
+
+    async def start_async(self) -> None:
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        self.server = await asyncio.start_unix_server(self.handle, self.path)
+
+    async def stop_async(self) -> None:
+        self.server.close()
+        for w in list(self.moc.clients):
+            w.close()
+        await self.server.wait_closed()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def start(self) -> "FakeMOCServer":
+        def run():
+            self.loop = asyncio.new_event_loop()
+            self.loop.run_until_complete(self.start_async())
+            self.ready.set()
+            self.loop.run_forever()
+            self.loop.run_until_complete(self.stop_async())
+            self.loop.close()
+        self.thread = threading.Thread(target=run, name="fake-moc", daemon=True)
+        self.thread.start()
+        self.ready.wait()
+        return self
+
+    def stop(self) -> None:
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+
+    def __enter__(self) -> "FakeMOCServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="stand-in moc server")
+    parser.add_argument("--socket", default=os.path.expanduser("~") + "/.moc/socket2")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds to wait before every reply")
+    a = parser.parse_args()
+    server = FakeMOCServer(a.socket, latency=a.latency)
+
+    async def main():
+        await server.start_async()
+        print(f"fake moc listening on {server.path}")
+        await asyncio.Event().wait()
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
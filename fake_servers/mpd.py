@@ -0,0 +1,507 @@
+# stand-in mpd server for benchmarks and trying things out without a real daemon or audio hardware
+# speaks enough of https://mpd.readthedocs.io/en/latest/protocol.html for the mpd backends
+# python -m fake_servers.mpd --socket /tmp/fake_mpd.sock --music-dir ~/Music/ --latency 0.01
+import argparse
+import asyncio
+import os
+import threading
+import time
+
+
+AUDIO_EXTENSIONS = (".aac", "flac", ".mp3", ".m4a", ".ogg", ".oga", ".wav", ".wma")  # same as folder_sort()
+
+
+class SimulatedClock():
+    """clock that only moves when told to. pass it as clock= to make song progress deterministic"""
+    def __init__(self, start: float = 0.0):
+        self.now = start
+
+    def __call__(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float) -> None:
+        self.now += seconds
+
+
+class CommandError(Exception):
+    """turned into an ACK line"""
+    def __init__(self, code: int, command: str, message: str):
+        super().__init__(message)
+        self.code = code
+        self.command = command
+
+
+def split_args(line: str) -> list:
+    """split a command line into words. handles "quoted args" with \\" and \\\\ escapes"""
+    args, cur, quoted, escaped, in_word = [], "", False, False, False
+    for c in line:
+        if escaped:
+            cur += c
+            escaped = False
+        elif c == "\\" and quoted:
+            escaped = True
+        elif c == '"':
+            quoted = not quoted
+            in_word = True
+        elif c in " \t" and not quoted:
+            if in_word:
+                args.append(cur)
+            cur, in_word = "", False
+        else:
+            cur += c
+            in_word = True
+    if in_word:
+        args.append(cur)
+    return args
+
+
+def parse_range(arg: str, length: int) -> tuple:
+    """"5" or "2:10" or "2:" into (start, end)"""
+    if ":" in arg:
+        start, end = arg.split(":")
+        return int(start), int(end) if end else length
+    return int(arg), int(arg) + 1
+
+
+class FakeMPD():
+    """the server state. one instance is shared by every client connection.
+    time only passes through clock() so a SimulatedClock makes song progress deterministic"""
+    def __init__(self, music_directory: str = None, latency: float = 0.0, clock: callable = time.monotonic,
+                 song_length: int = 180, unix: bool = True):
+        self.music_directory = music_directory.rstrip("/") + "/" if music_directory else None
+        self.latency = latency  # seconds to wait before every reply
+        self.clock = clock
+        self.song_length = song_length  # seconds. every song is this long
+        self.unix = unix  # "config" and file:// uris only work for local clients
+        self.database: dict = {}  # relative uri: absolute path
+        self.queue: list = []  # dicts with file, Id and the playlist version they last changed in
+        self.playlist_version = 1
+        self.next_id = 1
+        self.state = "stop"
+        self.current = -1  # position in queue
+        self.elapsed = 0.0  # seconds into the current song when started_at was taken
+        self.started_at = 0.0
+        self.volume = 50
+        self.clients: list = []
+        self.stats: dict = {"connections": 0, "commands": 0}
+        self.update_db()
+
+    # state helpers
+    def update_db(self) -> None:
+        self.database = {}
+        if self.music_directory and os.path.isdir(self.music_directory):
+            for root, dirs, files in os.walk(self.music_directory):
+                dirs.sort()
+                for f in sorted(files):
+                    if f[-4:] in AUDIO_EXTENSIONS:
+                        path = os.path.join(root, f)
+                        self.database[path[len(self.music_directory):]] = path
+
+    def notify(self, *subsystems: str) -> None:
+        for c in self.clients:
+            c.changes.update(subsystems)
+            c.changed.set()
+
+    def position(self) -> float:
+        """elapsed seconds in the current song"""
+        if self.state == "play":
+            return self.elapsed + self.clock() - self.started_at
+        return self.elapsed
+
+    def tick(self) -> None:
+        """move on to the next song(s) if the current one finished since the last command"""
+        while self.state == "play" and self.position() >= self.song_length:
+            over = self.position() - self.song_length
+            if self.current + 1 >= len(self.queue):
+                self.state, self.current, self.elapsed = "stop", -1, 0.0
+            else:
+                self.current += 1
+                self.elapsed, self.started_at = over, self.clock()
+            self.notify("player")
+
+    def queue_changed(self) -> None:
+        self.playlist_version += 1
+        for pos, song in enumerate(self.queue):
+            if song["Pos"] != pos:
+                song["Pos"], song["version"] = pos, self.playlist_version
+        self.notify("playlist")
+
+    def resolve(self, uri: str) -> list:
+        """uri to the list of absolute paths it means. directories add everything under them"""
+        if uri.startswith("file://"):
+            path = uri[len("file://"):]
+            if not self.unix:
+                raise CommandError(4, "add", "Access denied")
+            if not os.path.isfile(path):
+                raise CommandError(50, "add", "No such file")
+            return [path]
+        uri = uri.strip("/")
+        if uri in self.database:
+            return [self.database[uri]]
+        songs = [p for u, p in self.database.items() if uri == "" or u.startswith(uri + "/")]
+        if not songs:
+            raise CommandError(50, "add", "No such directory")
+        return songs
+
+    def add(self, path: str, pos: int = None) -> int:
+        uri = path[len(self.music_directory):] if self.music_directory and path.startswith(self.music_directory) else path
+        song = {"file": uri, "Id": self.next_id, "Pos": len(self.queue), "version": self.playlist_version + 1}
+        self.next_id += 1
+        if pos is None:
+            self.queue.append(song)
+        else:
+            self.queue.insert(pos, song)
+            if pos <= self.current:
+                self.current += 1
+        return song["Id"]
+
+    def song_info(self, song: dict) -> str:
+        name = os.path.splitext(os.path.basename(song["file"]))[0]
+        return (f"file: {song['file']}\nLast-Modified: 2020-01-01T00:00:00Z\nTitle: {name}\nArtist: fake artist\n"
+                f"Album: fake album\nTime: {self.song_length}\nduration: {self.song_length:.3f}\n"
+                f"Pos: {song['Pos']}\nId: {song['Id']}\n")
+
+    def start(self, pos: int) -> None:
+        if not 0 <= pos < len(self.queue):
+            raise CommandError(2, "play", "Bad song index")
+        self.current, self.state, self.elapsed, self.started_at = pos, "play", 0.0, self.clock()
+        self.notify("player")
+
+    # commands. each returns the reply body without the trailing OK
+    def cmd_status(self, *args) -> str:
+        s = (f"volume: {self.volume}\nrepeat: 0\nrandom: 0\nsingle: 0\nconsume: 0\n"
+             f"playlist: {self.playlist_version}\nplaylistlength: {len(self.queue)}\nmixrampdb: 0.000000\n"
+             f"state: {self.state}\n")
+        if self.current >= 0:
+            song = self.queue[self.current]
+            s += (f"song: {self.current}\nsongid: {song['Id']}\ntime: {int(self.position())}:{self.song_length}\n"
+                  f"elapsed: {self.position():.3f}\nbitrate: 320\nduration: {self.song_length:.3f}\naudio: 44100:24:2\n")
+            if self.current + 1 < len(self.queue):
+                s += f"nextsong: {self.current + 1}\nnextsongid: {self.queue[self.current + 1]['Id']}\n"
+        return s
+
+    def cmd_currentsong(self, *args) -> str:
+        return self.song_info(self.queue[self.current]) if self.current >= 0 else ""
+
+    def cmd_add(self, uri: str, pos: str = None) -> str:
+        paths = self.resolve(uri)
+        for i, path in enumerate(paths):
+            self.add(path, None if pos is None else int(pos) + i)
+        self.queue_changed()
+        return ""
+
+    def cmd_addid(self, uri: str, pos: str = None) -> str:
+        paths = self.resolve(uri)
+        if len(paths) != 1:
+            raise CommandError(2, "addid", "directories can't be added with addid")
+        song_id = self.add(paths[0], None if pos is None else int(pos))
+        self.queue_changed()
+        return f"Id: {song_id}\n"
+
+    def cmd_delete(self, arg: str) -> str:
+        start, end = parse_range(arg, len(self.queue))
+        if not 0 <= start < end <= len(self.queue):
+            raise CommandError(2, "delete", "Bad song index")
+        if start <= self.current < end:
+            self.state, self.current, self.elapsed = "stop", -1, 0.0
+            self.notify("player")
+        elif self.current >= end:
+            self.current -= end - start
+        del self.queue[start:end]
+        self.queue_changed()
+        return ""
+
+    def cmd_deleteid(self, song_id: str) -> str:
+        for pos, song in enumerate(self.queue):
+            if song["Id"] == int(song_id):
+                return self.cmd_delete(str(pos))
+        raise CommandError(50, "deleteid", "No such song")
+
+    def cmd_clear(self, *args) -> str:
+        self.queue = []
+        self.state, self.current, self.elapsed = "stop", -1, 0.0
+        self.queue_changed()
+        self.notify("player")
+        return ""
+
+    def cmd_playlistinfo(self, arg: str = None) -> str:
+        start, end = parse_range(arg, len(self.queue)) if arg else (0, len(self.queue))
+        return "".join(self.song_info(s) for s in self.queue[start:end])
+
+    def cmd_plchanges(self, version: str, arg: str = None) -> str:
+        start, end = parse_range(arg, len(self.queue)) if arg else (0, len(self.queue))
+        return "".join(self.song_info(s) for s in self.queue[start:end] if s["version"] > int(version))
+
+    def cmd_plchangesposid(self, version: str, arg: str = None) -> str:
+        start, end = parse_range(arg, len(self.queue)) if arg else (0, len(self.queue))
+        return "".join(f"cpos: {s['Pos']}\nId: {s['Id']}\n" for s in self.queue[start:end] if s["version"] > int(version))
+
+    def cmd_play(self, pos: str = "0") -> str:
+        self.start(int(pos))
+        return ""
+
+    def cmd_playid(self, song_id: str) -> str:
+        for pos, song in enumerate(self.queue):
+            if song["Id"] == int(song_id):
+                self.start(pos)
+                return ""
+        raise CommandError(50, "playid", "No such song")
+
+    def cmd_pause(self, arg: str = None) -> str:
+        if self.state == "stop":
+            return ""
+        pause = self.state == "play" if arg is None else arg == "1"
+        if pause and self.state == "play":
+            self.elapsed, self.state = self.position(), "pause"
+        elif not pause and self.state == "pause":
+            self.state, self.started_at = "play", self.clock()
+        self.notify("player")
+        return ""
+
+    def cmd_stop(self, *args) -> str:
+        self.state, self.elapsed = "stop", 0.0
+        self.current = -1 if not self.queue else self.current
+        self.notify("player")
+        return ""
+
+    def cmd_next(self, *args) -> str:
+        if self.state != "stop":
+            if self.current + 1 < len(self.queue):
+                self.start(self.current + 1)
+            else:  # NOTE like mpd there's no current song after running off the end
+                self.cmd_stop()
+                self.current = -1
+        return ""
+
+    def cmd_previous(self, *args) -> str:
+        if self.state != "stop":
+            self.start(max(self.current - 1, 0))
+        return ""
+
+    def cmd_seekcur(self, arg: str) -> str:
+        if self.current < 0:
+            raise CommandError(55, "seekcur", "Not playing")
+        target = self.position() + float(arg) if arg[0] in "+-" else float(arg)
+        self.elapsed, self.started_at = min(max(target, 0.0), float(self.song_length)), self.clock()
+        self.notify("player")
+        return ""
+
+    def cmd_setvol(self, vol: str) -> str:
+        self.volume = min(max(int(vol), 0), 100)
+        self.notify("mixer")
+        return ""
+
+    def cmd_volume(self, change: str) -> str:
+        return self.cmd_setvol(str(self.volume + int(change)))
+
+    def cmd_update(self, *args) -> str:
+        self.update_db()
+        self.notify("update", "database")
+        return "updating_db: 1\n"
+
+    def cmd_config(self, *args) -> str:
+        if not self.unix:
+            raise CommandError(4, "config", "Access denied")
+        return f"music_directory: {(self.music_directory or '').rstrip('/')}\n"
+
+    def cmd_ping(self, *args) -> str:
+        return ""
+
+    def cmd_stats(self, *args) -> str:
+        return f"songs: {len(self.database)}\nuptime: {int(self.clock())}\nplaytime: 0\n"
+
+    def run(self, args: list) -> str:
+        self.stats["commands"] += 1
+        func = getattr(self, f"cmd_{args[0]}", None)
+        if func is None:
+            raise CommandError(5, args[0], f'unknown command "{args[0]}"')
+        self.tick()
+        try:
+            return func(*args[1:])
+        except TypeError:
+            raise CommandError(2, args[0], "wrong number of arguments")
+        except ValueError:
+            raise CommandError(2, args[0], "bad argument")
+
+
+class Client():
+    """one connection. handles command lists and idle"""
+    def __init__(self, mpd: FakeMPD, reader, writer):
+        self.mpd = mpd
+        self.reader = reader
+        self.writer = writer
+        self.changes: set = set()
+        self.changed = asyncio.Event()
+
+    async def handle(self) -> None:
+        self.mpd.clients.append(self)
+        self.mpd.stats["connections"] += 1
+        self.writer.write(b"OK MPD 0.23.5\n")
+        command_list = None  # list of lines while inside command_list_begin
+        list_ok = False
+        try:
+            while True:
+                line = await self.reader.readline()
+                if not line:
+                    break
+                args = split_args(line.decode().rstrip("\n"))
+                if not args:
+                    continue
+                if args[0] in ["command_list_begin", "command_list_ok_begin"]:
+                    command_list, list_ok = [], args[0] == "command_list_ok_begin"
+                elif args[0] == "command_list_end":
+                    await self.reply_list(command_list or [], list_ok)
+                    command_list = None
+                elif command_list is not None:
+                    command_list.append(args)
+                elif args[0] == "noidle":
+                    continue  # not idling. mpd ignores it without a reply
+                elif args[0] == "idle":
+                    if not await self.idle(set(args[1:])):
+                        break
+                elif args[0] == "close":
+                    break
+                else:
+                    await self.reply_list([args], False)
+                await self.writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self.mpd.clients.remove(self)
+            self.writer.close()
+
+    async def reply_list(self, commands: list, list_ok: bool) -> None:
+        if self.mpd.latency:
+            await asyncio.sleep(self.mpd.latency)
+        out = ""
+        for i, args in enumerate(commands):
+            try:
+                out += self.mpd.run(args)
+            except CommandError as e:
+                out += f"ACK [{e.code}@{i}] {{{e.command}}} {e}\n"
+                self.writer.write(out.encode())
+                return
+            if list_ok:
+                out += "list_OK\n"
+        self.writer.write((out + "OK\n").encode())
+
+    async def idle(self, subsystems: set) -> bool:
+        """wait for changes or noidle. False if the client went away"""
+        read = asyncio.ensure_future(self.reader.readline())
+        while True:
+            wanted = self.changes & subsystems if subsystems else set(self.changes)
+            if wanted:
+                read.cancel()
+                try:
+                    await read  # let the cancel finish before the next readline()
+                except asyncio.CancelledError:
+                    pass
+                self.changes -= wanted
+                self.writer.write(("".join(f"changed: {s}\n" for s in sorted(wanted)) + "OK\n").encode())
+                return True
+            self.changed.clear()
+            wait = asyncio.ensure_future(self.changed.wait())
+            done, _ = await asyncio.wait([read, wait], return_when=asyncio.FIRST_COMPLETED)
+            if read in done:
+                wait.cancel()
+                line = read.result()
+                if not line:
+                    return False
+                self.writer.write(b"OK\n")  # noidle (anything else is an error in real mpd too)
+                return True
+
+
+class FakeMPDServer():
+    """runs a FakeMPD on a unix socket (or tcp when path is None) in a background thread.
+    use as a context manager:
+        with FakeMPDServer("/tmp/mpd.sock", music_directory="/tmp/music") as server:
+            backend.settings = {"address": server.address, "port": server.port}
+    """
+    def __init__(self, path: str = None, host: str = "127.0.0.1", port: int = 0, **kwargs):
+        self.path = path
+        self.host = host
+        self.port = port
+        self.mpd = FakeMPD(unix=path is not None, **kwargs)
+        self.loop = None
+        self.server = None
+        self.thread = None
+        self.ready = threading.Event()
+
+    @property
+    def address(self) -> str:
+        return self.path if self.path else self.host
+
+    async def start_async(self) -> None:
+        """start on the running loop"""
+        async def on_connect(reader, writer):
+            await Client(self.mpd, reader, writer).handle()
+        if self.path:
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            self.server = await asyncio.start_unix_server(on_connect, self.path)
+        else:
+            self.server = await asyncio.start_server(on_connect, self.host, self.port)
+            self.port = self.server.sockets[0].getsockname()[1]
+
+    async def stop_async(self) -> None:
+        self.server.close()
+        for c in list(self.mpd.clients):
+            c.writer.close()
+        await self.server.wait_closed()
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+
+    def start(self) -> "FakeMPDServer":
+        def run():
+            self.loop = asyncio.new_event_loop()
+            self.loop.run_until_complete(self.start_async())
+            self.ready.set()
+            self.loop.run_forever()
+            self.loop.run_until_complete(self.stop_async())
+            self.loop.close()
+        self.thread = threading.Thread(target=run, name="fake-mpd", daemon=True)
+        self.thread.start()
+        self.ready.wait()
+        return self
+
+    def stop(self) -> None:
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+
+    def call(self, func: callable, *args):
+        """run func(*args) on the server's loop. for poking at the state from another thread"""
+        done = threading.Event()
+        result = []
+
+        def run():
+            result.append(func(*args))
+            done.set()
+        self.loop.call_soon_threadsafe(run)
+        done.wait()
+        return result[0]
+
+    def __enter__(self) -> "FakeMPDServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="stand-in mpd server")
+    parser.add_argument("--socket", help="unix socket path. tcp on --port if not given")
+    parser.add_argument("--port", type=int, default=6600)
+    parser.add_argument("--music-dir", help="folder served as the database")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds to wait before every reply")
+    parser.add_argument("--song-length", type=int, default=180)
+    a = parser.parse_args()
+    server = FakeMPDServer(a.socket, port=a.port, music_directory=a.music_dir, latency=a.latency, song_length=a.song_length)
+
+    async def main():
+        await server.start_async()
+        print(f"fake mpd listening on {server.address}{'' if a.socket else f':{server.port}'}")
+        await asyncio.Event().wait()
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,74 @@
+# client side play order. the server's queue only ever holds the current song and the next few (see "queue_window")
+# and is topped up from here as songs finish, so huge folders and playlists never end up in the server
+import collections
+import random
+
+
+class PlayOrder():
+    """order to play songs in, with repeat and shuffle. O(1) per song however long the list is.
+    shuffle is a Fisher-Yates shuffle done one song at a time. only the swapped positions are stored"""
+    def __init__(self, songs: list, start: int = 0, repeat: bool = False, shuffle: bool = False):
+        self.songs = songs  # full paths. may be added to while playing
+        self.repeat = repeat
+        self.shuffle = shuffle
+        self.swaps: dict = {}  # position in this round: index into songs. only for positions the shuffle moved
+        self.pos = start  # next position in this round
+        self.fixed = False  # next position is already decided. the song that was picked is played first
+        if shuffle:  # picked song first, then the whole list shuffled. songs before it included
+            self.swaps = {0: start, start: 0} if start else {}
+            self.pos, self.fixed = 0, True
+        self.last = start  # index of the last song taken. list order carries on after it when shuffle is turned off
+        self.undo: collections.deque = collections.deque(maxlen=1000)  # for unread()
+
+    def take(self, n: int) -> list:
+        """the next n songs. fewer once the end is reached without repeat"""
+        out = []
+        while len(out) < n and self.songs:
+            if self.pos >= len(self.songs):
+                if not self.repeat:
+                    break
+                self.pos, self.swaps = 0, {}  # next round. reshuffled when shuffling
+                self.undo.clear()
+            undo = (self.pos, self.last, None)
+            if self.shuffle and not self.fixed:
+                j = random.randrange(self.pos, len(self.songs))
+                undo = (self.pos, self.last, (j, self.swaps.get(self.pos), self.swaps.get(j)))
+                self.swaps[self.pos], self.swaps[j] = self.swaps.get(j, j), self.swaps.get(self.pos, self.pos)
+            self.fixed = False
+            self.last = self.swaps.get(self.pos, self.pos)
+            self.pos += 1
+            self.undo.append(undo)
+            out.append(self.songs[self.last])
+        return out
+
+    def unread(self, n: int) -> int:
+        """put the last n songs taken back as if they had never been taken. returns how many could be
+        (none from before the last wrap around or mode change)"""
+        count = 0
+        while count < n and self.undo:
+            pos, last, swap = self.undo.pop()
+            if swap:
+                j, a, b = swap
+                for key, value in ((j, b), (pos, a)):
+                    if value is None:
+                        self.swaps.pop(key, None)
+                    else:
+                        self.swaps[key] = value
+            self.pos, self.last = pos, last
+            count += 1
+        return count
+
+    def set_modes(self, repeat: bool, shuffle: bool) -> None:
+        self.repeat = repeat
+        if shuffle == self.shuffle:
+            return
+        self.shuffle = shuffle
+        if not shuffle:  # carry on in list order after the last song
+            self.pos, self.swaps = self.last + 1, {}
+        # NOTE turning shuffle on shuffles what's left of this round as it's taken. nothing to do here
+        self.fixed = False
+        self.undo.clear()
+
+    def done(self) -> bool:
+        """nothing left to take"""
+        return not self.repeat and self.pos >= len(self.songs)
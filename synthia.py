@@ -1,25 +1,30 @@
 #!/usr/bin/env python3
-from functools import partial
-import itertools
+# NOTE only what's needed to draw the first frame is imported up here. the rest is imported after it
+import time
+start_time: float = time.perf_counter()
 import json
-import math
 import os
-import signal
-import subprocess
+import shutil
 import sys
-import termios
-import threading
-
-import setproctitle
-import wcwidth
 
 import utils
 
 
+startup_phases: dict = {}  # phase name: seconds since start. shown on exit with --profile-startup
+
+
+def startup_phase(name: str) -> None:
+    startup_phases.setdefault(name, time.perf_counter() - start_time)
+
+
 if len(sys.argv) > 1 and sys.argv[1] in ["h", "-h", "help", "-help", "--help"]:
     print("""SYNTHIA HELP SCREEN:
 args:
     -h, --help:     shows this screen
+    --profile-startup: print how long each part of startup took when quitting
+    --record FILE:  write every key pressed and when to FILE. python -m benchmarks.replay FILE plays it back headless
+    --daemon:       run headless. holds the server connection(s) and shares the status with every synthia
+                    started while it's running (see "use_daemon" in settings)
 
 keybinds:
     q:              quit
@@ -28,11 +33,20 @@ keybinds:
     b/n:            previous/next song
     ,/.:            volume up/down
     enter:          enter folder/add song and all songs after it in folder to queue
+    p:              play the selected folder and everything under it (the current folder if a song is selected)
+                    in the queue: play the selected song
+    tab:            switch between the files and the play queue (mpd only)
     left/right:     seek +/-2 seconds
     up/down:        scroll song list
     pgup/pgdn:      scroll song list by 10
     m:              cycle sort mode
     M:              toggle sort reverse mode
+    g:              go to the folder of the playing song with the cursor on it
+    r:              toggle repeat (start over from the top of the folder/playlist at the end)
+    x:              toggle shuffle
+    z:              switch zone (see "zones" in settings)
+    Z:              send commands and songs to every zone at once
+    F5:             toggle stats overlay (needs "instrument": true in settings)
 
 backends:
     mocp (mocp is currently broken on my computer)
@@ -46,69 +60,161 @@ notes:
 TODO:
     make keybinds a config file
     home end keys to go to top and bottom of folder
-    add songs before cursor to end of playlist or add repeat option
-    add more info to status bar like volume, repeat, shuffle
+    add more info to status bar
     path to config file cmd arg""")
     sys.exit(0)
+if "--record" in sys.argv and (sys.argv + ["--"])[sys.argv.index("--record") + 1].startswith("--"):  # no file name after it
+    print("Error: --record needs a file to write the keys to. e.g. synthia --record keys.jsonl")
+    sys.exit(1)
 
 
 # Misc global variables
 u_esc: str = "\x1b["  # no backslashes in f strings
 invt_clr: str = "\x1b[7m"  # move to UI?
+wcswidth: callable = len  # wcwidth takes a while to import. swapped for wcwidth.wcswidth by load_in_background()
+
+
+# TODO should this be function called in main?
+config: dict = {  # default config values that don't rely on any other code for their definition
+    "backend": None,  # options: "mocp", "xmms2", "mpd"
+    "update_rate": 1,  # seconds
+    "volume": 50,  # 0-100%  # currently unused
+    "starting_folder": utils.home_dir,
+    "sort_mode": "name",  # options: "name", "time", and "size"
+    "sort_reversed": False,  # options: True, False
+    "main_clr": "32",  # these colors are ansi colors in the format "\u001b[foreground_color;background_color"
+    "dir_clr": "31",  # https://gist.github.com/fnky/458719343aabd01cfb17a3a4f7296797#color-codes
+    "file_clr": "32",
+    "m3u8_clr": "34",
+    "bg_clr": "40",  # background color uses the background color code
+    "misc_clr": "36",
+    "mocp_settings": {},
+    "main_loop": "threads",  # options: "threads", "asyncio"
+    "command_timeout": 5,  # seconds a backend command may take (including retries) before it's given up on
+    # music_directory: mpd's music_directory. asked from the server if left empty (only works over unix socket)
+    "mpd_settings": {"address": "localhost", "port": 6600, "music_directory": ""},  # TODO written in 3 places. simplify
+    "xmms2_settings": {"address": ""},
+    # several servers of the same backend. one per room etc. each entry is laid over <backend>_settings
+    # e.g. [{"name": "kitchen", "port": 6600}, {"name": "bedroom", "address": "bedroom.local"}]. empty means one server
+    # NOTE only "main_loop": "asyncio" keeps a connection open per zone. with "threads" every command still connects
+    "zones": [],
+    "use_daemon": True,  # attach to a running synthia --daemon instead of talking to the server directly
+    "daemon_socket": f"{utils.home_dir}synthia/daemon.sock",
+    "instrument": False,  # record latency histograms of the hot paths. F5 shows them, SIGUSR1 and quitting write them out
+    "stats_file": f"{utils.home_dir}synthia/stats.json",
+    "log_level": "info",  # options: "debug", "info", "warning", "error", "off"
+    "log_max_bytes": 1048576,  # test.log is rotated to test.log.1 past this size
+    "restore_session": True,  # start where the last session left off instead of at starting_folder
+    "session_file": f"{utils.home_dir}synthia/session.json",
+    "session_save_rate": 30,  # seconds
+    "scan_workers": 8,  # threads reading folders at once when playing a whole tree with p
+    "tag_columns": False,  # title, artist and length columns in the list. needs mutagen
+    "tag_workers": 4,  # threads reading tags
+    "tag_cache_file": f"{utils.home_dir}synthia/tags.json",
+    # songs kept in the server's queue (the current one and the ones after it). the rest are added as songs finish
+    # so huge folders and playlists never end up in the server. 0 queues everything at once. mpd only
+    "queue_window": 10,
+    "repeat": False,
+    "shuffle": False,
+    "listing_cache_size": 16  # folder listings kept to go back to without reading the folder again
+    # TODO volume seek and scroll to home/end
+}
+
+# parse config file. NOTE This has to be done here because other bits of code rely on this happening before main
+if os.path.exists(f"{utils.home_dir}synthia/synthia_settings.json"):
+    with open(f"{utils.home_dir}synthia/synthia_settings.json", "r") as f:
+        temp_dict: dict = json.load(f)
+    for k in temp_dict.keys():
+        if k in config.keys():
+            config[k] = temp_dict[k]
+
+utils.start_logging(config["log_level"], max_bytes=config["log_max_bytes"])
+
+
+def draw_skeleton() -> None:
+    """empty frame drawn before anything slow is imported. UI.draw_list() paints over it once it's ready"""
+    w, h = shutil.get_terminal_size()
+    h -= 1  # same as UI.scrn_size
+    clr = u_esc + config["main_clr"] + "m"
+    zone_rows = len(config["zones"]) if len(config["zones"]) > 1 else 0  # same as UI.zone_rows
+    print(f"\x1b[2J\x1b[H\x1b[?25l{clr}┌─┤SYNTHIA├{'─' * (w - 12)}┐", end="")
+    for row in range(2, h + 1):
+        if row in [h - 3 - zone_rows, h]:
+            line = f"├{'─' * (w - 2)}┤"
+        elif row == h - 2:
+            line = f"│LOADING...{' ' * (w - 12)}│"
+        else:
+            line = f"│{' ' * (w - 2)}│"
+        print(f"\x1b[{row};0H{line}", end="")
+    print(f"\x1b[{h + 1};0H└{'─' * (w - 2)}┘", end="", flush=True)
+
+
+if __name__ == "__main__" and "--daemon" not in sys.argv:
+    draw_skeleton()
+startup_phase("first paint")
+
+# everything below here is only needed after the first frame is on screen
+import asyncio
+import atexit
+from concurrent.futures import Future
+from functools import partial
+import itertools
+import math
+import queue
+import signal
+import subprocess
+import threading
+
+from backends.base import blank_status, queue_mirror
+from backends.dispatcher import Dispatcher
+from playorder import PlayOrder
+from tags import TagReader
+import term
+startup_phase("imports")
 
 
 # Functions
 def sig_handler(sig, frame):
     if sig == signal.SIGINT:
         timer.cancel()
+        session_timer.cancel()
+        for zone in zones:
+            zone.dispatcher.stop()
+        if recorder:
+            recorder.close()
+        tag_reader.stop()
         print("\x1b[2J\x1b[H\x1b[?25h", end="")
+        save_session()
+        write_stats()
         sys.exit(0)
     elif sig == signal.SIGWINCH:
-        old_scrn_h = UI.scrn_size[1]
-        UI.scrn_size = list(os.get_terminal_size())  # TODO minimum size?
-        UI.scrn_size[1] -= 1
-        UI.list_slice[1] = UI.list_slice[1] - (old_scrn_h - UI.scrn_size[1])
-        UI.draw_list()
-        UI.draw_status_bar()
+        resize()
+    elif sig == signal.SIGUSR1:
+        write_stats()
 
 
-def getch(blocking: bool = True, bytes_to_read: int = 1) -> str:
-    fd = sys.stdin.fileno()
-    old_settings = termios.tcgetattr(fd)
-    new = list(old_settings)
-    new[3] &= ~(termios.ICANON | termios.ECHO)
-    new[6][termios.VMIN] = 1 if blocking else 0
-    new[6][termios.VTIME] = 0  # 0 is faster but inputs appear on screen?
-    termios.tcsetattr(fd, termios.TCSADRAIN, new)
-    try:
-        ch = sys.stdin.read(bytes_to_read)
-    finally:
-        termios.tcsetattr(fd, termios.TCSADRAIN, old_settings)
-    return ch
+def write_stats() -> None:
+    """dump latency histograms and counters to stats_file. kill -USR1 <pid> to get them while running"""
+    if utils.stats_enabled:
+        try:
+            utils.dump_stats(config["stats_file"])
+        except OSError as e:
+            utils.log(f"couldn't write stats: {e}", utils.ERROR)
 
 
-esc_chars = {"[A": "up", "[B": "dn", "[C": "rt", "[D": "lf", "[F": "end", "[H": "home", "[[A": "F1",
-             "[[B": "F2", "[[C": "F3", "OS": "F4", "[Z": "shft+tb", "[5~": "pgup", "[6~": "pgdn",  # "OR": "F3"
-             "[15~": "F5", "[17~": "F6", "[18~": "F7", "[19~": "F8", "[20~": "F9", "[21~": "F10",
-             "[23~": "F11", "[24~": "F12"}  # TODO fix more F keys
+def resize() -> None:
+    old_scrn_h = UI.scrn_size[1]
+    UI.scrn_size = list(shutil.get_terminal_size())  # TODO minimum size?
+    UI.scrn_size[1] -= 1
+    UI.list_slice[1] = UI.list_slice[1] - (old_scrn_h - UI.scrn_size[1])
+    UI.draw_list()
+    UI.draw_status_bar()
 
 
-def handle_esc() -> str:  # TODO only using keys with length 3?
-    """https://en.wikipedia.org/wiki/ANSI_escape_code
-    I don't know if this holds across all computers/keyboards
-    or if my setup just weird?
-    BUG: holding down key that uses less than 4 esc chars will capture
-    first char of next sequence early so next characters are captured as plain text"""
-    a = getch(False, 4)
-    if a in esc_chars.keys():
-        # utils.log("key: " + a)
-        return esc_chars[a]
-    elif a == "":
-        return "esc"
-    # utils.log("failed " + a)
-    return ""
+song_exts: list = [".aac", "flac", ".mp3", "m3u8", ".m4a", ".ogg", ".oga", ".wav", ".wma"]  # last 4 characters
 
 
+@utils.timed()
 def folder_sort(folder: str, sort_mode: str, reverse: bool = False) -> list:
     """Get files, sort them, filter only audio files"""
     do_sort = False if sort_mode == "name" else True
@@ -120,20 +226,20 @@ def folder_sort(folder: str, sort_mode: str, reverse: bool = False) -> list:
     for i, f in enumerate(files):
         if f[-1] == "/":
             continue
-        elif f[-4:] not in [".aac", "flac", ".mp3", "m3u8", ".m4a", ".ogg", ".oga", ".wav", ".wma"]:
+        elif f[-4:] not in song_exts:
             to_remove.append(f)
     for r in to_remove:
         files.remove(r)
     files.insert(0, "../")
-    print("\x1b[2J\x1b[H")  # NOTE why is this here?
     return files
 
 
+@utils.timed()
 def open_m3u8(file: str) -> list:
     """Open m3u8 playlist file and pretend its a folder
     https://en.wikipedia.org/wiki/M3U
     """
-    utils.log("WARNING: parsing m3u8. make sure this is from a trusted source. this program has no security against injection attacks")
+    utils.log("parsing m3u8. make sure this is from a trusted source. this program has no security against injection attacks", utils.WARNING)
     with open(file, "r") as pl:
         files: list = ["../"]
         for line in pl.readlines():
@@ -142,88 +248,538 @@ def open_m3u8(file: str) -> list:
                 if os.path.isfile(line2):  # check if file is valid. don't forget to strip \n
                     files.append(line2)
                 else:
-                    utils.log(f"{line2} is not a valid file path")
+                    utils.log(f"{line2} is not a valid file path", utils.WARNING)
     return files
 
 
-def add_songs_to_queue_and_play(songs: list, start_pos: int, folder: str) -> None:
-    """not sure how to explain why I'm doing it like this"""
-    # TODO mocp fix first song not playing until done. make this function a background thread (threading or multiprocessing?) kill thread with sig handler for clean socket writing
-    # if "STOP" not in UI.current_song_info["State"]:
-    if config["backend"] != "mocp" or "STOP" not in UI.current_song_info["State"]:  # handle mocp crash when sending stop while stopped
-        backend.stop()  # stop currently playing and clear queue
-    for s in songs[start_pos:]:  # TODO loop around. len(list) = 10. list[5:] + list[:5] etc. how to get 5?
-        if s[-1] != "/" and s[-4:] != "m3u8":
-            # utils.log(f"song path: {folder + s}")
-            backend.enqueue(folder + s)
+@utils.timed()
+def scan_folder(folder: str, sort_mode: str, reverse: bool = False) -> tuple:
+    """(subfolders, songs) in folder as full paths, sorted like folder_sort sorts them.
+    m3u8 files are opened and their songs put in their place. safe to call from any thread"""
+    dirs, files = [], []
+    with os.scandir(folder) as it:
+        for e in it:
+            try:
+                if e.is_dir():
+                    dirs.append(e)
+                elif e.name[-4:] in song_exts:
+                    files.append(e)
+            except OSError:  # NOTE vanished or broken link
+                continue
+
+    def key(e):
+        # NOTE casefold is close to but not exactly ls's en_US collation
+        if sort_mode == "size":
+            return (-e.stat().st_size, e.name.casefold())
+        if sort_mode == "time":
+            return (-e.stat().st_mtime, e.name.casefold())
+        return e.name.casefold()
+    try:
+        dirs.sort(key=key, reverse=reverse)
+        files.sort(key=key, reverse=reverse)
+    except OSError:  # stat failed. keep the name order
+        dirs.sort(key=lambda e: e.name.casefold(), reverse=reverse)
+        files.sort(key=lambda e: e.name.casefold(), reverse=reverse)
+    songs = []
+    for f in files:
+        if f.name[-4:] == "m3u8":
+            songs += open_m3u8(f.path)[1:]
+        else:
+            songs.append(f.path)
+    return [d.path + "/" for d in dirs], songs
+
+
+def walk_tree(root: str, sort_mode: str, reverse: bool = False, workers: int = 8):
+    """yields the songs under root one folder at a time, in the order the list shows them (subfolders first).
+    every subfolder is handed to a pool of workers as soon as its parent has been read so folders are read
+    in parallel, but they are yielded strictly in order. the pool always reads the folder needed soonest first"""
+    jobs: queue.PriorityQueue = queue.PriorityQueue()  # (position in the walk, folder, future)
+
+    def work() -> None:
+        while True:
+            _, folder, future = jobs.get()
+            if folder is None:
+                return
+            try:
+                future.set_result(scan_folder(folder, sort_mode, reverse))
+            except Exception as e:  # NOTE unreadable folder or a broken m3u8 in it
+                future.set_exception(e)
+
+    def submit(pos: tuple, folder: str) -> tuple:
+        future: Future = Future()
+        jobs.put((pos, folder, future))
+        return pos, future
+
+    for _ in range(workers):
+        threading.Thread(target=work, name="synthia-scan", daemon=True).start()
+    try:
+        stack: list = [submit((0,), root)]  # (position, future) still to read and song lists ready to go
+        while stack:
+            item = stack.pop()
+            if isinstance(item, list):
+                if item:
+                    yield item
+                continue
+            pos, future = item
+            try:
+                dirs, songs = future.result()
+            except Exception as e:
+                utils.log(f"can't read folder: {e}", utils.WARNING)
+                continue
+            stack.append(songs)  # after every subfolder
+            stack += [submit(pos + (i,), d) for i, d in reversed(list(enumerate(dirs)))]
+    finally:
+        for _ in range(workers):
+            jobs.put(((), None, None))  # () sorts before every folder so workers stop before reading anything else
+
+
+def songs_to_queue(songs: list, start_pos: int, folder: str) -> tuple:
+    """full paths of the files from start_pos on, and whether the backend may add the whole folder itself.
+    that only gives the same result when the song list is exactly the folder in the server's (name) order"""
+    paths = [folder + s for s in songs[start_pos:] if s[-1] != "/" and s[-4:] != "m3u8"]
+    whole_folder = (folder != "" and UI.sort_mode == "name" and not UI.sort_reversed
+                    and all(s[-1] != "/" and s[-4:] != "m3u8" for s in songs[max(start_pos, 1):])
+                    and all(s == "../" for s in songs[:start_pos]))
+    return paths, whole_folder
+
+
+# what to send the backend for a play, a tree or a top up is written once as steps: a generator that yields
+# the backend calls it needs as (method name, *args) and is sent back each result. run_steps() runs them on
+# a dispatcher thread, run_steps_async() on the event loop. on_zone() picks whichever the main loop uses
+def run_steps(steps: callable, zone, backend, *args):
+    """run steps(zone, backend, *args) against a blocking backend. returns what the steps return"""
+    gen = steps(zone, backend, *args)  # NOTE made here so a retry starts over instead of half way through
+    result = None
+    while True:
+        try:
+            name, *call_args = gen.send(result)
+        except StopIteration as e:
+            return e.value
+        result = getattr(backend, name)(*call_args)
 
-    backend.start_queue()
 
+async def run_steps_async(steps: callable, zone, abackend, *args):
+    """run_steps for asyncio backends"""
+    gen = steps(zone, abackend, *args)
+    result = None
+    while True:
+        try:
+            name, *call_args = gen.send(result)
+        except StopIteration as e:
+            return e.value
+        result = await getattr(abackend, name)(*call_args)
 
-# TODO should this be function called in main?
-config: dict = {  # default config values that don't rely on any other code for their definition
-    "backend": None,  # options: "mocp", "xmms2", "mpd"
-    "update_rate": 1,  # seconds
-    "volume": 50,  # 0-100%  # currently unused
-    "starting_folder": utils.home_dir,
-    "sort_mode": "name",  # options: "name", "time", and "size"
-    "sort_reversed": False,  # options: True, False
-    "main_clr": "32",  # these colors are ansi colors in the format "\u001b[foreground_color;background_color"
-    "dir_clr": "31",  # https://gist.github.com/fnky/458719343aabd01cfb17a3a4f7296797#color-codes
-    "file_clr": "32",
-    "m3u8_clr": "34",
-    "bg_clr": "40",  # background color uses the background color code
-    "misc_clr": "36",
-    "mocp_settings": {},
-    "mpd_settings": {"address": "localhost", "port": 6600},  # TODO written in 3 places. simplify
-    "xmms2_settings": {"address": ""}
-    # TODO volume seek and scroll to home/end
-}
 
-# parse config file. NOTE This has to be done here because other bits of code rely on this happening before main
-if os.path.exists(f"{utils.home_dir}synthia/synthia_settings.json"):
-    with open(f"{utils.home_dir}synthia/synthia_settings.json", "r") as f:
-        temp_dict: dict = json.load(f)
-    for k in temp_dict.keys():
-        if k in config.keys():
-            config[k] = temp_dict[k]
+event_loop = None  # main_async()'s loop while it's running
+
+
+async def tracked(coro):
+    """run_in_background() for coroutines handed to the loop from other threads"""
+    task = asyncio.current_task()
+    background_tasks.add(task)
+    try:
+        return await coro
+    finally:
+        background_tasks.discard(task)
+
+
+def on_zone(zone, steps: callable, *args, timeout: float = None, retries: int = None):
+    """run steps(zone, backend, *args) on zone without waiting. on its dispatcher thread, or on the event loop
+    with "main_loop": "asyncio" where zone.feed_lock keeps them from interleaving like the dispatcher does.
+    returns a Future. a Task when called on the event loop"""
+    if config["main_loop"] != "asyncio":
+        return zone.dispatcher.submit(run_steps, steps, zone, zone.backend, *args, timeout=timeout, retries=retries)
+
+    async def run():
+        async with zone.feed_lock:
+            return await run_steps_async(steps, zone, zone.abackend, *args)
+    coro = call_backend(zone, run, timeout=timeout, retries=3 if retries is None else retries)
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:  # another thread. e.g. feed_tree()
+        if event_loop is None:  # quitting
+            coro.close()
+            future: Future = Future()
+            future.cancel()
+            return future
+        return asyncio.run_coroutine_threadsafe(tracked(coro), event_loop)
+    return run_in_background(coro)
+
+
+def backend_call(zone, backend, name: str, *args):
+    """steps for a single backend call"""
+    return (yield (name, *args))
+
+
+def add_songs_to_queue_and_play(zone, backend, songs: list, start_pos: int, folder: str):
+    """not sure how to explain why I'm doing it like this. steps, see run_steps()"""
+    # TODO mocp fix first song not playing until done.
+    # if "STOP" not in UI.current_song_info["State"]:
+    zone.feed, zone.feed_version = None, None
+    if config["backend"] != "mocp" or "STOP" not in zone.status["State"]:  # handle mocp crash when sending stop while stopped
+        yield ("stop",)  # stop currently playing and clear queue
+    if windowed(backend):
+        zone.feed = play_order(songs, start_pos, folder)
+        yield ("enqueue_many", zone.feed.take(config["queue_window"]))
+    else:
+        paths, whole_folder = songs_to_queue(songs, start_pos, folder)
+        if not (whole_folder and backend.supports("enqueue_folder") and (yield ("enqueue_folder", folder))):
+            yield ("enqueue_many", paths)
+
+    yield ("start_queue",)
+    if zone.feed is not None:
+        yield from own_queue(zone)
+
+
+def windowed(backend) -> bool:
+    """whether songs go to backend's queue a few at a time from a PlayOrder (see "queue_window")"""
+    return config["queue_window"] > 0 and backend.supports("delete_range")
+
+
+def play_order(songs: list, start_pos: int, folder: str) -> PlayOrder:
+    """every song in the listing, starting at the one at start_pos. repeat goes round to the ones before it"""
+    return PlayOrder(song_paths(songs, folder), len(song_paths(songs[:start_pos], folder)), UI.repeat, UI.shuffle)
+
+
+def own_queue(zone):
+    """remember the version zone's feed left the server's queue at. steps, see run_steps()"""
+    info = yield ("sync",)
+    zone.feed_version = info["QueueVersion"] if info else None
+
+
+def needs_top_up(zone) -> bool:
+    """whether zone's server queue has played songs at the front, is short of the window, ran off the end of it
+    or was changed by someone else. no server commands"""
+    if zone.feed is None:
+        return False
+    if zone.feed_version and zone.status["QueueVersion"] != zone.feed_version:  # top_up() checks whose it is
+        return True
+    pos, length = int(zone.status["QueuePos"]), int(zone.status["QueueLength"])
+    if pos < 0:
+        return zone.status["State"] == "STOP" and not zone.feed.done()
+    return pos > 0 or (pos == 0 and length < config["queue_window"] and not zone.feed.done())
+
+
+def top_up(zone, backend, reorder: bool = False):
+    """delete the songs before the current one from zone's queue and add the next ones from zone.feed
+    so there are "queue_window" songs in it. reorder takes back the queued ones first so
+    a repeat or shuffle change takes effect from the next song instead of after the window. steps, see run_steps()"""
+    feed = zone.feed
+    if feed is None:
+        return
+    info = yield ("sync",)
+    if not info:
+        return
+    if zone.feed_version and info["QueueVersion"] != zone.feed_version:  # replaced by another client or the daemon
+        if zone.feed is feed:
+            zone.feed = None
+        return
+    pos, length = int(info["QueuePos"]), int(info["QueueLength"])
+    if pos < 0:  # NOTE not playing
+        if info["State"] != "STOP" or feed.done():
+            return
+        # played off the end of the window. e.g. n on the last song. start again with the next ones
+        if reorder:
+            feed.set_modes(UI.repeat, UI.shuffle)
+        if length:
+            yield ("delete_range", 0, length)
+        yield ("enqueue_many", feed.take(config["queue_window"]))
+        yield ("start_queue",)
+        yield from own_queue(zone)
+        return
+    ahead = length - pos - 1
+    if reorder:
+        back = feed.unread(ahead)
+        if back:
+            yield ("delete_range", length - back, length)
+        ahead -= back
+        feed.set_modes(UI.repeat, UI.shuffle)
+    if pos > 0:
+        yield ("delete_range", 0, pos)
+    songs = feed.take(config["queue_window"] - 1 - ahead)
+    if songs:
+        yield ("enqueue_many", songs)
+    if reorder or pos > 0 or songs:
+        yield from own_queue(zone)
+
+
+def request_top_up(zone, reorder: bool = False) -> None:
+    """top_up() without waiting on the server. skipped if one is already on its way unless reordering"""
+    if not reorder and zone.feed_future is not None and not zone.feed_future.done():
+        return
+    zone.feed_future = on_zone(zone, top_up, reorder, retries=0)
+
+
+def stop() -> None:
+    """stop and clear the queue. songs that were still to be fed to it are dropped too"""
+    global tree_generation
+    tree_generation += 1  # and a tree still being walked stops adding them
+    for zone in UI.targets():
+        zone.feed = None  # NOTE so no new top up is asked for. stop_zone() clears it again once it has the zone
+        if zone.feed_future is not None:
+            zone.feed_future.cancel()  # a top up still waiting or running would put songs back
+        on_zone(zone, stop_zone)
+
+
+def stop_zone(zone, backend):
+    """stop and clear zone's queue. holds zone.feed_lock (asyncio) or the dispatcher thread so a top up
+    can't add songs between clearing the feed and clearing the queue. steps, see run_steps()"""
+    zone.feed, zone.feed_version = None, None
+    yield ("stop",)
+
+
+def play(songs: list, start_pos: int, folder: str) -> None:
+    """queue songs and start playing without waiting on the server.
+    with all zones on every zone gets them at the same time, each on its own connection"""
+    global tree_generation
+    tree_generation += 1  # stop adding a tree that is still being walked
+    for zone in UI.targets():
+        # NOTE one long job. no retries since retrying half way through would queue songs twice
+        on_zone(zone, add_songs_to_queue_and_play, songs, start_pos, folder, timeout=60, retries=0)
+
+
+tree_generation: int = 0  # bumped by every play and stop so an older tree still being walked stops adding songs
+
+
+def play_tree(folder: str) -> None:
+    """play every song under folder. playback starts as soon as the first folder with songs in it has been read,
+    the rest are added to the end of the queue as the walk finds them"""
+    global tree_generation
+    tree_generation += 1
+    threading.Thread(target=feed_tree, args=(folder, UI.targets(), tree_generation), name="synthia-tree", daemon=True).start()
+
+
+def feed_tree(folder: str, targets: list, generation: int) -> None:
+    """walk folder once and feed every target zone a folder at a time. runs on its own thread with either main loop.
+    waits for each batch to be queued before sending the next so the dispatchers' queues never fill up"""
+    for zone in targets:
+        zone.feed = None  # NOTE or the last play's songs get topped up until the first batch is in
+        if config["backend"] != "mocp" or "STOP" not in zone.status["State"]:  # handle mocp crash when sending stop while stopped
+            on_zone(zone, backend_call, "stop")
+    started = False
+    tree = walk_tree(folder, UI.sort_mode, UI.sort_reversed, config["scan_workers"])
+    try:
+        for songs in tree:
+            if generation != tree_generation:
+                break
+            futures = [on_zone(zone, add_batch, songs, not started, timeout=60, retries=0) for zone in targets]
+            started = True
+            for future in futures:
+                try:
+                    future.result()
+                except Exception as e:
+                    if not future.cancelled():  # NOTE cancelled when quitting
+                        utils.log(f"play tree: {e}", utils.WARNING)
+    finally:
+        tree.close()
+
+
+def add_batch(zone, backend, songs: list, first: bool):
+    """one folder of a tree. straight into zone's queue, or into zone.feed with just a window of it queued.
+    the first one starts playing. steps, see run_steps()"""
+    if not windowed(backend):
+        yield ("enqueue_many", songs)
+    elif first:
+        zone.feed, zone.feed_version = PlayOrder(list(songs), 0, UI.repeat, UI.shuffle), None
+        yield ("enqueue_many", zone.feed.take(config["queue_window"]))
+    elif zone.feed:
+        zone.feed.songs.extend(songs)  # NOTE the next sync tops the queue up if the window isn't full
+    if first:
+        yield ("start_queue",)
+        if zone.feed is not None:
+            yield from own_queue(zone)
+
+
+def play_at(zone, pos: int) -> None:
+    """jump to pos in zone's queue without waiting on the server"""
+    if config["main_loop"] == "asyncio":
+        run_in_background(call_backend(zone, zone.abackend.play_at, pos))
+    else:
+        zone.dispatcher.submit(zone.backend.play_at, pos)
+
+
+daemon_conn = None  # connection to synthia --daemon when attached to one
+if "--daemon" in sys.argv:
+    config["main_loop"] = "asyncio"  # the daemon keeps one persistent connection per zone on an event loop
+elif config["use_daemon"]:
+    from backends.daemon import attach
+    daemon_conn = attach(config["daemon_socket"])  # None if no daemon is running
+    if daemon_conn:
+        config["main_loop"] = "threads"  # NOTE the thin client backend only comes in the threaded flavour
 
 # TODO start server if it isn't running?
-if config["backend"] == "mocp":
-    from backends.mocp import mocp_backend
-    backend = mocp_backend()
-    backend.settings = config["mocp_settings"]
+if daemon_conn:
+    from backends.daemon import daemon_backend as backend_class
+elif config["backend"] == "mocp":
+    from backends.mocp import mocp_backend as backend_class
 elif config["backend"] == "mpd":
-    from backends.mpd import mpd_backend
-    backend = mpd_backend()
-    backend.settings = config["mpd_settings"]
-    backend.update()  # NOTE server doesn't do this automatically if not running
+    from backends.mpd import mpd_backend as backend_class
 elif config["backend"] == "xmms2":
-    from backends.xmms2 import xmms2_backend
-    backend = xmms2_backend()
-    backend.settings = config["xmms2_settings"]
+    from backends.xmms2 import xmms2_backend as backend_class
 else:
     print("\x1b[2J\x1b[H\x1b[?25h", end="")
-    print("Error: back end not found or not specified or server not running")
+    print("Error: back end not found or not specified")
     sys.exit(1)
 
+async_backend_class = None  # asyncio version of the backend. only used with "main_loop": "asyncio"
+if config["main_loop"] == "asyncio":
+    if config["backend"] == "mocp":
+        from backends.mocp import mocp_async_backend as async_backend_class
+    elif config["backend"] == "mpd":
+        from backends.mpd import mpd_async_backend as async_backend_class
+    else:
+        from backends.xmms2 import xmms2_async_backend as async_backend_class
+
+utils.stats_enabled = config["instrument"]
+backend_commands: list = ["connect", "disconnect", "sync", "play_pause", "stop", "next", "prev", "enqueue", "enqueue_many",
+                          "enqueue_folder", "clear_queue", "set_vol", "seek", "start_queue", "update", "sync_queue", "play_at",
+                          "delete_range"]
+utils.instrument(backend_class, "backend.", backend_commands)  # NOTE before the key binds grab the bound methods
+if async_backend_class:
+    utils.instrument(async_backend_class, "abackend.", backend_commands)
+
+
+class Zone():
+    """one server. several (one mpd per room etc.) can be listed in "zones" in the config.
+    each zone has its own backend instance, its own dispatcher thread and its own status
+    so a slow zone doesn't hold up the others. its connection only stays open with "main_loop": "asyncio".
+    NOTE the threaded backends connect for every command, with a client of their own per dispatcher worker
+    so the worker that replaces a stuck one doesn't share a client with it"""
+    def __init__(self, name: str, settings: dict, backend=None):
+        self.name = name
+        self.backend = backend or backend_class()
+        self.backend.settings = settings
+        # all backend commands go through here so a slow or dead server doesn't freeze the UI
+        self.dispatcher = Dispatcher(timeout=config["command_timeout"])
+        self.abackend = None
+        if async_backend_class:
+            self.abackend = async_backend_class()
+            self.abackend.settings = settings
+        self.connect_lock = asyncio.Lock()  # only the first of several waiting commands connects
+        self.status: dict = blank_status()  # last answer from sync()
+        self.connecting: bool = False  # server can't be reached right now
+        self.sync_future = None  # sync currently in flight
+        self.queue = queue_mirror()  # only kept up to date while the queue is on screen
+        self.queue_future = None  # sync_queue currently in flight
+        self.feed: PlayOrder = None  # songs still to go into the server's queue (see "queue_window")
+        self.feed_future = None  # top_up currently in flight
+        self.feed_version: str = None  # queue version the feed last left the server's queue at. see own_queue()
+        self.feed_lock = asyncio.Lock()  # asyncio only. one on_zone() at a time like on a dispatcher
+
+
+# zone settings are laid over the backend's settings. no zones means one zone with just the backend's settings
+if daemon_conn:  # the daemon's zones
+    zones: list = [Zone(name, {}, backend_class(daemon_conn, i)) for i, name in enumerate(daemon_conn.zone_names)]
+else:
+    zones: list = [Zone(z.get("name", f"zone {i + 1}"), {**config[f"{config['backend']}_settings"], **z})
+                   for i, z in enumerate(config["zones"] or [{"name": config["backend"]}])]
+backend = zones[0].backend  # the key binds are made with this one. they're sent to the current zone's backend by name
+if config["backend"] == "mpd" and not daemon_conn:  # the daemon does this itself
+    for zone in zones:
+        zone.dispatcher.submit(zone.backend.update)  # NOTE server doesn't do this automatically if not running
+startup_phase("backend")
+
+
+def mtime(path: str) -> float:
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return 0.0
+
+
+def load_session() -> dict:
+    """last session's snapshot. empty if there isn't one or the folder it was in is gone"""
+    if not config["restore_session"]:
+        return {}
+    try:
+        with open(config["session_file"], "r") as f:
+            snapshot: dict = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if not os.path.exists(snapshot.get("folder", "")):
+        return {}
+    return snapshot
+
+
+session: dict = load_session()
+last_session: str = ""  # what save_session() last wrote. nothing gets written if it hasn't changed
+startup_phase("session")
+
+# folder: [mtime, sort_mode, sort_reversed, song_list, row index or None]. least recently used first
+# a listing is reused as long as the folder's mtime and the sort haven't changed
+listing_cache: dict = {}
+listing_lock = threading.Lock()  # NOTE load_in_background() and the ui thread both use listing_cache. folders are read without it
+
+
+def read_listing(folder: str, sort_mode: str, reverse: bool) -> tuple:
+    """(song_list, mtime) of folder or m3u8 file. from listing_cache if it's still good"""
+    folder_mtime = mtime(folder)  # NOTE before reading so a change while reading shows up next time
+    with listing_lock:
+        entry = listing_cache.get(folder)
+    if entry is None or entry[:3] != [folder_mtime, sort_mode, reverse]:
+        songs = open_m3u8(folder) if folder[-4:] == "m3u8" else folder_sort(folder, sort_mode, reverse)
+        entry = [folder_mtime, sort_mode, reverse, songs, None]
+    remember_listing(folder, entry)
+    return entry[3], folder_mtime
+
+
+def remember_listing(folder: str, entry: list) -> None:
+    with listing_lock:
+        listing_cache.pop(folder, None)  # to the end. most recently used
+        listing_cache[folder] = entry
+        while len(listing_cache) > config["listing_cache_size"]:
+            del listing_cache[next(iter(listing_cache))]
+
+tag_reader = TagReader(config["tag_cache_file"], config["tag_workers"])  # started in __main__ if "tag_columns" is on
+
+
+def song_paths(songs: list, folder: str) -> list:
+    """full paths of the songs in a listing of folder. no folders or playlists"""
+    folder = "" if folder[-4:] == "m3u8" else folder  # m3u8 file already has full file path
+    return [folder + s for s in songs if s[-1] != "/" and s[-4:] != "m3u8"]
+
+
+def fit(text: str, width: int) -> str:
+    """cut text down to width columns and pad it out to exactly width"""
+    text = text[:max(width, 0)]
+    while wcswidth(text) > width:
+        text = text[:-1]
+    return text + " " * (width - wcswidth(text))
+
 
 class UI():
-    scrn_size: list = list(os.get_terminal_size())
+    scrn_size: list = list(shutil.get_terminal_size())
     scrn_size[1] -= 1  # - 1 for kitty weirdness?
-    current_folder: str = config["starting_folder"]
+    current_folder: str = session.get("folder", config["starting_folder"])
 
     sort_cycle = itertools.cycle(["name", "size", "time"])
-    sort_mode = config["sort_mode"]
+    sort_mode = session.get("sort_mode", config["sort_mode"])
     while True:
         if sort_mode == next(sort_cycle):
             break
-    sort_reversed: bool = config["sort_reversed"]
-
-    song_list: list = folder_sort(current_folder, sort_mode, sort_reversed)
-    list_slice: list = [0, scrn_size[1] - 6]  # (top, bottom). - x for progress bar
-    selected_song: int = 0  # between 0 and len(song_list)  TODO save selected song from parent folder for when going back to it?
-    current_song_info: dict = backend.sync()
+    sort_reversed: bool = session.get("sort_reversed", config["sort_reversed"])
+
+    zone_index: int = 0  # zone the status bar shows and commands go to
+    all_zones: bool = False  # send commands to every zone
+    zone_rows: int = len(zones) if len(zones) > 1 else 0  # one summary line per zone above the status bar
+
+    # the last session's listing is shown straight away and checked by load_in_background()
+    # otherwise the list stays empty until load_in_background() has scanned the folder
+    song_list: list = session.get("song_list", [])
+    listing_mtime: float = session.get("mtime", 0.0)  # of current_folder when song_list was made
+    list_slice: list = [session.get("top", 0), session.get("top", 0) + scrn_size[1] - 6 - zone_rows]  # (top, bottom). - x for progress bar
+    selected_song: int = min(session.get("selected_song", 0), max(len(song_list) - 1, 0))  # between 0 and len(song_list)  TODO save selected song from parent folder for when going back to it?
+    current_song_info: dict = blank_status()  # current zone's status. filled in by request_sync() once the server answers
+    show_stats: bool = False  # stats overlay on top of the list
+    repeat: bool = config["repeat"]
+    shuffle: bool = config["shuffle"]
+    tagged_list: list = None  # song_list the tag reader was last given the whole of
+    row_index: dict = {}  # absolute path: row in song_list. see rows()
+    indexed_list: list = None  # song_list row_index was built for
+    view: str = "files"  # "files" or "queue"
+    queue_selected: int = 0  # cursor position in the queue
+    queue_top: int = 0  # queue position of the first row on screen
+    draw_lock = threading.RLock()  # status bar gets redrawn from the dispatcher thread
     # volume: int = config["volume"]
 
     @classmethod
@@ -231,48 +787,297 @@ class UI():
         """draw borders, slice of list of files, highlight currently playing and selected, play/pause/stop state
         then call update_prog_bar
         """
+        with cls.draw_lock:
+            cls._draw_list()
+
+    @classmethod
+    @utils.timed("draw_list")
+    def _draw_list(cls) -> None:
+        if cls.view == "queue":
+            cls._draw_queue()
+            if cls.show_stats:
+                cls.draw_stats()
+            return
         # TODO handle file names longer than screen width
         print(f"\x1b[0;0H\x1b[K{u_esc + config['main_clr'] + 'm'}┌─┤SYNTHIA├{'─' * 10}┤{cls.current_folder}├"
               f"{'─' * (cls.scrn_size[0] - len(cls.current_folder) - 24)}┐")  # ┌─┐
 
+        columns = config["tag_columns"] and tag_reader.started
+        if columns:
+            cls.request_tags()
+        playing = cls.playing_row()
+        num = -1  # song list can be empty while loading
         for num, song in enumerate(cls.song_list[cls.list_slice[0]:cls.list_slice[1] + 1]):  # + 1 to include last item
-            # line color
-            if song[-1] == "/":
-                line_color = u_esc + config["dir_clr"] + "m"
-            elif song[-4:] == "m3u8":
-                line_color = u_esc + config["m3u8_clr"] + "m"
-            else:
-                line_color = u_esc + config["file_clr"] + "m"
-            # list of files
-            print(f"\x1b[K│{num + cls.list_slice[0]:04d} {line_color}{invt_clr * (num + cls.list_slice[0] == cls.selected_song)}{song}"
-                  f"\x1b[27m{' ' * (cls.scrn_size[0] - wcwidth.wcswidth(song) - 7)}{u_esc + config['main_clr'] + 'm'}│")
-        for _ in range(cls.scrn_size[1] - num - 6):
+            print(cls.list_line(num + cls.list_slice[0], playing, columns))
+        for _ in range(cls.scrn_size[1] - num - 6 - cls.zone_rows):
             # filler border if files < height of window
             print(f"\x1b[K{u_esc}{config['main_clr'] + 'm'}│{' ' * (cls.scrn_size[0] - 2)}│{u_esc + config['main_clr'] + 'm'}")
         # bottom of list
         print(f"\x1b[K{u_esc}{config['main_clr'] + 'm'}├{'─' * (cls.scrn_size[0] - 2)}┤{u_esc + config['main_clr'] + 'm'}")
+        if cls.show_stats:
+            cls.draw_stats()
+
+    @classmethod
+    def list_line(cls, row: int, playing: int, columns: bool) -> str:
+        """one row of the file list, > marking the playing song"""
+        song = text = cls.song_list[row]
+        # line color
+        if song[-1] == "/":
+            line_color = u_esc + config["dir_clr"] + "m"
+        elif song[-4:] == "m3u8":
+            line_color = u_esc + config["m3u8_clr"] + "m"
+        else:
+            line_color = u_esc + config["file_clr"] + "m"
+            if columns:
+                text = cls.tag_columns(song)
+        return (f"\x1b[K│{row:04d}{'>' if row == playing else ' '}{line_color}{invt_clr * (row == cls.selected_song)}{text}"
+                f"\x1b[27m{' ' * (cls.scrn_size[0] - wcswidth(text) - 7)}{u_esc + config['main_clr'] + 'm'}│")
+
+    @classmethod
+    def playing_row(cls) -> int:
+        return cls.rows().get(cls.current_song_info["Path"], -1) if cls.current_song_info["Path"] else -1
+
+    @classmethod
+    def show_status(cls, status: dict) -> None:
+        """make status the current zone's one on screen. when the song changed the rows of the old and new song are
+        redrawn so > follows it without a key press. the status bar is left to the caller"""
+        with cls.draw_lock:
+            old, cls.current_song_info = cls.current_song_info, status
+            if cls.view == "queue":
+                if old["QueuePos"] != status["QueuePos"]:
+                    cls.draw_list()
+                return
+            if old["Path"] == status["Path"]:
+                return
+            if cls.show_stats:  # rows are under the overlay
+                cls.draw_list()
+                return
+            columns = config["tag_columns"] and tag_reader.started
+            playing = cls.playing_row()
+            for path in (old["Path"], status["Path"]):
+                row = cls.rows().get(path, -1) if path else -1
+                if cls.list_slice[0] <= row <= min(cls.list_slice[1], len(cls.song_list) - 1):
+                    print(f"\x1b[{row - cls.list_slice[0] + 2};0H{cls.list_line(row, playing, columns)}", end="")
+
+    @classmethod
+    def rows(cls) -> dict:
+        """absolute path: row of every song in song_list so the playing one is found without going through the list.
+        built once per listing and kept in listing_cache with it"""
+        if cls.indexed_list is not cls.song_list:  # NOTE song_list is replaced, not changed in place, on every new listing
+            with listing_lock:
+                entry = listing_cache.get(cls.current_folder)
+            if entry and entry[3] is cls.song_list and entry[4] is not None:
+                index = entry[4]
+            else:
+                folder = "" if cls.current_folder[-4:] == "m3u8" else cls.current_folder  # m3u8 file already has full file path
+                index = {folder + s: i for i, s in enumerate(cls.song_list) if s[-1] != "/"}
+                if entry and entry[3] is cls.song_list:
+                    entry[4] = index  # NOTE the entry is only replaced, never changed, apart from this
+            cls.row_index, cls.indexed_list = index, cls.song_list
+        return cls.row_index
+
+    @classmethod
+    def goto_playing(cls) -> None:
+        """put the cursor on the playing song. its folder is opened first if it's not in the current listing"""
+        path = cls.current_song_info["Path"]
+        if not path:
+            return
+        cls.view = "files"
+        if path not in cls.rows():
+            folder = os.path.dirname(path) + "/"
+            if not os.path.isdir(folder):
+                return
+            cls.current_folder = folder
+            cls.refresh_list()
+        if path in cls.rows():
+            cls.selected_song = cls.rows()[path]
+            cls.scroll(0)
+
+    @classmethod
+    def request_tags(cls) -> None:
+        """rows on screen go to the tag reader first. the whole list follows when it has changed"""
+        rest = None
+        if cls.song_list is not cls.tagged_list:  # NOTE song_list is replaced, not changed in place, on every new listing
+            cls.tagged_list = cls.song_list
+            rest = partial(song_paths, cls.song_list, cls.current_folder)
+        tag_reader.want(song_paths(cls.song_list[cls.list_slice[0]:cls.list_slice[1] + 1], cls.current_folder), rest)
+
+    @classmethod
+    def tag_columns(cls, song: str) -> str:
+        """title, artist and length of song. just the file name and ... until the tags are read"""
+        tags = tag_reader.results.get(song if cls.current_folder[-4:] == "m3u8" else cls.current_folder + song)
+        width = cls.scrn_size[0] - 7
+        artist_width = min(24, width // 4)
+        if tags is None:
+            title, artist, length = song, "", "..."
+        else:
+            artist, title, seconds = tags
+            title = title or song
+            length = f"{seconds // 60}:{seconds % 60:02d}" if seconds else ""
+        return f"{fit(title, width - artist_width - 7)} {fit(artist, artist_width)}{length:>6}"
+
+    @classmethod
+    def queue_rows(cls) -> int:
+        """number of queue rows that fit on screen"""
+        return max(cls.scrn_size[1] - 5 - cls.zone_rows, 1)
+
+    @classmethod
+    def _draw_queue(cls) -> None:
+        """visible window of the current zone's queue mirror. rows whose tags haven't arrived yet are drawn as ..."""
+        zone = cls.zone()
+        ids = zone.queue.ids  # NOTE grab the list once. sync_queue swaps in a new one when the queue changes
+        title = f"QUEUE {len(ids)} songs" if zone.backend.supports("sync_queue") else "QUEUE view needs mpd"
+        print(f"\x1b[0;0H\x1b[K{u_esc + config['main_clr'] + 'm'}┌─┤SYNTHIA├{'─' * 10}┤{title}├"
+              f"{'─' * (cls.scrn_size[0] - len(title) - 24)}┐")
+        cls.queue_selected = min(cls.queue_selected, max(len(ids) - 1, 0))  # queue may have shrunk
+        playing = int(cls.current_song_info["QueuePos"] or -1)
+        width = cls.scrn_size[0] - 8
+        for pos in range(cls.queue_top, cls.queue_top + cls.queue_rows()):
+            if pos >= len(ids):
+                print(f"\x1b[K{u_esc}{config['main_clr'] + 'm'}│{' ' * (cls.scrn_size[0] - 2)}│")
+                continue
+            song = zone.queue.info.get(ids[pos])
+            if song is None:
+                text = "..."
+            elif song.get("title") or song.get("artist"):
+                text = f"{song.get('artist', '')} - {song.get('title', '')}"
+            else:
+                text = song["file"]
+            while wcswidth(text) > width:
+                text = text[:-1]
+            print(f"\x1b[K│{pos:05d}{'>' if pos == playing else ' '}{u_esc + config['file_clr'] + 'm'}"
+                  f"{invt_clr * (pos == cls.queue_selected)}{text}\x1b[27m{' ' * (width - wcswidth(text))}"
+                  f"{u_esc + config['main_clr'] + 'm'}│")
+        print(f"\x1b[K{u_esc}{config['main_clr'] + 'm'}├{'─' * (cls.scrn_size[0] - 2)}┤")
+
+    @classmethod
+    def toggle_queue(cls) -> None:
+        cls.view = "files" if cls.view == "queue" else "queue"
+        cls.sync_queue()
+
+    @classmethod
+    def sync_queue(cls) -> None:
+        """bring the current zone's queue mirror up to date and get the tags of the rows on screen plus a page either side.
+        sends nothing when the queue version from the last status is the one the mirror has and those rows are loaded"""
+        zone = cls.zone()
+        if cls.view != "queue" or not zone.backend.supports("sync_queue"):
+            return
+        rows = cls.queue_rows()
+        start, end = cls.queue_top - rows, cls.queue_top + 2 * rows
+        version = zone.status["QueueVersion"]
+        if version == zone.queue.version and not zone.queue.missing(start, end):
+            return
+        if zone.queue_future is not None and not zone.queue_future.done():
+            return  # NOTE _queue_synced() calls this again so the latest window still gets fetched
+        if config["main_loop"] == "asyncio":
+            zone.queue_future = run_in_background(call_backend(zone, zone.abackend.sync_queue, zone.queue, version, start, end))
+        else:
+            zone.queue_future = zone.dispatcher.submit(zone.backend.sync_queue, zone.queue, version, start, end)
+        zone.queue_future.add_done_callback(cls._queue_synced)
+
+    @classmethod
+    def _queue_synced(cls, future) -> None:
+        if cls.zone().dispatcher.stopped.is_set() or future.cancelled() or future.exception() is not None:
+            return
+        if future.result():
+            cls.draw_list()
+            cls.sync_queue()  # scrolled further while this one was running
+
+    @classmethod
+    def draw_stats(cls) -> None:
+        """box over the top of the list with p50/p99 of every histogram and the counters"""
+        stats = utils.stats_snapshot()
+        lines = [f"{'name':<30}{'count':>8}{'p50 ms':>10}{'p99 ms':>10}{'max ms':>10}"]
+        for name, h in stats["histograms"].items():
+            lines.append(f"{name[:29]:<30}{h['count']:>8}{h['p50'] * 1000:>10.2f}{h['p99'] * 1000:>10.2f}{h['max'] * 1000:>10.2f}")
+        for name, n in stats["counters"].items():
+            lines.append(f"{name[:29]:<30}{n:>8}")
+        if not utils.stats_enabled:
+            lines.append("set \"instrument\": true in synthia_settings.json")
+        width = min(max(len(line) for line in lines), cls.scrn_size[0] - 6)
+        lines = lines[:max(cls.scrn_size[1] - 10, 1)]  # stay inside the list
+        print(f"\x1b[2;3H{u_esc}{config['misc_clr']}m┌{'─' * width}┐", end="")
+        for i, line in enumerate(lines):
+            print(f"\x1b[{i + 3};3H│{line[:width]:<{width}}│", end="")
+        print(f"\x1b[{len(lines) + 3};3H└{'─' * width}┘{u_esc + config['main_clr'] + 'm'}")
+
+    @classmethod
+    def toggle_stats(cls) -> None:
+        cls.show_stats = not cls.show_stats
+
+    @classmethod
+    def request_sync(cls) -> None:
+        """ask every zone for its status without waiting. zones are asked at the same time on their own dispatcher threads
+        and the status bar is redrawn as each answer arrives"""
+        for zone in zones:
+            if zone.sync_future is None or zone.sync_future.done():
+                zone.sync_future = zone.dispatcher.submit(zone.backend.sync, timeout=config["update_rate"])
+                zone.sync_future.add_done_callback(partial(cls._synced, zone))
+
+    @classmethod
+    def _synced(cls, zone: Zone, future) -> None:
+        if zone.dispatcher.stopped.is_set():  # quitting. don't draw over the cleared screen
+            return
+        zone.connecting = zone.dispatcher.state == "connecting"
+        if future.cancelled() or future.exception() is not None:
+            zone.status = blank_status()
+        elif future.result():  # NOTE some backends return None when the server gives back an error
+            zone.status = future.result()
+            startup_phase("first status")
+        if zone is cls.zone():
+            cls.show_status(zone.status)
+            cls.sync_queue()
+        if needs_top_up(zone):
+            request_top_up(zone)
+        cls.draw_status_bar()
+
+    @classmethod
+    def zone(cls) -> Zone:
+        return zones[cls.zone_index]
+
+    @classmethod
+    def targets(cls) -> list:
+        """zones that commands go to"""
+        return zones if cls.all_zones else [cls.zone()]
+
+    @classmethod
+    def next_zone(cls) -> None:
+        cls.zone_index = (cls.zone_index + 1) % len(zones)
+        cls.current_song_info = cls.zone().status
+        cls.sync_queue()
+
+    @classmethod
+    def toggle_all_zones(cls) -> None:
+        cls.all_zones = not cls.all_zones
 
     @classmethod
     def draw_status_bar(cls) -> None:
         # https://cloford.com/resources/charcodes/utf-8_box-drawing.htm
-        cls.current_song_info = backend.sync()
+        with cls.draw_lock:
+            cls._draw_status_bar()
 
+    @classmethod
+    @utils.timed("draw_status_bar")
+    def _draw_status_bar(cls) -> None:
         # status and name of song
         if cls.current_song_info['Title'] or cls.current_song_info['Artist']:
             title_or_file = f"{cls.current_song_info['Artist']} - {cls.current_song_info['Title']}"
         else:
             title_or_file = cls.current_song_info['File']
+        state = "CONNECTING..." if cls.zone().connecting else cls.current_song_info['State']
+        if cls.zone_rows:
+            cls.draw_zones()
 
         print(f"\x1b[{cls.scrn_size[1] - 2};0H\x1b[K{u_esc + config['main_clr'] + 'm'}"
-              f"│{cls.current_song_info['State']} > {title_or_file}"
-              f"{' ' * (cls.scrn_size[0] - len(cls.current_song_info['State']) - wcwidth.wcswidth(title_or_file) - 5)}"
+              f"│{state} > {title_or_file}"
+              f"{' ' * (cls.scrn_size[0] - len(state) - wcswidth(title_or_file) - 5)}"
               f"│{u_esc + config['main_clr'] + 'm'}")
 
-        # sort mode TODO other info like volume, repeat etc.
+        # sort mode, volume, repeat and shuffle
+        info = (f"sort: [{cls.sort_mode}] reversed: [{cls.sort_reversed}]"
+                f" vol: [{int(cls.current_song_info['Volume']):03d}%] repeat: [{cls.repeat}] shuffle: [{cls.shuffle}]")
         print(f"\x1b[{cls.scrn_size[1] - 1};0H\x1b[K│{u_esc}{config['misc_clr'] + 'm'}"
-              f"sort mode: [{cls.sort_mode}]  reversed: [{cls.sort_reversed}]"
-              f" vol: [{int(cls.current_song_info['Volume']):03d}%]"
-              f"{' ' * (cls.scrn_size[0] - len(cls.sort_mode + str(cls.sort_reversed)) - 41)}{u_esc + config['main_clr'] + 'm'}│")
+              f"{fit(info, cls.scrn_size[0] - 2)}{u_esc + config['main_clr'] + 'm'}│")  # NOTE 76 columns. cut on narrower screens
 
         # progress bar
         print(f"\x1b[{cls.scrn_size[1]};0H\x1b[K{u_esc + config['main_clr'] + 'm'}"
@@ -281,6 +1086,24 @@ class UI():
         print(f"\x1b[K{u_esc}{config['main_clr'] + 'm'}└{'─' * (cls.scrn_size[0] - 2)}┘{u_esc + config['main_clr'] + 'm'}", end="")
         sys.stdout.flush()  # BUG flickering caused by last line? replace end with ANSI go up line?
 
+    @classmethod
+    def draw_zones(cls) -> None:
+        """one line per zone above the status bar. > is the current zone, + the others when sending to all of them"""
+        for i, zone in enumerate(zones):
+            info = zone.status
+            if info['Title'] or info['Artist']:
+                title_or_file = f"{info['Artist']} - {info['Title']}"
+            else:
+                title_or_file = os.path.basename(info['File'])
+            marker = ">" if i == cls.zone_index else "+" if cls.all_zones else " "
+            line = (f"{marker}{zone.name}: {'CONNECTING...' if zone.connecting else info['State']} "
+                    f"{info['CurrentTime']}/{info['TotalTime']} vol {info['Volume']}% {title_or_file}")
+            while wcswidth(line) > cls.scrn_size[0] - 2:
+                line = line[:-1]
+            print(f"\x1b[{cls.scrn_size[1] - 2 - cls.zone_rows + i};0H\x1b[K{u_esc + config['main_clr'] + 'm'}│"
+                  f"{u_esc + config['misc_clr'] + 'm'}{line}{' ' * (cls.scrn_size[0] - 2 - wcswidth(line))}"
+                  f"{u_esc + config['main_clr'] + 'm'}│")
+
     @classmethod
     def progress_bar(cls) -> str:
         """calculate what the progress bar should look like"""
@@ -293,6 +1116,9 @@ class UI():
 
     @classmethod
     def scroll(cls, amount: int) -> None:
+        if cls.view == "queue":
+            cls.scroll_queue(amount)
+            return
         # NOTE outer if statement allows for scrolling cursor to last values. inner ifs correct for over shooting
         if 0 <= cls.selected_song < len(cls.song_list):
             cls.selected_song += amount
@@ -309,46 +1135,99 @@ class UI():
             shift = cls.list_slice[0] - cls.selected_song
             cls.list_slice = [cls.list_slice[0] - shift, cls.list_slice[1] - shift]
 
+    @classmethod
+    def scroll_queue(cls, amount: int) -> None:
+        cls.queue_selected = min(max(cls.queue_selected + amount, 0), max(len(cls.zone().queue.ids) - 1, 0))
+        if cls.queue_selected >= cls.queue_top + cls.queue_rows():  # scroll down
+            cls.queue_top = cls.queue_selected - cls.queue_rows() + 1
+        elif cls.queue_selected < cls.queue_top:  # scroll up
+            cls.queue_top = cls.queue_selected
+        cls.sync_queue()
+
     @classmethod
     def enter(cls) -> None:
         """enter folder, handle .m3u8 file or play song"""
+        if cls.view == "queue":
+            if cls.queue_selected < len(cls.zone().queue.ids) and cls.zone().backend.supports("play_at"):
+                play_at(cls.zone(), cls.queue_selected)
+            return
+        if not cls.song_list:  # still loading
+            return
         if cls.song_list[cls.selected_song][-1] == "/":  # handle folders
             if cls.song_list[cls.selected_song][-3:] == "../":  # go up a folder
                 cls.current_folder = cls.current_folder.rsplit("/", 2)[0] + "/"  # BUG goes up one folder to far when in m3u8 file
-                cls.song_list = folder_sort(cls.current_folder, cls.sort_mode, cls.sort_reversed)
+                cls.refresh_list()
                 cls.selected_song = 0
 
             else:  # go into a folder
                 cls.current_folder = cls.current_folder + cls.song_list[cls.selected_song]
-                cls.song_list = folder_sort(cls.current_folder, cls.sort_mode, cls.sort_reversed)
+                cls.refresh_list()
                 cls.selected_song = 0
 
         elif cls.song_list[cls.selected_song][-4:] == "m3u8":  # open playlist file
             cls.current_folder = cls.current_folder + cls.song_list[cls.selected_song]
-            cls.song_list = open_m3u8(cls.current_folder)
+            cls.refresh_list()
             cls.selected_song = 0
 
         else:  # play song and add other songs to play queue
-            if cls.current_folder[-4:] == "m3u8":  # NOTE m3u8 file already has full file path so ignore folder arg
-                add_songs_to_queue_and_play(cls.song_list, cls.selected_song, "")
-            else:
-                add_songs_to_queue_and_play(cls.song_list, cls.selected_song, cls.current_folder)
+            folder = "" if cls.current_folder[-4:] == "m3u8" else cls.current_folder  # m3u8 file already has full file path
+            play(list(cls.song_list), cls.selected_song, folder)
+
+    @classmethod
+    def play_tree(cls) -> None:
+        """play the selected folder with everything under it, or the current folder if a song is selected"""
+        if cls.view != "files" or not cls.song_list or cls.current_folder[-4:] == "m3u8":
+            return
+        selected = cls.song_list[cls.selected_song]
+        if selected[-1] == "/" and selected != "../":
+            play_tree(cls.current_folder + selected)
+        else:
+            play_tree(cls.current_folder)
+
+    @classmethod
+    def toggle_repeat(cls) -> None:
+        cls.repeat = not cls.repeat
+        cls.reorder()
+
+    @classmethod
+    def toggle_shuffle(cls) -> None:
+        cls.shuffle = not cls.shuffle
+        cls.reorder()
+
+    @classmethod
+    def reorder(cls) -> None:
+        """requeue what's after the current song in every zone that's being fed so the new mode starts with the next song"""
+        for zone in zones:
+            if zone.feed:
+                request_top_up(zone, reorder=True)
 
     @classmethod
     def cycle_sort(cls):
         cls.sort_mode = next(cls.sort_cycle)
-        cls.song_list = folder_sort(cls.current_folder, cls.sort_mode, cls.sort_reversed)
+        cls.refresh_list()
 
     @classmethod
     def reverse_sort(cls):
         cls.sort_reversed = not cls.sort_reversed
-        cls.song_list = folder_sort(cls.current_folder, cls.sort_mode, cls.sort_reversed)
+        cls.refresh_list()
+
+    @classmethod
+    def refresh_list(cls) -> None:
+        """(re)read current_folder into song_list. a folder that hasn't changed since it was last read isn't read again"""
+        cls.song_list, cls.listing_mtime = read_listing(cls.current_folder, cls.sort_mode, cls.sort_reversed)
+        with cls.draw_lock:
+            print("\x1b[2J\x1b[H")  # NOTE clears what the old listing left. the caller draws the new one
+
+
+if daemon_conn:
+    daemon_conn.on_change = UI.request_sync  # redraw as soon as the daemon pushes a change
+tag_reader.on_result = UI.draw_list  # fill in the placeholders
 
 
 # TODO make the keybinds a config file?
 config.update({  # default config values that have to be defined after UI() and backend
     "key_binds": {" ": partial(backend.play_pause),  # play/pause
-                  "s": partial(backend.stop),  # stop and clear playlist
+                  "s": partial(stop),  # stop and clear playlist
 
                   "n": partial(backend.next),  # next song
                   # BUG back only works with playlist, not queue
@@ -366,21 +1245,348 @@ config.update({  # default config values that have to be defined after UI() and
                   "rt": partial(backend.seek, 2),  # seek +1 s
 
                   "\n": partial(UI.enter),  # play song or enter folder. TODO handle .m3u8
+                  "p": partial(UI.play_tree),  # play folder and all its subfolders
 
                   "m": partial(UI.cycle_sort),  # cycle sort modes
                   "M": partial(UI.reverse_sort),  # toggle sort reverse
+                  "g": partial(UI.goto_playing),  # go to the playing song
+                  "r": partial(UI.toggle_repeat),  # repeat mode
+                  "x": partial(UI.toggle_shuffle),  # shuffle mode
+                  "F5": partial(UI.toggle_stats),  # latency stats overlay
+                  "\t": partial(UI.toggle_queue),  # files/play queue
+                  "z": partial(UI.next_zone),  # switch zone
+                  "Z": partial(UI.toggle_all_zones),  # commands go to every zone
                   # TODO
                   # "c": clear playlist? happens automatically when stopping or changing playlist
                   # "/": search function?
-                  # "r" repeat mode
-                  # shuffle mode
-                  # goto folder of currently playing song
                   "T": partial(backend.start_queue),  # testing
                   "Y": partial(backend.seek, 5),  # testing
                   },
 })
 
 
+# relative commands where pressing the key n times is the same as one call with n times the amount
+coalescable: list = [backend.seek, backend.set_vol, UI.scroll]
+
+
+def coalesce(chars: list) -> list:
+    """turn a batch of keys into the commands to run. runs of the same relative command
+    (held down seek, volume or scroll keys) are merged into one call so the backend only gets the total"""
+    cmds: list = []
+    for char in chars:
+        if char not in config["key_binds"].keys():
+            continue
+        cmd = config["key_binds"][char]
+        if cmds and cmd.func in coalescable and cmds[-1].func == cmd.func:
+            cmds[-1] = partial(cmd.func, cmds[-1].args[0] + cmd.args[0])
+        else:
+            cmds.append(cmd)
+    return [c for c in cmds if c.func not in coalescable or c.args[0] != 0]  # left then right cancels out
+
+
+def handle_keys(chars: list) -> bool:
+    """run a batch of keys from the input loop and draw the frame. False once q or esc was pressed.
+    also what benchmarks/replay.py feeds recorded keys into"""
+    running = True
+    if "q" in chars or "esc" in chars:
+        running = False
+        chars = chars[:min(chars.index(c) for c in ["q", "esc"] if c in chars)]
+    for cmd in coalesce(chars):
+        if getattr(cmd.func, "__self__", None) is backend:
+            for zone in UI.targets():  # don't wait on the server
+                zone.dispatcher.submit(getattr(zone.backend, cmd.func.__name__), *cmd.args)
+        else:
+            cmd()
+
+    UI.draw_list()
+    UI.draw_status_bar()
+    UI.request_sync()
+    return running
+
+
+recorder = None  # term.KeyRecorder with --record
+replayed_settings: list = ["tag_columns", "queue_window", "repeat", "shuffle", "listing_cache_size"]  # go in the header
+
+
+def start_recording(path: str) -> term.KeyRecorder:
+    """the header has what a replay needs to start where this session does"""
+    return term.KeyRecorder(path, {"size": list(shutil.get_terminal_size()), "folder": UI.current_folder,
+                                   "sort_mode": UI.sort_mode, "sort_reversed": UI.sort_reversed,
+                                   "selected_song": UI.selected_song, "top": UI.list_slice[0],
+                                   "settings": {k: config[k] for k in replayed_settings}})
+
+
+background_tasks: set = set()  # keeps references to running tasks so they don't get garbage collected
+
+
+def run_in_background(coro) -> asyncio.Task:
+    task = asyncio.get_running_loop().create_task(coro)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    return task
+
+
+async def call_backend(zone: Zone, func: callable, *args, timeout: float = None, retries: int = 3):
+    """asyncio version of the dispatcher. (re)connects zone when needed, gives up after timeout
+    and retries connection errors with exponential backoff"""
+    timeout = config["command_timeout"] if timeout is None else timeout
+    delay = 0.5
+    for attempt in range(retries + 1):
+        try:
+            async with zone.connect_lock:  # only the first of several waiting commands connects
+                if not zone.abackend.connected:
+                    await asyncio.wait_for(zone.abackend.connect(), timeout)
+            result = await asyncio.wait_for(func(*args), timeout)
+            zone.connecting = False
+            return result
+        except (ConnectionError, TimeoutError) as e:
+            await zone.abackend.disconnect()
+            zone.connecting = True
+            if attempt == retries:
+                utils.log(f"{func.__name__} failed: {e}", utils.ERROR)
+                return None
+            await asyncio.sleep(delay)
+            delay *= 2
+
+
+async def main_async() -> None:
+    """single threaded main loop. stdin, the backend connection, resize signals and
+    the status timer are all multiplexed on one asyncio event loop so no locks or timer thread are needed"""
+    global event_loop, tree_generation
+    loop = event_loop = asyncio.get_running_loop()
+    quit_event = asyncio.Event()
+    loop.add_signal_handler(signal.SIGINT, quit_event.set)
+    loop.add_signal_handler(signal.SIGWINCH, resize)
+    loop.add_signal_handler(signal.SIGUSR1, write_stats)
+    keys = term.AsyncKeyReader(sys.stdin.buffer)
+
+    async def sync(zone: Zone) -> None:
+        info = await call_backend(zone, zone.abackend.sync, timeout=config["update_rate"], retries=0)
+        if info:  # NOTE some backends return None when the server gives back an error
+            zone.status = info
+            startup_phase("first status")
+        elif zone.connecting:
+            zone.status = blank_status()
+        if zone is UI.zone():
+            UI.show_status(zone.status)
+            UI.sync_queue()
+        if needs_top_up(zone):
+            request_top_up(zone)
+        UI.draw_status_bar()
+
+    async def sync_all() -> None:
+        await asyncio.gather(*[sync(zone) for zone in zones])  # every zone at once on its own connection
+
+    async def status_timer() -> None:  # replaces RepeatTimer
+        while True:
+            await sync_all()
+            await asyncio.sleep(config["update_rate"])
+
+    async def session_timer() -> None:
+        while True:
+            await asyncio.sleep(config["session_save_rate"])
+            save_session()
+
+    async def input_loop() -> None:
+        while True:
+            chars = await keys.read()  # every key that arrived since the last frame
+            if recorder:
+                recorder.record(chars)
+            if "q" in chars or "esc" in chars:
+                chars = chars[:min(chars.index(c) for c in ["q", "esc"] if c in chars)]
+                quit_event.set()
+            for cmd in coalesce(chars):
+                if getattr(cmd.func, "__self__", None) is backend:  # same command on the zones' asyncio backends
+                    for zone in UI.targets():
+                        run_in_background(call_backend(zone, getattr(zone.abackend, cmd.func.__name__), *cmd.args))
+                else:
+                    cmd()
+            if quit_event.is_set():
+                return
+            UI.draw_list()
+            UI.draw_status_bar()
+            run_in_background(sync_all())
+
+    if config["backend"] == "mpd":
+        for zone in zones:
+            run_in_background(call_backend(zone, zone.abackend.update))
+    tasks = [loop.create_task(status_timer()), loop.create_task(session_timer()), loop.create_task(input_loop())]
+    await quit_event.wait()
+    event_loop = None  # NOTE before cancelling so a tree being fed can't start anything new
+    tree_generation += 1
+    tasks += list(background_tasks)
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)  # let them finish cancelling before disconnecting
+    keys.close()
+    await asyncio.gather(*[zone.abackend.disconnect() for zone in zones])
+
+
+def load_in_background() -> None:
+    """the slow parts of startup. runs on its own thread after the first frame is drawn"""
+    global wcswidth
+    import wcwidth
+    wcswidth = wcwidth.wcswidth
+    startup_phase("wcwidth")
+    initial = UI.song_list
+    if initial and mtime(UI.current_folder) == UI.listing_mtime:
+        # NOTE files being changed doesn't change the folder's mtime so a time or size sort can be slightly off
+        remember_listing(UI.current_folder, [UI.listing_mtime, UI.sort_mode, UI.sort_reversed, initial, None])
+        startup_phase("initial listing")
+        UI.draw_list()
+        UI.draw_status_bar()
+        return
+    song_list, folder_mtime = read_listing(UI.current_folder, UI.sort_mode, UI.sort_reversed)
+    with UI.draw_lock:
+        if UI.song_list is initial:  # unless a key already changed folder or sort mode
+            selected = UI.song_list[UI.selected_song] if UI.song_list else None
+            UI.song_list = song_list
+            UI.listing_mtime = folder_mtime
+            # keep the cursor on the same file if it's still there
+            UI.selected_song = song_list.index(selected) if selected in song_list else min(UI.selected_song, len(song_list) - 1)
+            UI.scroll(0)
+        startup_phase("initial listing")
+        UI.draw_list()
+        UI.draw_status_bar()
+
+
+def save_session() -> None:
+    """write where the user is and the current listing out so the next start can show it straight away"""
+    global last_session
+    tag_reader.save()  # NOTE the tag cache goes out with the session. only if tags were read since the last time
+    with UI.draw_lock:
+        snapshot = json.dumps({"folder": UI.current_folder, "sort_mode": UI.sort_mode, "sort_reversed": UI.sort_reversed,
+                               "selected_song": UI.selected_song, "top": UI.list_slice[0],
+                               "mtime": UI.listing_mtime, "song_list": UI.song_list}, separators=(",", ":"))
+    if snapshot == last_session or not config["restore_session"] or not UI.song_list:
+        return
+    try:
+        with open(config["session_file"] + ".tmp", "w") as f:
+            f.write(snapshot)
+        os.replace(config["session_file"] + ".tmp", config["session_file"])  # never leave half a file behind
+        last_session = snapshot
+    except OSError as e:
+        utils.log(f"couldn't save session: {e}", utils.ERROR)
+
+
+def print_startup_profile() -> None:
+    sys.stdout.flush()  # clear the screen before writing to stderr
+    print("startup (ms since python started running synthia.py):", file=sys.stderr)
+    for name, t in sorted(startup_phases.items(), key=lambda p: p[1]):
+        print(f"    {name:<20}{t * 1000:>8.1f}", file=sys.stderr)
+
+
+async def main_daemon() -> None:
+    """synthia --daemon. keeps one connection per zone and pushes status changes to every attached synthia
+    over a unix socket so the servers see the same load however many frontends are open.
+    zones are only polled while playing (for the time). otherwise backends with changes() (mpd idle) wake it up"""
+    from backends.daemon import attach, command_timeout, commands, encode, queue_delta
+    loop = asyncio.get_running_loop()
+    quit_event = asyncio.Event()
+    for sig in [signal.SIGINT, signal.SIGTERM]:
+        loop.add_signal_handler(sig, quit_event.set)
+    loop.add_signal_handler(signal.SIGUSR1, write_stats)
+    clients: set = set()  # stream writers of attached frontends
+    wakes: list = [asyncio.Event() for _ in zones]  # something changed. publish now instead of at the next poll
+
+    def send(writer, msg: dict) -> None:
+        if writer.transport.get_write_buffer_size() > 1024 * 1024:  # not reading. don't let it eat memory
+            writer.close()
+            clients.discard(writer)
+            return
+        writer.write(encode(msg))
+
+    async def refresh(i: int, zone: Zone) -> None:
+        """sync zone and push what changed to every client"""
+        info = await call_backend(zone, zone.abackend.sync, timeout=config["update_rate"], retries=0)
+        status = info or (blank_status() if zone.connecting else zone.status)
+        delta = {k: v for k, v in status.items() if zone.status.get(k) != v}
+        zone.status = status
+        if delta:
+            for writer in list(clients):
+                send(writer, {"zone": i, "delta": delta})
+
+    async def publish(i: int, zone: Zone) -> None:
+        while True:
+            wakes[i].clear()
+            await refresh(i, zone)
+            idle = hasattr(zone.abackend, "changes") and zone.abackend.connected and zone.status["State"] != "PLAY"
+            try:
+                await asyncio.wait_for(wakes[i].wait(), None if idle else config["update_rate"])
+            except TimeoutError:
+                pass
+
+    async def watch(i: int, zone: Zone) -> None:
+        """wake publish() when the server says something changed"""
+        while True:
+            try:
+                if zone.abackend.connected:
+                    async for _ in zone.abackend.changes():
+                        wakes[i].set()
+            except ConnectionError:
+                wakes[i].set()
+            await asyncio.sleep(config["update_rate"])
+
+    async def run_command(writer, mirrors: list, msg: dict) -> None:
+        zone: Zone = zones[msg["zone"]]
+        if msg["cmd"] not in commands:
+            send(writer, {"id": msg["id"], "error": f"unknown command {msg['cmd']}"})
+            return
+        if not zone.abackend.supports(msg["cmd"]):  # e.g. enqueue_folder. the client falls back to enqueue_many
+            send(writer, {"id": msg["id"], "result": None})
+            return
+        if msg["cmd"] == "sync_queue":  # NOTE a queue_mirror can't go over json. see daemon_backend.sync_queue
+            sync_queue = partial(call_backend, zone, zone.abackend.sync_queue, timeout=command_timeout, retries=0)
+            send(writer, {"id": msg["id"], "result": await queue_delta(sync_queue, mirrors[msg["zone"]], *msg["args"])})
+            return
+        result = await call_backend(zone, getattr(zone.abackend, msg["cmd"]), *msg["args"], timeout=command_timeout, retries=0)
+        if msg["cmd"] != "get_vol":
+            await refresh(msg["zone"], zone)  # NOTE before the result so the client's next sync() sees the change
+        send(writer, {"id": msg["id"], "result": result})
+        wakes[msg["zone"]].set()
+
+    async def handle(reader, writer) -> None:
+        writer.write(encode({"hello": {"zones": [z.name for z in zones], "status": [z.status for z in zones],
+                                       "commands": [[c for c in commands if z.abackend.supports(c)] for z in zones]}}))
+        clients.add(writer)
+        mirrors = [queue_mirror() for _ in zones]  # the daemon's copy of each of this client's queue mirrors
+        try:
+            while line := await reader.readline():
+                run_in_background(run_command(writer, mirrors, json.loads(line)))
+        except (ConnectionError, ValueError) as e:
+            utils.log(f"daemon client error: {e}", utils.WARNING)
+        finally:
+            clients.discard(writer)
+            writer.close()
+
+    path = config["daemon_socket"]
+    if os.path.exists(path):
+        probe = await asyncio.to_thread(attach, path)
+        if probe:
+            probe.close()
+            print(f"synthia --daemon is already running on {path}")
+            return
+        os.remove(path)  # left over from one that crashed
+    server = await asyncio.start_unix_server(handle, path)
+    utils.log(f"daemon listening on {path}")
+    if config["backend"] == "mpd":
+        for zone in zones:
+            run_in_background(call_backend(zone, zone.abackend.update))
+    tasks = [loop.create_task(publish(i, z)) for i, z in enumerate(zones)]
+    tasks += [loop.create_task(watch(i, z)) for i, z in enumerate(zones) if hasattr(z.abackend, "changes")]
+    await quit_event.wait()
+    server.close()
+    for writer in list(clients):
+        writer.close()
+    tasks += list(background_tasks)
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    await asyncio.gather(*[zone.abackend.disconnect() for zone in zones])
+    if os.path.exists(path):
+        os.remove(path)
+
+
 class RepeatTimer(threading.Timer):  # TODO sync timer to song start? EV_AUDIO_START/STOP
     # paused = false
     def run(self):
@@ -390,33 +1596,63 @@ class RepeatTimer(threading.Timer):  # TODO sync timer to song start? EV_AUDIO_S
 
 
 if __name__ == "__main__":
-    setproctitle.setproctitle("synthia")  # these are here because they only matter when the program is looping
-    for signum in [signal.SIGINT, signal.SIGWINCH]:
-        signal.signal(signum, sig_handler)
+    if "--daemon" in sys.argv:  # headless. nothing to draw
+        import setproctitle
+        setproctitle.setproctitle("synthia-daemon")
+        asyncio.run(main_daemon())
+        write_stats()
+        sys.exit(0)
 
-    timer = RepeatTimer(config["update_rate"], UI.draw_status_bar)
-    timer.start()
+    threading.Thread(target=load_in_background, name="startup", daemon=True).start()
+    if config["tag_columns"]:
+        threading.Thread(target=tag_reader.start, name="synthia-tags", daemon=True).start()
+    import setproctitle
+    setproctitle.setproctitle("synthia")  # these are here because they only matter when the program is looping
+    if utils.stats_enabled:
+        sys.stdout = utils.CountingStream(sys.stdout)  # terminal_bytes counter
+    if "--profile-startup" in sys.argv:
+        atexit.register(print_startup_profile)  # NOTE not at the end. ctrl+c in threads mode leaves by sys.exit in sig_handler
 
-    print("\x1b[2J\x1b[H\x1b[?25l")
     UI.draw_list()
     UI.draw_status_bar()
+    startup_phase("ui ready")
+    if "--record" in sys.argv:
+        recorder = start_recording(sys.argv[sys.argv.index("--record") + 1])
+
+    if config["main_loop"] == "asyncio":
+        with term.cbreak(sys.stdin):
+            asyncio.run(main_async())
+    else:
+        signal.signal(signal.SIGINT, sig_handler)
+        signal.signal(signal.SIGWINCH, sig_handler)
+        signal.signal(signal.SIGUSR1, sig_handler)
+        for zone in zones:
+            zone.dispatcher.start()
+        timer = RepeatTimer(config["update_rate"], UI.request_sync)
+        timer.start()
+        session_timer = RepeatTimer(config["session_save_rate"], save_session)
+        session_timer.start()
+        UI.request_sync()
+
+        with term.cbreak(sys.stdin):
+            keys = term.KeyReader(sys.stdin.buffer)
+            running = True
+            while running:
+                chars = keys.read()  # every key that arrived since the last frame
+                if recorder:
+                    recorder.record(chars)
+                running = handle_keys(chars)
+            keys.close()
 
-    while True:
-        char = getch()
-        if char == "\x1b":
-            char = handle_esc()
-            if char == "esc":
-                break
-            elif char in config["key_binds"].keys():
-                config["key_binds"][char]()
-        elif char == "q":
-            break
-        elif char in config["key_binds"].keys():
-            config["key_binds"][char]()
-
-        UI.draw_list()
-        UI.draw_status_bar()
+        timer.cancel()
+        session_timer.cancel()
+        for zone in zones:
+            zone.dispatcher.stop()
 
     # TODO write certain values back out to the config file
-    timer.cancel()
+    if recorder:
+        recorder.close()
+    tag_reader.stop()
     print("\x1b[2J\x1b[H\x1b[?25h", end="")
+    save_session()
+    write_stats()
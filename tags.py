@@ -0,0 +1,140 @@
+# artist/title/duration of the files in the list for the tag columns. read by a pool of worker threads,
+# rows on screen first and the rest of the folder after, and cached by (path, mtime, size) in tags.json
+# so a file is only parsed again when it changes. needs mutagen. without it the list just shows file names
+import json
+import os
+import queue
+import threading
+
+from utils import DEBUG, ERROR, WARNING, log, timed
+
+
+def first_tag(tags, *keys) -> str:
+    """value of the first of keys that's in tags. easy tags are lists of strings, id3 frames have them in .text"""
+    for key in keys:
+        value = tags.get(key)
+        if value:
+            return ", ".join(str(v) for v in getattr(value, "text", value))
+    return ""
+
+
+class TagReader():
+    """want() queues paths, results fills in as the workers get to them. nothing here ever blocks the caller"""
+    def __init__(self, cache_file: str, workers: int = 4, notify_delay: float = 0.03):
+        self.cache_file = cache_file
+        self.workers = workers
+        self.notify_delay = notify_delay  # results arriving this close together cause one on_result call
+        self.results: dict = {}  # path: (artist, title, seconds). what the list is drawn from
+        self.cache: dict = {}  # path: [mtime, size, artist, title, seconds]. read from and written to cache_file
+        self.dirty: bool = False  # cache has entries that aren't in cache_file yet
+        self.jobs: queue.PriorityQueue = queue.PriorityQueue()  # (tier, index, generation, path). tier 0 is on screen
+        self.generation: int = 0  # bumped every time the list changes. jobs queued for an older list are dropped
+        self.queued: set = set()  # on screen paths waiting in jobs
+        self.on_result = None  # called from a worker once rows that were on screen have their tags
+        self.notify_pending: bool = False  # an on_result call is already on its way
+        self.started: bool = False
+        self.stopped: bool = False
+        self.mutagen = None
+
+    def start(self) -> None:
+        """import mutagen, read the cache and start the workers. slow so it's run on its own thread"""
+        try:
+            import mutagen
+        except ImportError:
+            log("tag columns need mutagen. pip install mutagen", WARNING)
+            return
+        self.mutagen = mutagen
+        try:
+            with open(self.cache_file, "r") as f:
+                self.cache = json.load(f)
+        except (OSError, ValueError):
+            self.cache = {}
+        for _ in range(self.workers):
+            threading.Thread(target=self._work, name="synthia-tags", daemon=True).start()
+        self.started = True
+
+    def stop(self) -> None:
+        self.stopped = True
+        self.on_result = None
+        for _ in range(self.workers):
+            self.jobs.put((-1, 0, 0, None))
+
+    def want(self, visible: list, rest: callable = None) -> None:
+        """queue the on screen paths in visible ahead of everything else.
+        rest gives the paths of the whole list when it has changed. it replaces whatever was queued for the old one.
+        it's called on a worker since a big folder takes a while to queue"""
+        if rest is not None:
+            self.generation += 1
+            self.queued = set()
+            self.jobs.put((1, -1, self.generation, rest))
+        for i, path in enumerate(visible):
+            if path not in self.results and path not in self.queued:
+                self.queued.add(path)
+                self.jobs.put((0, i, self.generation, path))
+
+    def _work(self) -> None:
+        while True:
+            tier, _, generation, path = self.jobs.get()
+            if path is None:
+                return
+            if callable(path):  # the rest of the list. behind everything on screen
+                if generation == self.generation:
+                    for i, p in enumerate(path()):
+                        if p not in self.results:
+                            self.jobs.put((1, i, generation, p))
+                continue
+            if generation == self.generation and path not in self.results:
+                self.results[path] = self.read(path)
+                if tier == 0:
+                    self._notify()
+            if tier == 0:
+                self.queued.discard(path)
+
+    def _notify(self) -> None:
+        if not self.notify_pending:
+            self.notify_pending = True
+            timer = threading.Timer(self.notify_delay, self._fire)
+            timer.daemon = True
+            timer.start()
+
+    def _fire(self) -> None:
+        self.notify_pending = False  # NOTE before drawing so results that arrive during the draw get another one
+        if self.on_result and not self.stopped:
+            self.on_result()
+
+    @timed("read_tags")
+    def read(self, path: str) -> tuple:
+        """(artist, title, seconds) from the cache if the file hasn't changed, otherwise parsed by mutagen"""
+        try:
+            st = os.stat(path)
+        except OSError:
+            return ("", "", 0)
+        hit = self.cache.get(path)
+        if hit and hit[0] == st.st_mtime and hit[1] == st.st_size:
+            return tuple(hit[2:])
+        artist, title, seconds = "", "", 0
+        try:
+            f = self.mutagen.File(path, easy=True)
+            if f is not None:
+                tags = f.tags or {}
+                artist = first_tag(tags, "artist", "TPE1")  # NOTE wav and aiff only come with raw id3 frames
+                title = first_tag(tags, "title", "TIT2")
+                seconds = int(getattr(f.info, "length", 0) or 0)
+        except Exception as e:  # NOTE mutagen raises all sorts of things on broken files. cache them as untagged
+            log(f"can't read tags of {path}: {e}", DEBUG)
+        self.cache[path] = [st.st_mtime, st.st_size, artist, title, seconds]
+        self.dirty = True
+        return (artist, title, seconds)
+
+    def save(self) -> None:
+        """write the cache out if anything was added to it"""
+        if not self.dirty:
+            return
+        self.dirty = False
+        try:
+            with open(self.cache_file + ".tmp", "w") as f:
+                json.dump(dict(self.cache), f, separators=(",", ":"))  # NOTE copy. workers keep adding to it
+            os.replace(self.cache_file + ".tmp", self.cache_file)
+        except OSError as e:
+            self.dirty = True
+            log(f"couldn't save tag cache: {e}", ERROR)
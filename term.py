@@ -0,0 +1,206 @@
+"""Terminal input. raw(ish) mode, bulk reads and escape sequence parsing"""
+import asyncio
+import codecs
+from contextlib import contextmanager
+import json
+import os
+import selectors
+import termios
+import time
+import tty
+
+
+# https://en.wikipedia.org/wiki/ANSI_escape_code
+# I don't know if this holds across all computers/keyboards or if my setup just weird?
+esc_chars = {"[A": "up", "[B": "dn", "[C": "rt", "[D": "lf", "[F": "end", "[H": "home", "[[A": "F1",
+             "[[B": "F2", "[[C": "F3", "OS": "F4", "[Z": "shft+tb", "[5~": "pgup", "[6~": "pgdn",  # "OR": "F3"
+             "[15~": "F5", "[17~": "F6", "[18~": "F7", "[19~": "F8", "[20~": "F9", "[21~": "F10",
+             "[23~": "F11", "[24~": "F12"}  # TODO fix more F keys
+
+
+@contextmanager
+def cbreak(stream):
+    """put the terminal in cbreak mode (no echo, no line buffering) once for the whole session
+    instead of toggling it around every single byte read"""
+    fd = stream.fileno()
+    old_settings = termios.tcgetattr(fd)
+    tty.setcbreak(fd, termios.TCSANOW)
+    try:
+        yield
+    finally:
+        termios.tcsetattr(fd, termios.TCSADRAIN, old_settings)
+
+
+class KeyParser():
+    """prefix trie of escape sequences. feed() it text as it arrives and it hands back complete keys.
+    partial sequences are kept until the next feed() or until flush() is called after a timeout.
+    plain characters are returned as is, unknown sequences are dropped"""
+    # NOTE leaf nodes store the key name under None since no real char can be None
+    def __init__(self, sequences: dict = esc_chars, esc_timeout: float = 0.05):
+        self.trie: dict = {}
+        for seq, name in sequences.items():
+            node = self.trie
+            for c in "\x1b" + seq:
+                node = node.setdefault(c, {})
+            node[None] = name
+        self.pending: str = ""  # chars of an escape sequence that isn't finished yet
+        self.node: dict = self.trie
+        self.skip_csi: bool = False  # eating the rest of an unknown CSI sequence
+        self.skip_until: float = 0.0  # bytes after this aren't the rest of it. they're new keys
+        self.esc_timeout = esc_timeout
+
+    def feed(self, text: str) -> list:
+        keys = []
+        if self.skip_csi and time.monotonic() > self.skip_until:  # too late to be the rest of the sequence
+            self.skip_csi = False
+        for c in text:
+            if self.skip_csi:
+                if c == "\x1b" or not " " <= c <= "~":  # can't be part of a CSI sequence. a new key
+                    self.skip_csi = False
+                else:
+                    if "@" <= c <= "~":  # final byte of a CSI sequence
+                        self.skip_csi = False
+                    continue
+            if self.pending:
+                if c in self.node:
+                    self.pending += c
+                    self.node = self.node[c]
+                    if len(self.node) == 1 and None in self.node:  # nothing longer can match
+                        keys.append(self.node[None])
+                        self._reset()
+                    continue
+                # sequence can't be continued with this char
+                if None in self.node:  # longest match so far is a key. c starts something new
+                    keys.append(self.node[None])
+                    self._reset()
+                else:  # unknown sequence. c is part of it and goes with it
+                    if self.pending == "\x1b":
+                        keys.append("alt+esc" if c == "\x1b" else f"alt+{c}")  # NOTE or esc and a key pressed quickly. never a bare esc that quits
+                    elif self.pending.startswith("\x1b[") and not "@" <= c <= "~":
+                        self._skip()  # unknown CSI sequence like ctrl+arrow. drop all of it
+                    self._reset()
+                    continue
+            if c == "\x1b":
+                self.pending = c
+                self.node = self.trie[c]
+            else:
+                keys.append(c)
+        return keys
+
+    def flush(self) -> list:
+        """no more bytes arrived in time so whatever is pending is as complete as it will get.
+        incomplete sequences are dropped. so is the rest of a CSI sequence if it turns up late,
+        as long as it turns up within esc_timeout"""
+        keys = []
+        self.skip_csi = False  # NOTE the rest of an earlier sequence would have turned up by now
+        if None in self.node and self.pending:
+            keys.append(self.node[None])
+        elif self.pending == "\x1b":
+            keys.append("esc")
+        elif self.pending.startswith("\x1b["):
+            self._skip()
+        self._reset()
+        return keys
+
+    def _skip(self) -> None:
+        self.skip_csi = True
+        self.skip_until = time.monotonic() + self.esc_timeout
+
+    def _reset(self) -> None:
+        self.pending = ""
+        self.node = self.trie
+
+
+class KeyReader():
+    """read stdin in bulk through a selector and turn the bytes into key names"""
+    def __init__(self, stream, esc_timeout: float = 0.05):
+        self.fd: int = stream.fileno()
+        self.esc_timeout = esc_timeout  # how long to wait for the rest of a split escape sequence
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(self.fd, selectors.EVENT_READ)
+        self.decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self.parser = KeyParser(esc_timeout=esc_timeout)
+
+    def read(self, timeout: float = None) -> list:
+        """block until at least one key is available (or timeout) and return every key read.
+        holding down a key gives back the whole burst of repeats at once"""
+        keys: list = []
+        while not keys:
+            wait = self.esc_timeout if self.parser.pending else timeout
+            if not self.selector.select(wait):
+                keys = self.parser.flush()
+                if timeout is not None:
+                    break
+                continue
+            data = os.read(self.fd, 4096)
+            if not data:  # EOF
+                raise EOFError
+            keys = self.parser.feed(self.decoder.decode(data))
+        return keys
+
+    def close(self) -> None:
+        self.selector.close()
+
+
+class AsyncKeyReader():
+    """asyncio version of KeyReader. stdin is watched by the event loop instead of a selector"""
+    def __init__(self, stream, esc_timeout: float = 0.05):
+        self.fd: int = stream.fileno()
+        self.esc_timeout = esc_timeout
+        self.decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self.parser = KeyParser(esc_timeout=esc_timeout)
+        self.keys: asyncio.Queue = asyncio.Queue()
+        self.flush_handle = None
+        self.loop = asyncio.get_running_loop()
+        self.loop.add_reader(self.fd, self._on_readable)
+
+    def _on_readable(self) -> None:
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+        data = os.read(self.fd, 4096)
+        if not data:  # EOF
+            self.loop.remove_reader(self.fd)
+            self.keys.put_nowait([EOFError])
+            return
+        self._put(self.parser.feed(self.decoder.decode(data)))
+        if self.parser.pending:  # wait a bit for the rest of the escape sequence
+            self.flush_handle = self.loop.call_later(self.esc_timeout, self._flush)
+
+    def _flush(self) -> None:
+        self.flush_handle = None
+        self._put(self.parser.flush())
+
+    def _put(self, keys: list) -> None:
+        if keys:
+            self.keys.put_nowait(keys)
+
+    async def read(self) -> list:
+        """wait for keys and return every key that has arrived so far"""
+        keys = list(await self.keys.get())
+        while not self.keys.empty():
+            keys.extend(self.keys.get_nowait())
+        if EOFError in keys:
+            raise EOFError
+        return keys
+
+    def close(self) -> None:
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+        self.loop.remove_reader(self.fd)
+
+
+class KeyRecorder():
+    """synthia --record. writes every batch of keys read to a file with the time it arrived, one json list per line.
+    the first line is a header with what's needed to start a replay in the same state. see benchmarks/replay.py"""
+    def __init__(self, path: str, header: dict):
+        self.file = open(path, "w")
+        self.start = time.perf_counter()
+        self.file.write(json.dumps(header) + "\n")
+
+    def record(self, keys: list) -> None:
+        """NOTE batches are kept as read so a replay coalesces them the same way"""
+        self.file.write(json.dumps([round(time.perf_counter() - self.start, 4), keys]) + "\n")
+
+    def close(self) -> None:
+        self.file.close()
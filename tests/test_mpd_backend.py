@@ -0,0 +1,73 @@
+import asyncio
+
+import pytest
+
+from backends.base import queue_mirror
+from backends.mpd import mpd_async_backend, mpd_backend
+
+
+@pytest.fixture
+def backend(mpd_server, music) -> mpd_backend:
+    backend = mpd_backend()
+    backend.settings = {"address": mpd_server.address, "port": mpd_server.port, "music_directory": music}
+    return backend
+
+
+def queued(server) -> list:
+    """file of every song in the server's queue"""
+    return server.call(lambda: [song["file"] for song in server.mpd.queue])
+
+
+def test_enqueue_many(backend, mpd_server, music):
+    backend.enqueue_many([f"{music}album/{i:02d} song.mp3" for i in range(3)])
+    assert queued(mpd_server) == [f"album/{i:02d} song.mp3" for i in range(3)]
+
+
+def test_enqueue_many_file_fallback(backend, mpd_server, music, tmp_path):
+    new = f"{music}album/new song.mp3"  # not in the database until the next update
+    outside = f"{tmp_path}/outside.mp3"
+    open(new, "w").close()
+    open(outside, "w").close()
+    backend.enqueue_many([f"{music}album/00 song.mp3", new, f"{music}album/missing.mp3", outside,
+                          f"{music}album/01 song.mp3"])
+    assert queued(mpd_server) == ["album/00 song.mp3", "album/new song.mp3", outside, "album/01 song.mp3"]
+
+
+def test_async_enqueue_many_file_fallback(mpd_server, music, tmp_path):
+    new = f"{music}album/new song.mp3"
+    outside = f"{tmp_path}/outside.mp3"
+    open(new, "w").close()
+    open(outside, "w").close()
+
+    async def run():
+        backend = mpd_async_backend()
+        backend.settings = {"address": mpd_server.address, "port": mpd_server.port, "music_directory": music}
+        backend.batch_size = 2  # fallbacks in the middle of a batch and at the end of one
+        await backend.connect()
+        await backend.enqueue_many([f"{music}album/00 song.mp3", new, f"{music}album/missing.mp3", outside,
+                                    f"{music}album/01 song.mp3"])
+        await backend.disconnect()
+    asyncio.run(run())
+    assert queued(mpd_server) == ["album/00 song.mp3", "album/new song.mp3", outside, "album/01 song.mp3"]
+
+
+def test_delete_range(backend, mpd_server, music):
+    backend.enqueue_many([f"{music}album/{i:02d} song.mp3" for i in range(6)])
+    backend.delete_range(1, 4)
+    assert queued(mpd_server) == ["album/00 song.mp3", "album/04 song.mp3", "album/05 song.mp3"]
+
+
+def test_sync_queue(backend, mpd_server, music):
+    backend.enqueue_many([f"{music}album/{i:02d} song.mp3" for i in range(6)])
+    mirror = queue_mirror()
+    assert backend.sync_queue(mirror, backend.sync()["QueueVersion"], 0, 2)
+    assert len(mirror.ids) == 6
+    assert [mirror.info[i]["file"] for i in mirror.ids[:2]] == ["album/00 song.mp3", "album/01 song.mp3"]
+    assert not mirror.missing(0, 2) and mirror.missing(2, 6)
+
+    version = backend.sync()["QueueVersion"]
+    assert not backend.sync_queue(mirror, version, 0, 2)  # nothing changed. nothing sent
+
+    backend.delete_range(0, 1)
+    backend.sync_queue(mirror, backend.sync()["QueueVersion"], 0, 6)
+    assert [mirror.info[i]["file"] for i in mirror.ids] == [f"album/{i:02d} song.mp3" for i in range(1, 6)]
@@ -0,0 +1,25 @@
+import json
+import os
+import subprocess
+import sys
+
+here = os.path.dirname(os.path.abspath(__file__))
+
+
+def replay(keys: str, music: str, tmp_path) -> list:
+    """final screen of benchmarks/replay.py playing back tests/replay/keys against the stand-in mpd server.
+    in a process of its own since synthia reads its config and starts its zones on import"""
+    out = f"{tmp_path}/report.json"
+    subprocess.run([sys.executable, "-m", "benchmarks.replay", f"{here}/replay/{keys}", "--library", music,
+                    "--out", out, "--quiet"], cwd=os.path.dirname(here), check=True, capture_output=True, timeout=120)
+    with open(out) as f:
+        return json.load(f)["screen"]
+
+
+def test_marker_follows_song(music, tmp_path):
+    """plays 00 then waits long enough for two songs to finish. > has to be on 02 without a key press in between"""
+    screen = replay("marker.jsonl", music, tmp_path)
+    with open(f"{here}/replay/marker.txt") as f:
+        expected = f.read().splitlines()
+    assert screen[0].startswith(f"┌─┤SYNTHIA├{'─' * 10}┤{music}album/├")  # NOTE the rest depends on where music is
+    assert screen[1:] == expected
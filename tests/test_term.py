@@ -0,0 +1,60 @@
+import term
+
+
+def late(monkeypatch, seconds: float) -> None:
+    """move the parser's clock on by seconds"""
+    now = term.time.monotonic() + seconds
+    monkeypatch.setattr(term.time, "monotonic", lambda: now)
+
+
+def test_keys_and_sequences():
+    parser = term.KeyParser()
+    assert parser.feed("q\x1b[A\x1b[15~j") == ["q", "up", "F5", "j"]
+
+
+def test_split_sequence():
+    parser = term.KeyParser()
+    assert parser.feed("\x1b[") == []
+    assert parser.feed("B") == ["dn"]
+
+
+def test_esc_on_its_own():
+    parser = term.KeyParser()
+    assert parser.feed("\x1b") == []
+    assert parser.flush() == ["esc"]
+
+
+def test_unknown_sequence_dropped():
+    parser = term.KeyParser()
+    assert parser.feed("\x1b[1;5Aq") == ["q"]  # ctrl+up
+
+
+def test_late_rest_of_sequence_dropped():
+    parser = term.KeyParser()
+    assert parser.feed("\x1b[1") == []
+    assert parser.flush() == []
+    assert parser.feed(";5Aq") == ["q"]
+
+
+def test_keys_after_timeout_kept(monkeypatch):
+    parser = term.KeyParser()
+    assert parser.feed("\x1b[1") == []
+    assert parser.flush() == []
+    late(monkeypatch, 1)
+    assert parser.feed(" ") == [" "]
+    assert parser.feed("\x1b[A") == ["up"]
+
+
+def test_esc_ends_skip():
+    parser = term.KeyParser()
+    parser.feed("\x1b[1")
+    parser.flush()
+    assert parser.feed("\x1b[A,") == ["up", ","]
+
+
+def test_next_flush_ends_skip():
+    parser = term.KeyParser()
+    parser.feed("\x1b[1")
+    parser.flush()
+    parser.flush()
+    assert parser.feed("5q") == ["5", "q"]
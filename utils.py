@@ -1,23 +1,254 @@
 """Utility functions etc."""
+import atexit
+import collections
+from contextlib import contextmanager
+import functools
+import json
+import math
 import os
+import threading
 import time
 
 
 home_dir = os.path.expanduser("~") + "/"
 
 
-def log(i):
-    """Logging function"""
-    with open(f"{home_dir}synthia/test.log", "a") as f:
-        f.write(f"{time.asctime()}: {str(i)}\n")
+# log levels. anything below log_level is dropped before it is even formatted
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+OFF = 100
+level_names: dict = {"debug": DEBUG, "info": INFO, "warning": WARNING, "error": ERROR, "off": OFF}
+
+log_level: int = INFO
+log_file: str = f"{home_dir}synthia/test.log"
+log_max_bytes: int = 1024 * 1024  # rotate to test.log.1 when the file gets bigger than this
+log_backups: int = 2  # test.log.1 ... test.log.n
+log_interval: float = 0.5  # seconds between batched writes
+log_queue: collections.deque = collections.deque(maxlen=10000)  # append/popleft are atomic so no lock. oldest dropped when full
+log_wake = threading.Event()  # errors get written straight away instead of waiting for the next batch
+log_thread = None
+log_write_lock = threading.Lock()  # only the writer thread, flush at exit and start_logging ever wait on this
+
+
+def log(i, level: int = INFO):
+    """Logging function. queues the message for the writer thread and returns.
+    i is only turned into a string on the writer thread so log(big_dict, DEBUG) costs nothing when debug is off
+    NOTE so don't log something that is about to be changed in place"""
+    if level < log_level:
+        return
+    log_queue.append((time.time(), level, i))
+    if log_thread is None:
+        start_logging()
+    if level >= ERROR:
+        log_wake.set()
+
+
+def start_logging(level: str = None, file: str = None, max_bytes: int = None) -> None:
+    """set log options and start the writer thread. log() starts it with the defaults if this wasn't called"""
+    global log_level, log_file, log_max_bytes, log_thread
+    if level is not None:
+        log_level = level_names.get(level, INFO)
+    if file is not None:
+        log_file = file
+    if max_bytes is not None:
+        log_max_bytes = max_bytes
+    with log_write_lock:  # two threads logging for the first time at once
+        if log_thread is None:
+            log_thread = threading.Thread(target=log_writer, name="log-writer", daemon=True)
+            log_thread.start()
+            atexit.register(flush_log)
+
+
+def log_writer() -> None:
+    while True:
+        log_wake.wait(log_interval)
+        log_wake.clear()
+        flush_log()
+
+
+def flush_log() -> None:
+    """write out everything queued so far in one go and rotate the file if it got too big"""
+    with log_write_lock:
+        lines = []
+        while log_queue:
+            t, level, i = log_queue.popleft()
+            prefix = "" if level == INFO else f"{logging_name(level)}: "
+            lines.append(f"{time.asctime(time.localtime(t))}: {prefix}{str(i)}\n")
+        if not lines:
+            return
+        try:
+            with open(log_file, "a") as f:
+                f.write("".join(lines))
+                size = f.tell()
+            if size > log_max_bytes:
+                rotate_log()
+        except OSError:
+            pass  # nowhere to log that logging failed
+
+
+def logging_name(level: int) -> str:
+    return next((k.upper() for k, v in level_names.items() if v == level), str(level))
+
+
+def rotate_log() -> None:
+    for n in range(log_backups - 1, 0, -1):
+        if os.path.exists(f"{log_file}.{n}"):
+            os.replace(f"{log_file}.{n}", f"{log_file}.{n + 1}")
+    os.replace(log_file, f"{log_file}.1")
 
 
 def tryit(func):
-    """try except decorator @"""
+    """try except decorator @
+    connection errors are let through so the dispatcher can retry them"""
+    @functools.wraps(func)
     def inner(*args, **kwargs):
         try:
             return func(*args, **kwargs)
+        except ConnectionError:
+            raise
+        except Exception as e:
+            log(f"tryit '{func.__name__}' error: {e}", ERROR)
+    return inner
+
+
+def tryit_async(func):
+    """tryit for coroutines"""
+    @functools.wraps(func)
+    async def inner(*args, **kwargs):
+        try:
+            return await func(*args, **kwargs)
+        except ConnectionError:
+            raise
         except Exception as e:
-            log(f"tryit '{func.__name__}' error:")
-            log(e)
+            log(f"tryit '{func.__name__}' error: {e}", ERROR)
     return inner
+
+
+# opt-in instrumentation. everything below is a no-op (one bool check) unless stats_enabled is set
+stats_enabled: bool = False
+stats_lock = threading.Lock()
+histograms: dict = {}  # name: Histogram
+counters: dict = {}  # name: int
+
+
+class Histogram():
+    """latencies in power of 2 buckets starting at 1µs. percentiles are the upper edge of the bucket they fall in"""
+    def __init__(self):
+        self.buckets: list = [0] * 40
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds: float) -> None:
+        self.buckets[min(max(math.frexp(seconds * 1e6)[1], 0), 39)] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def percentile(self, p: float) -> float:
+        target = p * self.count
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if n and seen >= target:
+                return min(2 ** i / 1e6, self.max)
+        return self.max
+
+    def summary(self) -> dict:
+        return {"count": self.count, "mean": self.total / self.count if self.count else 0.0,
+                "p50": self.percentile(0.5), "p99": self.percentile(0.99), "max": self.max}
+
+
+def record(name: str, seconds: float) -> None:
+    with stats_lock:
+        if name not in histograms:
+            histograms[name] = Histogram()
+        histograms[name].add(seconds)
+
+
+def count(name: str, n: int = 1) -> None:
+    if stats_enabled:
+        with stats_lock:
+            counters[name] = counters.get(name, 0) + n
+
+
+@contextmanager
+def timer(name: str):
+    """with timer("name"): ... records how long the block took"""
+    if not stats_enabled:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - start)
+
+
+CO_COROUTINE = 0x80  # inspect.CO_COROUTINE. inspect itself is too slow to import at startup
+
+
+def timed(name: str = None):
+    """latency histogram decorator @timed() or @timed("name"). works on coroutines too"""
+    def decorator(func):
+        label = name or func.__name__
+        if func.__code__.co_flags & CO_COROUTINE:
+            @functools.wraps(func)
+            async def async_inner(*args, **kwargs):
+                if not stats_enabled:
+                    return await func(*args, **kwargs)
+                start = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    record(label, time.perf_counter() - start)
+            return async_inner
+
+        @functools.wraps(func)
+        def inner(*args, **kwargs):
+            if not stats_enabled:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                record(label, time.perf_counter() - start)
+        return inner
+    return decorator
+
+
+def instrument(cls, prefix: str, names: list) -> None:
+    """wrap the methods in names on cls with @timed(prefix + name)"""
+    for n in names:
+        if n in cls.__dict__:
+            func = cls.__dict__[n]
+            if isinstance(func, classmethod):
+                setattr(cls, n, classmethod(timed(prefix + n)(func.__func__)))
+            else:
+                setattr(cls, n, timed(prefix + n)(func))
+
+
+class CountingStream():
+    """wraps stdout and counts the bytes written to the terminal"""
+    def __init__(self, stream):
+        self.stream = stream
+
+    def write(self, s: str) -> int:
+        count("terminal_bytes", len(s.encode()))
+        return self.stream.write(s)
+
+    def __getattr__(self, attr):
+        return getattr(self.stream, attr)
+
+
+def stats_snapshot() -> dict:
+    with stats_lock:
+        return {"time": time.time(), "histograms": {k: h.summary() for k, h in sorted(histograms.items())},
+                "counters": dict(counters)}
+
+
+def dump_stats(path: str) -> None:
+    with open(path, "w") as f:
+        json.dump(stats_snapshot(), f, indent=2)